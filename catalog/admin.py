@@ -1,8 +1,29 @@
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
 
 # Register your models here.
 
-from .models import Author, Genre, Book, BookInstance, Language
+from .changefeed import update_copies
+from .forms import BookForm, BookInstanceAdminForm
+from .models import (
+    ArchivedBookInstance,
+    Author,
+    Genre,
+    Book,
+    BookInstance,
+    Branch,
+    ConcurrentUpdateError,
+    Fine,
+    FineBalance,
+    FineRate,
+    Language,
+    Patron,
+    ProfileReport,
+)
 
 """Minimal registration of Models.
 admin.site.register(Book)
@@ -14,6 +35,75 @@ admin.site.register(Language)
 
 admin.site.register(Genre)
 admin.site.register(Language)
+admin.site.register(Branch)
+
+
+@admin.register(Patron)
+class PatronAdmin(admin.ModelAdmin):
+    """Administration object for Patron models.
+    Defines:
+     - fields to be displayed in list view (list_display)
+     - filters that will be displayed in sidebar (list_filter)
+    """
+
+    list_display = ("user", "branch")
+    list_filter = ("branch",)
+
+
+@admin.register(FineRate)
+class FineRateAdmin(admin.ModelAdmin):
+    """Administration object for FineRate models.
+    Defines:
+     - fields to be displayed in list view (list_display)
+    """
+
+    list_display = ("__str__", "genre", "language", "daily_rate", "maximum")
+
+
+@admin.register(Fine)
+class FineAdmin(admin.ModelAdmin):
+    """Administration object for Fine models.
+    Defines:
+     - fields to be displayed in list view (list_display)
+     - filters that will be displayed in sidebar (list_filter)
+     - only ``paid`` is editable; amounts come from assess_fines
+    """
+
+    list_display = ("borrower", "book", "due_back", "days_overdue", "amount", "paid")
+    list_filter = ("assessed",)
+    search_fields = ("borrower__username",)
+    list_select_related = ("borrower", "book")
+    readonly_fields = (
+        "borrower",
+        "copy_id",
+        "book",
+        "due_back",
+        "days_overdue",
+        "amount",
+        "assessed",
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(FineBalance)
+class FineBalanceAdmin(admin.ModelAdmin):
+    """Administration object for FineBalance models.
+    Defines:
+     - fields to be displayed in list view (list_display)
+     - read-only access, since balances are totals of the Fine rows
+    """
+
+    list_display = ("borrower", "balance", "updated")
+    search_fields = ("borrower__username",)
+    list_select_related = ("borrower",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 class BooksInline(admin.TabularInline):
@@ -38,38 +128,151 @@ class AuthorAdmin(admin.ModelAdmin):
     inlines = [BooksInline]
 
 
+class CopyConflictMixin:
+    """Shows the form again, with the conflict error from
+    BookInstanceAdminForm.clean(), when a copy is saved by someone else between
+    the form's version check and the save."""
+
+    def changeform_view(self, request, object_id=None, form_url="", extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except ConcurrentUpdateError:
+            # The admin's transaction has been rolled back by now, so this
+            # validates the form again against the other change.
+            return super().changeform_view(request, object_id, form_url, extra_context)
+
+
 class BooksInstanceInline(admin.TabularInline):
     """Defines format of inline book instance insertion (used in BookAdmin)"""
 
     model = BookInstance
+    form = BookInstanceAdminForm
     extra = 0
 
 
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
+class BookAdmin(CopyConflictMixin, admin.ModelAdmin):
     """Administration object for Book models.
     Defines:
      - fields to be displayed in list view (list_display)
      - adds inline addition of book instances in book view (inlines)
+     - form reading genre/language choices from the reference data cache (form)
+     - copy forms refusing to save over concurrent changes (CopyConflictMixin)
     """
 
+    form = BookForm
     list_display = ("title", "author", "display_genre")
     inlines = [BooksInstanceInline]
 
 
 @admin.register(BookInstance)
-class BookInstanceAdmin(admin.ModelAdmin):
+class BookInstanceAdmin(CopyConflictMixin, admin.ModelAdmin):
     """Administration object for BookInstance models.
     Defines:
      - fields to be displayed in list view (list_display)
      - filters that will be displayed in sidebar (list_filter)
      - grouping of fields into sections (fieldsets)
+     - an action to withdraw copies, for the archive_catalog command (actions)
+     - form refusing to save over concurrent changes (form, CopyConflictMixin)
     """
 
-    list_display = ("book", "status", "borrower", "due_back", "id")
-    list_filter = ("status", "due_back")
+    form = BookInstanceAdminForm
+
+    list_display = ("book", "status", "borrower", "due_back", "branch", "id")
+    list_filter = ("status", "due_back", "branch")
+    actions = ["mark_withdrawn"]
 
     fieldsets = (
-        (None, {"fields": ("book", "imprint", "id")}),
+        (None, {"fields": ("book", "imprint", "branch", "id", "loaded_version")}),
         ("Availability", {"fields": ("status", "due_back", "borrower")}),
     )
+
+    @admin.action(description="Mark selected copies as withdrawn")
+    def mark_withdrawn(self, request, queryset):
+        updated = update_copies(queryset, status="w", borrower=None, due_back=None)
+        self.message_user(request, f"{updated} copies withdrawn.")
+
+
+@admin.register(ArchivedBookInstance)
+class ArchivedBookInstanceAdmin(admin.ModelAdmin):
+    """Administration object for ArchivedBookInstance models.
+    Defines:
+     - fields to be displayed in list view (list_display)
+     - filters that will be displayed in sidebar (list_filter)
+     - read-only access, since rows are only created by archive_catalog
+    """
+
+    list_display = ("title", "imprint", "branch", "status", "archived", "id")
+    list_filter = ("archived", "branch")
+    search_fields = ("title", "imprint")
+    list_select_related = ("branch",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ProfileReport)
+class ProfileReportAdmin(admin.ModelAdmin):
+    """Administration object for ProfileReport models.
+    Defines:
+     - fields to be displayed in list view (list_display)
+     - read-only detail view, since reports are only created by the profiler
+     - a plain text download of the collapsed stacks for flame graph tools
+    """
+
+    list_display = ("created", "method", "path", "status_code", "duration_ms", "user")
+    list_filter = ("created",)
+    search_fields = ("path",)
+    readonly_fields = (
+        "id",
+        "created",
+        "user",
+        "method",
+        "path",
+        "status_code",
+        "duration_ms",
+        "samples",
+        "collapsed_stacks_link",
+        "function_stats_text",
+        "top_allocations_text",
+    )
+    exclude = ("collapsed_stacks", "function_stats", "top_allocations")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                "<uuid:pk>/collapsed/",
+                self.admin_site.admin_view(self.collapsed_stacks_view),
+                name="catalog_profilereport_collapsed",
+            )
+        ] + super().get_urls()
+
+    def collapsed_stacks_view(self, request, pk):
+        report = get_object_or_404(ProfileReport, pk=pk)
+        if not self.has_view_permission(request, report):
+            raise PermissionDenied
+        response = HttpResponse(report.collapsed_stacks, content_type="text/plain")
+        response["Content-Disposition"] = f'attachment; filename="{pk}.collapsed"'
+        return response
+
+    @admin.display(description="Collapsed stacks")
+    def collapsed_stacks_link(self, obj):
+        url = reverse("admin:catalog_profilereport_collapsed", args=[obj.pk])
+        return format_html('<a href="{}">Download ({} samples)</a>', url, obj.samples)
+
+    @admin.display(description="Function stats")
+    def function_stats_text(self, obj):
+        return format_html("<pre>{}</pre>", obj.function_stats)
+
+    @admin.display(description="Top allocations")
+    def top_allocations_text(self, obj):
+        return format_html("<pre>{}</pre>", obj.top_allocations)
@@ -0,0 +1,390 @@
+"""Read-only JSON API for the catalog.
+
+Endpoints::
+
+    /catalog/api/<resource>/        list, cursor paginated
+    /catalog/api/<resource>/<pk>/   single object
+
+where ``<resource>`` is one of ``books``, ``authors``, ``genres``, ``languages``,
+``branches`` or ``copies`` (BookInstance availability, without borrower
+details).
+
+Query parameters:
+
+- ``fields=title,isbn``: sparse fieldset. Only these columns are selected.
+- ``include=author,genre``: replace related ids with the related objects.
+  Each relation is resolved with one extra query for the whole page.
+- ``cursor=...``/``limit=N``: keyset pagination on the primary key. Use the
+  ``next`` URL from the previous response.
+
+``/catalog/api/availability/`` answers copy availability for many ISBNs at
+once, see :func:`availability`. ``/catalog/api/suggest/?q=...`` returns
+search-as-you-type suggestions, see :func:`suggestions`.
+
+Rows are serialized straight from ``QuerySet.values()`` dictionaries, so no
+model instances are built on this path.
+"""
+
+import base64
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Min
+from django.http import Http404, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_http_methods
+
+from . import metrics, suggest
+from .models import Author, Book, BookInstance, Branch, Genre, Language
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_ISBNS = 500
+DEFAULT_SUGGESTIONS = 10
+MAX_SUGGESTIONS = 50
+
+
+class ApiError(Exception):
+    """Raised for invalid query parameters; rendered as a 400 response."""
+
+
+class ForeignKey:
+    """Include the object referenced by a foreign key column."""
+
+    def __init__(self, resource):
+        self.resource = resource
+
+    def required_fields(self, name):
+        return [name]
+
+    def resolve(self, name, rows):
+        ids = {row[name] for row in rows if row[name] is not None}
+        related = RESOURCES[self.resource].values_by_pk(ids)
+        for row in rows:
+            row[name] = related.get(row[name])
+
+
+class ManyToMany:
+    """Include the objects of a many-to-many relation."""
+
+    def __init__(self, resource, through, source, target):
+        self.resource = resource
+        self.through = through
+        self.source = source
+        self.target = target
+
+    def required_fields(self, name):
+        return []
+
+    def resolve(self, name, rows):
+        links = list(
+            self.through.objects.filter(
+                **{f"{self.source}__in": [row["id"] for row in rows]}
+            ).values_list(self.source, self.target)
+        )
+        related = RESOURCES[self.resource].values_by_pk({pk for _, pk in links})
+        grouped = {row["id"]: [] for row in rows}
+        for source_id, target_id in links:
+            grouped[source_id].append(related[target_id])
+        for row in rows:
+            row[name] = grouped[row["id"]]
+
+
+class Reverse:
+    """Include the objects that point at this one through a foreign key."""
+
+    def __init__(self, resource, field):
+        self.resource = resource
+        self.field = field
+
+    def required_fields(self, name):
+        return []
+
+    def resolve(self, name, rows):
+        resource = RESOURCES[self.resource]
+        fields = resource.fields
+        if self.field not in fields:
+            fields = fields + (self.field,)
+        related = resource.get_queryset().filter(
+            **{f"{self.field}__in": [row["id"] for row in rows]}
+        )
+        grouped = {row["id"]: [] for row in rows}
+        for item in related.values(*fields):
+            grouped[item[self.field]].append(item)
+        for row in rows:
+            row[name] = grouped[row["id"]]
+
+
+class Resource:
+    """Describes how one model is exposed through the API."""
+
+    def __init__(self, model, fields, includes=None, filters=None):
+        self.model = model
+        # "id" is always returned so that clients can address objects.
+        self.fields = fields
+        self.includes = includes or {}
+        # Maps query parameter names to queryset lookups.
+        self.filters = filters or {}
+
+    def get_queryset(self):
+        return self.model.objects.order_by()
+
+    def values_by_pk(self, pks):
+        if not pks:
+            return {}
+        return {
+            row["id"]: row
+            for row in self.get_queryset().filter(pk__in=pks).values(*self.fields)
+        }
+
+    def parse_list(self, params, name, allowed):
+        values = [value for value in params.get(name, "").split(",") if value]
+        unknown = [value for value in values if value not in allowed]
+        if unknown:
+            raise ApiError(f"Unknown {name}: {', '.join(unknown)}")
+        return values
+
+    def to_pk(self, value):
+        try:
+            return self.model._meta.pk.to_python(value)
+        except ValidationError:
+            raise ApiError(f"Invalid id: {value}")
+
+    def get_rows(self, queryset, params):
+        fields = self.parse_list(params, "fields", self.fields) or list(self.fields)
+        includes = self.parse_list(params, "include", self.includes)
+        columns = ["id"] + [field for field in fields if field != "id"]
+        for name in includes:
+            columns += [
+                field
+                for field in self.includes[name].required_fields(name)
+                if field not in columns
+            ]
+
+        rows = list(queryset.values(*columns))
+        for name in includes:
+            self.includes[name].resolve(name, rows)
+        return rows
+
+    def filter_queryset(self, queryset, params):
+        for param, lookup in self.filters.items():
+            if param in params:
+                try:
+                    queryset = queryset.filter(**{lookup: params[param]})
+                except (ValueError, ValidationError):
+                    raise ApiError(f"Invalid {param}: {params[param]}")
+        return queryset
+
+
+RESOURCES = {
+    "books": Resource(
+        Book,
+        fields=("id", "title", "author", "summary", "isbn", "language"),
+        includes={
+            "author": ForeignKey("authors"),
+            "language": ForeignKey("languages"),
+            "genre": ManyToMany("genres", Book.genre.through, "book_id", "genre_id"),
+            "copies": Reverse("copies", "book"),
+        },
+        filters={"author": "author_id", "language": "language_id"},
+    ),
+    "authors": Resource(
+        Author,
+        fields=("id", "first_name", "last_name", "date_of_birth", "date_of_death"),
+        includes={"books": Reverse("books", "author")},
+    ),
+    "genres": Resource(Genre, fields=("id", "name")),
+    "languages": Resource(Language, fields=("id", "name")),
+    "branches": Resource(Branch, fields=("id", "name", "address")),
+    "copies": Resource(
+        BookInstance,
+        fields=("id", "book", "branch", "imprint", "status", "due_back"),
+        includes={"book": ForeignKey("books"), "branch": ForeignKey("branches")},
+        filters={"book": "book_id", "branch": "branch_id", "status": "status"},
+    ),
+}
+
+
+def _get_resource(name):
+    try:
+        return RESOURCES[name]
+    except KeyError:
+        raise Http404(f"Unknown resource: {name}")
+
+
+def _encode_cursor(pk):
+    return base64.urlsafe_b64encode(str(pk).encode()).decode()
+
+
+def _decode_cursor(resource, cursor):
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode()).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise ApiError("Invalid cursor")
+    return resource.to_pk(value)
+
+
+def _get_limit(params):
+    limit = params.get("limit", str(DEFAULT_PAGE_SIZE))
+    if not limit.isdigit() or not 0 < int(limit) <= MAX_PAGE_SIZE:
+        raise ApiError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return int(limit)
+
+
+def _error(message):
+    return JsonResponse({"error": message}, status=400)
+
+
+@require_GET
+def resource_list(request, resource):
+    """List view for an API resource, with keyset (cursor) pagination."""
+    resource = _get_resource(resource)
+    params = request.GET
+    try:
+        limit = _get_limit(params)
+        queryset = resource.filter_queryset(resource.get_queryset(), params)
+        if "cursor" in params:
+            queryset = queryset.filter(
+                pk__gt=_decode_cursor(resource, params["cursor"])
+            )
+        # Fetch one extra row to find out whether there is a next page.
+        rows = resource.get_rows(queryset.order_by("pk")[: limit + 1], params)
+    except ApiError as error:
+        return _error(str(error))
+
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        query = params.copy()
+        query["cursor"] = _encode_cursor(rows[-1]["id"])
+        next_url = request.build_absolute_uri(f"{request.path}?{query.urlencode()}")
+    return JsonResponse({"results": rows, "next": next_url})
+
+
+@require_GET
+def resource_detail(request, resource, pk):
+    """Detail view for a single object of an API resource."""
+    resource = _get_resource(resource)
+    try:
+        queryset = resource.get_queryset().filter(pk=resource.to_pk(pk))
+        rows = resource.get_rows(queryset, request.GET)
+    except ApiError as error:
+        return _error(str(error))
+    if not rows:
+        raise Http404("No object found matching the query")
+    return JsonResponse(rows[0])
+
+
+def _availability_key(isbn):
+    return f"catalog:availability:{isbn}"
+
+
+def _get_isbns(request):
+    if request.method == "POST":
+        try:
+            isbns = json.loads(request.body)["isbns"]
+        except (ValueError, KeyError, TypeError):
+            raise ApiError('Expected a JSON body like {"isbns": [...]}')
+        if not isinstance(isbns, list):
+            raise ApiError("isbns must be a list")
+    else:
+        isbns = request.GET.get("isbn", "").split(",")
+    isbns = list(
+        dict.fromkeys(str(isbn).strip() for isbn in isbns if str(isbn).strip())
+    )
+    if not isbns:
+        raise ApiError("No ISBNs given")
+    if len(isbns) > MAX_ISBNS:
+        raise ApiError(f"At most {MAX_ISBNS} ISBNs can be checked at once")
+    return isbns
+
+
+def _lookup_availability(isbns):
+    """Return availability for ``isbns`` using a single grouped query.
+
+    The LEFT JOIN from Book keeps titles without any copies, and ISBNs that are
+    not in the catalog map to ``None``.
+    """
+    results = dict.fromkeys(isbns)
+    rows = (
+        Book.objects.filter(isbn__in=isbns)
+        .values("isbn", "id", "title", "bookinstance__status")
+        .annotate(
+            count=Count("bookinstance"), earliest_due_back=Min("bookinstance__due_back")
+        )
+        .order_by()
+    )
+    for row in rows:
+        entry = results[row["isbn"]]
+        if entry is None:
+            entry = results[row["isbn"]] = {
+                "book": row["id"],
+                "title": row["title"],
+                "copies": {},
+                "available": 0,
+                "earliest_due_back": None,
+            }
+        status = row["bookinstance__status"]
+        if status is None:
+            continue
+        entry["copies"][status] = row["count"]
+        if status == "a":
+            entry["available"] = row["count"]
+        elif status == "o" and row["earliest_due_back"] is not None:
+            entry["earliest_due_back"] = row["earliest_due_back"]
+    return results
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def availability(request):
+    """Copy availability for many ISBNs in one request.
+
+    Accepts ``GET ?isbn=a,b,c`` or ``POST {"isbns": ["a", "b", "c"]}`` and
+    returns, per ISBN, the copy counts by status, the number of available
+    copies and the earliest due date of the copies on loan. Unknown ISBNs map
+    to ``null``. Each ISBN is cached for ``CATALOG_AVAILABILITY_CACHE_TIMEOUT``
+    seconds.
+    """
+    try:
+        isbns = _get_isbns(request)
+    except ApiError as error:
+        return _error(str(error))
+
+    keys = {isbn: _availability_key(isbn) for isbn in isbns}
+    cached = cache.get_many(keys.values())
+    results = {isbn: cached[key] for isbn, key in keys.items() if key in cached}
+    missing = [isbn for isbn in isbns if isbn not in results]
+    metrics.record_cache("availability", "hit", len(results))
+    metrics.record_cache("availability", "miss", len(missing))
+    if missing:
+        found = _lookup_availability(missing)
+        cache.set_many(
+            {keys[isbn]: value for isbn, value in found.items()},
+            settings.CATALOG_AVAILABILITY_CACHE_TIMEOUT,
+        )
+        results.update(found)
+    return JsonResponse({"results": results})
+
+
+@require_GET
+def suggestions(request):
+    """Book titles and author names starting with ``?q=``.
+
+    Served from the in-process prefix index in :mod:`catalog.suggest`, without
+    database queries. ``limit`` defaults to 10 (at most 50).
+    """
+    try:
+        limit = int(request.GET.get("limit", DEFAULT_SUGGESTIONS))
+    except ValueError:
+        return _error("limit must be an integer.")
+    if not 1 <= limit <= MAX_SUGGESTIONS:
+        return _error(f"limit must be between 1 and {MAX_SUGGESTIONS}.")
+    query = request.GET.get("q", "")
+    results = [
+        {"type": kind, "label": label, "url": url}
+        for kind, label, url in suggest.suggest(query, limit)
+    ]
+    return JsonResponse({"query": query, "results": results})
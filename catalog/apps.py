@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CatalogConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "catalog"
+
+    def ready(self):
+        # Connect the cache invalidation signal handlers.
+        from . import signals  # noqa: F401
+
+        # Register the deployment checks.
+        from . import checks  # noqa: F401
@@ -0,0 +1,112 @@
+"""Per-author totals (titles, copies, copies on loan) kept in AuthorStats.
+
+The signal handlers in ``catalog.signals`` and
+:func:`catalog.changefeed.update_copies` apply each change as an increment
+(``UPDATE ... SET num_copies = num_copies + 1``) in the same transaction as
+the change itself, so the author page reads its totals with one primary key
+lookup instead of counting every copy. An author without a stats row gets
+one computed from scratch on first use, and ``python manage.py
+rebuild_author_stats`` recomputes every row after data is loaded with
+signals bypassed.
+"""
+
+from django.db.models import Count, F, Q
+
+from .models import Author, AuthorStats, Book
+
+ON_LOAN = "o"
+FIELDS = ("num_titles", "num_copies", "num_loans")
+
+
+def _count(author_ids=None):
+    """``{author id: (titles, copies, loans)}`` counted from the catalog."""
+    books = Book.objects.order_by()
+    if author_ids is not None:
+        books = books.filter(author_id__in=author_ids)
+    counts = (
+        books.exclude(author=None)
+        .values("author_id")
+        .annotate(
+            num_titles=Count("pk", distinct=True),
+            num_copies=Count("bookinstance"),
+            num_loans=Count("bookinstance", filter=Q(bookinstance__status=ON_LOAN)),
+        )
+    )
+    return {row["author_id"]: tuple(row[name] for name in FIELDS) for row in counts}
+
+
+def _rows(author_ids, counts):
+    return [
+        AuthorStats(author_id=pk, **dict(zip(FIELDS, counts.get(pk, (0, 0, 0)))))
+        for pk in author_ids
+    ]
+
+
+def _store(stats):
+    AuthorStats.objects.bulk_create(
+        stats,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["author"],
+        update_fields=list(FIELDS),
+    )
+
+
+def _create(author_ids):
+    stats = _rows(author_ids, _count(author_ids))
+    # A concurrent transaction may have created the row first; it counted too.
+    AuthorStats.objects.bulk_create(stats, ignore_conflicts=True)
+    return stats
+
+
+def get_stats(author):
+    """Return the AuthorStats of ``author``, creating it if needed."""
+    try:
+        return AuthorStats.objects.get(author=author)
+    except AuthorStats.DoesNotExist:
+        return _create([author.pk])[0]
+
+
+def apply(deltas):
+    """Add ``deltas`` ({author id: (titles, copies, loans)}) to the stats.
+
+    Must run after the change is written, so that a missing row computed
+    from scratch already includes it.
+    """
+    missing = []
+    for author_id, delta in deltas.items():
+        if author_id is None or not any(delta):
+            continue
+        updated = AuthorStats.objects.filter(author_id=author_id).update(
+            **{name: F(name) + value for name, value in zip(FIELDS, delta) if value}
+        )
+        if not updated:
+            missing.append(author_id)
+    if missing:
+        _create(missing)
+
+
+def copy_deltas(before, after):
+    """Deltas for copies changing from ``before`` to ``after``, both lists of
+    ``(author id, status)`` (empty for copies created or deleted)."""
+    deltas = {}
+    for copies, sign in ((before, -1), (after, 1)):
+        for author_id, status in copies:
+            delta = deltas.setdefault(author_id, [0, 0, 0])
+            delta[1] += sign
+            if status == ON_LOAN:
+                delta[2] += sign
+    return deltas
+
+
+def refresh(author_ids):
+    """Recompute the stats of ``author_ids`` from scratch."""
+    author_ids = [pk for pk in set(author_ids) if pk is not None]
+    _store(_rows(author_ids, _count(author_ids)))
+
+
+def rebuild():
+    """Recompute every author's stats; return the number of authors."""
+    author_ids = list(Author.objects.values_list("pk", flat=True))
+    _store(_rows(author_ids, _count()))
+    return len(author_ids)
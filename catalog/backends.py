@@ -0,0 +1,69 @@
+"""Authentication backend that caches permission sets in the shared cache."""
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from . import metrics
+from .caching import get_with_versions, invalidate, is_shared
+
+# Bumped when permissions change for everybody (group permissions, deleted
+# groups or permissions).
+ALL_USERS = "permissions"
+
+# Seconds a permission set is kept when the cache is private to the process:
+# invalidations from other workers never reach it, so a revoked permission
+# must not outlive this.
+LOCAL_TIMEOUT = 5
+
+
+def _user_namespace(user_id):
+    return f"permissions:user:{user_id}"
+
+
+def _timeout():
+    timeout = settings.CATALOG_PERMISSION_CACHE_TIMEOUT
+    return timeout if is_shared() else min(timeout, LOCAL_TIMEOUT)
+
+
+def invalidate_user_permissions(user_id):
+    """Drop the cached permission set of one user."""
+    invalidate(_user_namespace(user_id))
+
+
+def invalidate_all_permissions():
+    """Drop the cached permission sets of every user."""
+    invalidate(ALL_USERS)
+
+
+class CachedPermissionBackend(ModelBackend):
+    """ModelBackend whose per-user permission sets are kept in the shared cache.
+
+    ``ModelBackend`` only caches permissions on the user object, so every new
+    request pays the user and group permission queries again. Here the set is
+    stored in the cache used by all workers and is invalidated by the
+    membership signals in ``catalog.signals``, so after the first request an
+    authorization check costs no queries and one cache read. With a
+    process-local cache the sets are only kept for ``LOCAL_TIMEOUT`` seconds.
+    """
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, "_perm_cache"):
+            # The set is stored with the versions it was computed under, so
+            # the set and both stamps come back in one cache round trip.
+            key = f"catalog:permissions:{user_obj.pk}"
+            cached, versions = get_with_versions(
+                key, [ALL_USERS, _user_namespace(user_obj.pk)]
+            )
+            stamp = (versions, user_obj.is_superuser)
+            if cached is not None and cached[0] == stamp:
+                metrics.record_cache("permissions", "hit")
+                perms = cached[1]
+            else:
+                metrics.record_cache("permissions", "miss")
+                perms = super().get_all_permissions(user_obj)
+                cache.set(key, (stamp, perms), _timeout())
+            user_obj._perm_cache = perms
+        return user_obj._perm_cache
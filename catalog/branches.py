@@ -0,0 +1,74 @@
+"""Selecting the library branch that lists and counts are scoped to.
+
+The current branch is, in order:
+
+- ``?branch=<id>`` in the URL (``?branch=`` selects all branches). Signed-in
+  users keep their choice in the session.
+- for signed-in users, the branch remembered in the session, or else their
+  patron home branch.
+- otherwise ``None``: all branches.
+
+Anonymous users are never scoped by session, so their pages still depend only
+on the URL and stay safe to share in the anonymous page cache.
+"""
+
+from . import refdata
+from .models import Patron
+
+SESSION_KEY = "branch"
+
+
+def _parse(value, branches):
+    try:
+        pk = int(value)
+    except (TypeError, ValueError):
+        return None
+    return pk if pk in branches else None
+
+
+def get_current_branch(request):
+    """Return the id of the branch ``request`` is scoped to, or ``None``."""
+    branches = refdata.branches()
+    authenticated = request.user.is_authenticated
+    if "branch" in request.GET:
+        branch = _parse(request.GET["branch"], branches)
+        if authenticated and request.session.get(SESSION_KEY, "") != branch:
+            request.session[SESSION_KEY] = branch
+        return branch
+    if not authenticated:
+        return None
+    if SESSION_KEY in request.session:
+        return _parse(request.session[SESSION_KEY], branches)
+    home = (
+        Patron.objects.filter(user=request.user)
+        .values_list("branch_id", flat=True)
+        .first()
+    )
+    return home if home in branches else None
+
+
+def branch_context(branch):
+    """Template context for the branch selector."""
+    return {
+        "branches": refdata.branches(),
+        "current_branch": branch,
+    }
+
+
+class BranchScopedMixin:
+    """Sets ``self.branch`` for a class-based view and adds the selector
+    context. Querysets filter on it themselves."""
+
+    def setup(self, request, *args, **kwargs):
+        super().setup(request, *args, **kwargs)
+        self.branch = get_current_branch(request)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(branch_context(self.branch))
+        return context
+
+
+def scope(copies, branch):
+    """Filter a BookInstance queryset to ``branch`` (no-op for all branches)."""
+    return copies if branch is None else copies.filter(branch=branch)
@@ -0,0 +1,82 @@
+"""Helpers for version-stamped cache keys.
+
+Cached data (facet counts, reference tables, ...) is stored under keys that
+embed a namespace version. Bumping the version from a model signal makes every
+old entry unreachable at once, which is cheaper and safer than tracking and
+deleting individual keys. Old entries simply expire with their TTL.
+"""
+
+import hashlib
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+# Backends whose entries are private to one process.
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def is_shared(alias="default"):
+    """Whether the cache ``alias`` is seen by every process (Redis, database,
+    files), which version stamps need to reach other workers."""
+    return not isinstance(caches[alias], PROCESS_LOCAL_BACKENDS)
+
+
+def _version_key(namespace):
+    return f"catalog:version:{namespace}"
+
+
+def _initial_version():
+    # Not a small constant: a version that was lost (cache restart, eviction)
+    # must not come back with a value that a process has already seen.
+    return time.time_ns()
+
+
+def get_version(namespace):
+    """Return the current version of ``namespace``, initialising it if needed."""
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_with_versions(key, namespaces):
+    """Return the value of ``key`` (None if missing) and the current versions
+    of ``namespaces`` as a tuple, with one cache round trip."""
+    version_keys = [_version_key(namespace) for namespace in namespaces]
+    found = cache.get_many([key, *version_keys])
+    versions = tuple(
+        found[version_key] if version_key in found else get_version(namespace)
+        for namespace, version_key in zip(namespaces, version_keys)
+    )
+    return found.get(key), versions
+
+
+def bump_version(namespace):
+    """Invalidate everything cached under ``namespace``."""
+    key = _version_key(namespace)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # The key expired or was evicted; any new value invalidates old entries.
+        return get_version(namespace)
+
+
+def invalidate(namespace):
+    """Bump ``namespace`` now and again once the current transaction commits.
+
+    The second bump covers another worker re-reading the old rows between the
+    first bump and the commit, and caching them under the new version.
+    """
+    bump_version(namespace)
+    transaction.on_commit(lambda: bump_version(namespace))
+
+
+def make_key(namespace, *parts):
+    """Build a cache key for ``parts`` under the current ``namespace`` version."""
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f"catalog:{namespace}:{get_version(namespace)}:{digest}"
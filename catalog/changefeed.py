@@ -0,0 +1,241 @@
+"""Server-Sent Events feed of copy availability changes, for kiosks.
+
+Every change of a copy's status or due date is written to the
+CopyStatusChange log: saves through the post_save/post_delete signals, and
+bulk updates through :func:`update_copies`, which callers use instead of
+``QuerySet.update()``. Because the log is a table, changes made by any
+process (web workers, management commands) reach every subscriber.
+
+``/catalog/api/copies/stream/?book=1,2`` streams the changes of those books
+(all books without ``book``) as ``text/event-stream``::
+
+    id: 42
+    event: copy
+    data: {"copy": "...", "book": 1, "status": "a", "due_back": null}
+
+The event id is the log entry's id; browsers send it back in the
+``Last-Event-ID`` header when they reconnect, so no change is missed. A new
+subscriber starts at the end of the log. ``status`` is empty when the copy
+was removed.
+
+Ids are handed out when rows are inserted, not when they commit, so a
+transaction can make id 11 visible while id 10 is still uncommitted; a
+subscriber that moved past 11 would never see 10. Entries are therefore only
+sent once they are ``CATALOG_STREAM_SETTLE_DELAY`` seconds old, and never past
+a younger one, so the delay must exceed the longest transaction that writes
+the log.
+
+Live streaming needs ASGI (``GUNICORN_WORKER_CLASS=uvicorn``): each connection
+polls the log with one indexed query every ``CATALOG_STREAM_POLL_INTERVAL``
+seconds and is closed after ``CATALOG_STREAM_LIFETIME`` seconds, after which
+the client reconnects. A WSGI worker cannot hold the connection without tying
+up a thread, so there the response returns at once with the pending changes
+and a ``retry`` delay of ``CATALOG_STREAM_WSGI_RETRY`` seconds, after which
+the client reconnects to poll; kiosks then lag by up to that long.
+
+Run ``python manage.py prune_change_log`` periodically (e.g. hourly) to delete
+entries older than ``CATALOG_STREAM_LOG_RETENTION`` hours, see :func:`prune`.
+"""
+
+import asyncio
+import datetime
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import F, Subquery
+from django.db.models.functions import Coalesce
+from django.http import HttpResponseNotAllowed, StreamingHttpResponse
+from django.utils import timezone
+
+from . import authors
+from .models import BookInstance, CopyStatusChange
+
+TRACKED_FIELDS = frozenset(["status", "due_back"])
+MAX_BOOKS = 100
+BATCH_SIZE = 500
+# Keep-alive comment interval, well below common proxy idle timeouts.
+HEARTBEAT = 15
+
+
+def record_save(copy):
+    CopyStatusChange.objects.create(
+        copy_id=copy.pk,
+        book_id=copy.book_id,
+        status=copy.status,
+        due_back=copy.due_back,
+    )
+
+
+def record_delete(copy):
+    CopyStatusChange.objects.create(copy_id=copy.pk, book_id=copy.book_id)
+
+
+def prune():
+    """Delete log entries past the retention period; return how many.
+
+    Kiosks that were offline for longer start again at the end of the log.
+    """
+    cutoff = timezone.now() - datetime.timedelta(
+        hours=settings.CATALOG_STREAM_LOG_RETENTION
+    )
+    deleted, _ = CopyStatusChange.objects.filter(created__lt=cutoff).delete()
+    return deleted
+
+
+def update_copies(queryset, **values):
+    """``queryset.update(**values)`` for BookInstance querysets that also bumps
+    the version, logs status/due_back changes and updates the author stats;
+    returns the row count.
+
+    The values of tracked fields must be literals, not expressions.
+    """
+    values["version"] = F("version") + 1
+    if not TRACKED_FIELDS & values.keys():
+        return queryset.update(**values)
+    changed = {name: values[name] for name in TRACKED_FIELDS & values.keys()}
+    updated = 0
+    with transaction.atomic():
+        copies = list(
+            queryset.select_for_update(of=("self",)).values_list(
+                "pk", "book_id", "status", "due_back", "book__author_id"
+            )
+        )
+        # Update the locked keys, so that the log matches the updated rows.
+        for start in range(0, len(copies), BATCH_SIZE):
+            batch = copies[start : start + BATCH_SIZE]
+            updated += BookInstance.objects.filter(
+                pk__in=[copy[0] for copy in batch]
+            ).update(**values)
+            CopyStatusChange.objects.bulk_create(
+                CopyStatusChange(
+                    copy_id=pk,
+                    book_id=book_id,
+                    status=changed.get("status", status),
+                    due_back=changed.get("due_back", due_back),
+                )
+                for pk, book_id, status, due_back, _ in batch
+            )
+        if "status" in changed:
+            authors.apply(
+                authors.copy_deltas(
+                    [(copy[4], copy[2]) for copy in copies],
+                    [(copy[4], changed["status"]) for copy in copies],
+                )
+            )
+    return updated
+
+
+def _parse_books(value):
+    if not value:
+        return None
+    try:
+        books = sorted({int(pk) for pk in value.split(",")})
+    except ValueError:
+        return None
+    return books[:MAX_BOOKS]
+
+
+def _last_event_id(request):
+    value = request.headers.get("Last-Event-ID") or request.GET.get("last_id")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _unsettled(after):
+    """Entries after ``after`` that are too recent to send, oldest first."""
+    settled = timezone.now() - datetime.timedelta(
+        seconds=settings.CATALOG_STREAM_SETTLE_DELAY
+    )
+    return CopyStatusChange.objects.filter(id__gt=after, created__gte=settled)
+
+
+def _changes(books, after):
+    # Stop before the first unsettled entry of any book (no limit if none).
+    first_unsettled = _unsettled(after).order_by("id").values("id")[:1]
+    changes = CopyStatusChange.objects.filter(
+        id__gt=after, id__lt=Coalesce(Subquery(first_unsettled), F("id") + 1)
+    )
+    if books is not None:
+        changes = changes.filter(book_id__in=books)
+    return changes.values_list("id", "copy_id", "book_id", "status", "due_back")[
+        :BATCH_SIZE
+    ]
+
+
+def _event(change):
+    event_id, copy_id, book_id, status, due_back = change
+    data = {
+        "copy": str(copy_id),
+        "book": book_id,
+        "status": status,
+        "due_back": due_back.isoformat() if due_back else None,
+    }
+    return f"id: {event_id}\nevent: copy\ndata: {json.dumps(data)}\n\n"
+
+
+async def _latest_id():
+    """The end of the settled log, where a new subscriber starts."""
+    unsettled = await _unsettled(0).order_by("id").afirst()
+    if unsettled:
+        return unsettled.id - 1
+    latest = await CopyStatusChange.objects.order_by("-id").afirst()
+    return latest.id if latest else 0
+
+
+async def _stream(books, after):
+    retry = int(settings.CATALOG_STREAM_POLL_INTERVAL * 1000)
+    yield f"retry: {retry}\n\n"
+    deadline = time.monotonic() + settings.CATALOG_STREAM_LIFETIME
+    quiet_since = time.monotonic()
+    while time.monotonic() < deadline:
+        changes = [change async for change in _changes(books, after)]
+        for change in changes:
+            yield _event(change)
+        if changes:
+            after = changes[-1][0]
+            quiet_since = time.monotonic()
+            if len(changes) == BATCH_SIZE:
+                continue
+        elif time.monotonic() - quiet_since >= HEARTBEAT:
+            yield ": keep-alive\n\n"
+            quiet_since = time.monotonic()
+        await asyncio.sleep(settings.CATALOG_STREAM_POLL_INTERVAL)
+
+
+def _poll_once(books, after, latest):
+    retry = int(settings.CATALOG_STREAM_WSGI_RETRY * 1000)
+    yield f"retry: {retry}\n\n"
+    if after is None:
+        # Tell a new client where the log ends, so the next poll resumes there.
+        yield f"id: {latest}\n\n"
+        return
+    for change in _changes(books, after):
+        yield _event(change)
+
+
+async def copy_changes(request):
+    """Stream copy status/due date changes as Server-Sent Events."""
+    # require_GET does not wrap async views before Django 5.0.
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    books = _parse_books(request.GET.get("book"))
+    after = _last_event_id(request)
+    if isinstance(request, ASGIRequest):
+        if after is None:
+            after = await _latest_id()
+        content = _stream(books, after)
+    else:
+        latest = await _latest_id() if after is None else None
+        # Evaluated eagerly: a WSGI response cannot run an async generator.
+        content = await sync_to_async(list)(_poll_once(books, after, latest))
+    response = StreamingHttpResponse(content, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx and similar proxies from buffering the stream.
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,38 @@
+"""System checks for deployments (``python manage.py check --deploy``)."""
+
+from django.conf import settings
+from django.core import checks
+
+from .caching import is_shared
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """The invalidation stamps of the catalog caches live in the default cache,
+    so workers only see each other's changes if that cache is shared."""
+    if is_shared():
+        return []
+    return [
+        checks.Error(
+            "The default cache is private to each process, so gunicorn workers "
+            "never see each other's invalidations and serve stale reference "
+            "data, permissions and suggestions.",
+            hint="Set $REDIS_URL to use a Redis cache shared by all workers.",
+            id="catalog.E001",
+        )
+    ]
+
+
+@checks.register(checks.Tags.security, deploy=True)
+def check_metrics_token(app_configs, **kwargs):
+    """/metrics is refused to everyone without a token when DEBUG is off."""
+    if settings.CATALOG_METRICS_TOKEN:
+        return []
+    return [
+        checks.Error(
+            "CATALOG_METRICS_TOKEN is not set, so /metrics refuses every request.",
+            hint="Set $CATALOG_METRICS_TOKEN and configure Prometheus to send it "
+            "as a bearer token.",
+            id="catalog.E002",
+        )
+    ]
@@ -0,0 +1,132 @@
+"""Query-string facet filtering and cached facet counts for the book list.
+
+Supported parameters (all optional, combined with AND):
+
+- ``genre``: Genre id; books in its subgenres match too
+- ``language``: Language id
+- ``author``: Author id
+- ``available``: ``1`` to only show books with at least one available copy
+
+The counts also follow the A-Z ``letter`` the list is browsed by, so that
+they match the books shown.
+
+Genre counts are rolled up the genre tree: a book counts once for each of
+its genres and their ancestors (see ``catalog.genres``).
+
+Facet counts are computed once per filter combination and cached under the
+``books`` version namespace, which is bumped whenever a Book, BookInstance,
+Genre, Language or Author changes (see ``catalog.signals``).
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Exists, OuterRef
+from django.db.models.functions import Lower
+
+from . import genres, metrics, refdata
+from .caching import make_key
+from .models import Author, Book, BookInstance
+
+FACET_PARAMS = ("genre", "language", "author")
+
+# Only the most common authors are offered as facet values.
+MAX_AUTHOR_FACETS = 20
+
+
+def get_selected_facets(params):
+    """Return the valid facet selections from a QueryDict."""
+    selected = {}
+    for name in FACET_PARAMS:
+        value = params.get(name, "")
+        if value.isdigit():
+            selected[name] = int(value)
+    if params.get("available") == "1":
+        selected["available"] = True
+    return selected
+
+
+def _available_copies():
+    return BookInstance.objects.filter(book=OuterRef("pk"), status__exact="a")
+
+
+def filter_books(queryset, selected):
+    """Apply facet selections to a Book queryset."""
+    if "genre" in selected:
+        queryset = queryset.filter(genres.in_subtree(selected["genre"]))
+    if "language" in selected:
+        queryset = queryset.filter(language_id=selected["language"])
+    if "author" in selected:
+        queryset = queryset.filter(author_id=selected["author"])
+    if selected.get("available"):
+        queryset = queryset.filter(Exists(_available_copies()))
+    return queryset
+
+
+def filter_letter(queryset, field, letter):
+    """Restrict ``queryset`` to rows whose ``field`` starts with ``letter``
+    (case-insensitive), as a range on ``Lower(field)`` so that the matching
+    functional index answers it."""
+    if not letter:
+        return queryset
+    start = letter.lower()
+    end = chr(ord(start) + 1)
+    return queryset.annotate(browse_key=Lower(field)).filter(
+        browse_key__gte=start, browse_key__lt=end
+    )
+
+
+def _compute_facet_counts(selected, letter):
+    books = filter_letter(
+        filter_books(Book.objects.order_by(), selected), "title", letter
+    )
+    book_ids = books.values("pk")
+
+    genre_counts = genres.rollup_counts(book_ids)
+    language_counts = dict(
+        books.exclude(language=None)
+        .values_list("language_id")
+        .annotate(count=Count("pk"))
+    )
+    author_counts = dict(
+        books.exclude(author=None)
+        .values_list("author_id")
+        .annotate(count=Count("pk"))
+        .order_by("-count")[:MAX_AUTHOR_FACETS]
+    )
+
+    def values(name, names, counts):
+        values = [
+            {
+                "id": pk,
+                "name": names[pk],
+                "count": count,
+                "selected": selected.get(name) == pk,
+            }
+            for pk, count in counts.items()
+            if pk in names
+        ]
+        return sorted(values, key=lambda value: (-value["count"], value["name"]))
+
+    author_names = {
+        author.pk: str(author) for author in Author.objects.filter(pk__in=author_counts)
+    }
+    return {
+        "genre": values("genre", refdata.genres(), genre_counts),
+        "language": values("language", refdata.languages(), language_counts),
+        "author": values("author", author_names, author_counts),
+        "available": books.filter(Exists(_available_copies())).count(),
+    }
+
+
+def get_facet_counts(selected, letter=""):
+    """Return facet values and counts for ``selected`` (and the browse
+    ``letter``), using the cache."""
+    key = make_key("books", "facets", sorted(selected.items()), letter)
+    counts = cache.get(key)
+    if counts is None:
+        metrics.record_cache("facets", "miss")
+        counts = _compute_facet_counts(selected, letter)
+        cache.set(key, counts, settings.CATALOG_FACET_CACHE_TIMEOUT)
+    else:
+        metrics.record_cache("facets", "hit")
+    return counts
@@ -0,0 +1,206 @@
+"""Fines for overdue loans.
+
+Rates come from FineRate: the highest rate among the book's genres, else the
+rate of its language, else the default rate (no genre and no language). A
+genre without a rate of its own takes the rate of its nearest ancestor with
+one (see ``catalog.genres``), so a rate on Fiction also applies to Fantasy. A
+loan without any matching rate is not fined. The fine of a loan is the daily
+rate times the days past ``due_back``, up to the rate's ``maximum``.
+
+:func:`assess` is run nightly by ``python manage.py assess_fines``. It reads
+the loans that are overdue into NumPy arrays (one query, no model
+instances), computes every fine at once in integer cents, and upserts one
+Fine row per loan. Fines of returned copies keep their last amount. Each
+borrower's unpaid total is then stored in FineBalance with one aggregate
+query, so pages read a balance with a primary key lookup.
+"""
+
+import datetime
+import math
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Sum
+
+from .models import BookInstance, Fine, FineBalance, FineRate, GenreClosure
+
+BATCH_SIZE = 1000
+NO_RATE = -1
+
+
+def _cents(amount):
+    return int(amount * 100)
+
+
+def _rate_lookup(keys, rates):
+    """Map ``keys`` (an int array) through ``rates`` ({key: cents}); missing
+    keys map to NO_RATE."""
+    result = np.full(len(keys), NO_RATE, dtype=np.int64)
+    if not rates or not len(keys):
+        return result
+    known = np.array(sorted(rates), dtype=np.int64)
+    values = np.array([rates[key] for key in known], dtype=np.int64)
+    index = np.minimum(np.searchsorted(known, keys), len(known) - 1)
+    found = known[index] == keys
+    result[found] = values[index[found]]
+    return result
+
+
+def _rate_order(rate):
+    """Sort key of a (daily, cap) rate: by daily rate, then cap, where no cap
+    (NO_RATE) is the highest."""
+    daily, cap = rate
+    return daily, math.inf if cap == NO_RATE else cap
+
+
+def _loan_rates(book_ids, language_ids):
+    """Return the daily rate and cap, in cents, of each loan (NO_RATE for
+    none; a cap of NO_RATE means uncapped)."""
+    genre_rates, language_rates, default = {}, {}, None
+    for rate in FineRate.objects.all():
+        cap = NO_RATE if rate.maximum is None else _cents(rate.maximum)
+        value = (_cents(rate.daily_rate), cap)
+        if rate.genre_id:
+            genre_rates[rate.genre_id] = value
+        elif rate.language_id:
+            language_rates[rate.language_id] = value
+        else:
+            default = value
+
+    daily = np.full(len(book_ids), NO_RATE, dtype=np.int64)
+    cap = np.full(len(book_ids), NO_RATE, dtype=np.int64)
+    if default:
+        daily[:], cap[:] = default
+    language_daily = _rate_lookup(
+        language_ids, {pk: value[0] for pk, value in language_rates.items()}
+    )
+    language_cap = _rate_lookup(
+        language_ids, {pk: value[1] for pk, value in language_rates.items()}
+    )
+    has_language_rate = language_daily != NO_RATE
+    daily[has_language_rate] = language_daily[has_language_rate]
+    cap[has_language_rate] = language_cap[has_language_rate]
+
+    if genre_rates:
+        # The rate of each (book, genre) pair: that of the genre's nearest
+        # ancestor (or itself, at depth 0) with a rate.
+        nearest = {}
+        for book_id, genre_id, ancestor_id, depth in GenreClosure.objects.filter(
+            ancestor_id__in=genre_rates, descendant__book__isnull=False
+        ).values_list("descendant__book", "descendant_id", "ancestor_id", "depth"):
+            key = (book_id, genre_id)
+            if key not in nearest or depth < nearest[key][0]:
+                nearest[key] = (depth, genre_rates[ancestor_id])
+        # The highest genre rate of each book (and the cap that comes with it).
+        book_rates = {}
+        for (book_id, _), (_, rate) in nearest.items():
+            book_rates[book_id] = max(
+                book_rates.get(book_id, (NO_RATE, NO_RATE)), rate, key=_rate_order
+            )
+        genre_daily = _rate_lookup(
+            book_ids, {pk: value[0] for pk, value in book_rates.items()}
+        )
+        genre_cap = _rate_lookup(
+            book_ids, {pk: value[1] for pk, value in book_rates.items()}
+        )
+        has_genre_rate = genre_daily != NO_RATE
+        daily[has_genre_rate] = genre_daily[has_genre_rate]
+        cap[has_genre_rate] = genre_cap[has_genre_rate]
+    return daily, cap
+
+
+def compute_fines(due_back, today, daily, cap):
+    """Vectorized fines in cents: ``daily`` per day past ``due_back`` (a
+    ``datetime64[D]`` array), capped at ``cap`` where it is not NO_RATE."""
+    days = (np.datetime64(today, "D") - due_back).astype(np.int64)
+    amounts = np.maximum(days, 0) * daily
+    capped = cap != NO_RATE
+    amounts[capped] = np.minimum(amounts[capped], cap[capped])
+    return days, amounts
+
+
+def assess(today=None):
+    """Update the Fine of every overdue loan and refresh all balances.
+
+    Returns the number of loans fined.
+    """
+    today = today or datetime.date.today()
+    loans = list(
+        BookInstance.objects.filter(
+            status__exact="o", borrower__isnull=False, due_back__lt=today
+        ).values_list("id", "book_id", "book__language_id", "borrower_id", "due_back")
+    )
+    if loans:
+        copy_ids, book_ids, language_ids, borrower_ids, due_back = zip(*loans)
+        book_ids = np.array([pk or 0 for pk in book_ids], dtype=np.int64)
+        daily, cap = _loan_rates(
+            book_ids, np.array([pk or 0 for pk in language_ids], dtype=np.int64)
+        )
+        days, amounts = compute_fines(
+            np.array(due_back, dtype="datetime64[D]"), today, daily, cap
+        )
+        days, amounts = days.tolist(), amounts.tolist()
+        fines = [
+            Fine(
+                borrower_id=borrower_ids[index],
+                copy_id=copy_ids[index],
+                book_id=int(book_ids[index]) or None,
+                due_back=due_back[index],
+                days_overdue=days[index],
+                amount=Decimal(amounts[index]).scaleb(-2),
+                assessed=today,
+            )
+            for index in np.flatnonzero(daily != NO_RATE).tolist()
+        ]
+    else:
+        fines = []
+    with transaction.atomic():
+        Fine.objects.bulk_create(
+            fines,
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["copy_id", "due_back", "borrower"],
+            update_fields=["book", "days_overdue", "amount", "assessed"],
+        )
+        refresh_balances()
+    return len(fines)
+
+
+def refresh_balances(borrower_ids=None):
+    """Recompute the FineBalance of ``borrower_ids`` (all borrowers if None)."""
+    fines = Fine.objects.all()
+    balances = FineBalance.objects.all()
+    if borrower_ids is not None:
+        fines = fines.filter(borrower_id__in=borrower_ids)
+        balances = balances.filter(borrower_id__in=borrower_ids)
+    totals = dict(
+        fines.values("borrower_id")
+        .annotate(balance=Sum(F("amount") - F("paid")))
+        .values_list("borrower_id", "balance")
+    )
+    with transaction.atomic():
+        # Borrowers whose fines were all removed owe nothing.
+        balances.exclude(
+            Exists(Fine.objects.filter(borrower=OuterRef("borrower")))
+        ).delete()
+        FineBalance.objects.bulk_create(
+            [
+                FineBalance(borrower_id=borrower_id, balance=balance)
+                for borrower_id, balance in totals.items()
+            ],
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["borrower"],
+            update_fields=["balance", "updated"],
+        )
+
+
+def balance_for(user):
+    """The outstanding fines of ``user`` (a Decimal, zero if none)."""
+    balance = (
+        FineBalance.objects.filter(borrower=user)
+        .values_list("balance", flat=True)
+        .first()
+    )
+    return balance or Decimal("0.00")
@@ -12,6 +12,8 @@ class RenewBookForm(forms.Form):
     renewal_date = forms.DateField(
         help_text="Enter a date between now and 4 weeks (default 3).",
     )
+    # BookInstance.version when the form was shown, to detect concurrent edits.
+    version = forms.IntegerField(widget=forms.HiddenInput, required=False)
 
     def clean_renewal_date(self):
         data = self.cleaned_data["renewal_date"]
@@ -58,3 +60,71 @@ class RenewBookModelForm(ModelForm):
         help_texts = {
             "due_back": _("Enter a date between now and 4 weeks (default 3)."),
         }
+
+
+# Form for BookCreate/BookUpdate and the Book admin
+from . import refdata
+from .models import Book
+
+
+class BookForm(ModelForm):
+    """Book form whose genre and language choices come from the reference data
+    cache, so rendering it does not query the Genre and Language tables."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._set_choices("genre", refdata.choices(refdata.genres()))
+        self._set_choices(
+            "language",
+            [("", self.fields["language"].empty_label)]
+            + refdata.choices(refdata.languages()),
+        )
+
+    def _set_choices(self, name, choices):
+        field = self.fields[name]
+        field.choices = choices
+        # The admin wraps the widget to add the "+" links; the wrapped widget
+        # is the one that renders the options.
+        if hasattr(field.widget, "widget"):
+            field.widget.widget.choices = choices
+
+    class Meta:
+        model = Book
+        fields = ["title", "author", "summary", "isbn", "genre", "language"]
+
+
+class BookInstanceAdminForm(ModelForm):
+    """BookInstance form for the admin that carries the version the copy was
+    loaded with, so that saving over someone else's change is refused."""
+
+    # Not named "version": the admin refuses non-editable model fields in
+    # fieldsets, even when the form declares them.
+    loaded_version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["loaded_version"].initial = self.instance.version
+
+    def clean(self):
+        cleaned_data = super().clean()
+        version = cleaned_data.get("loaded_version")
+        if (
+            version is not None
+            and not self.instance._state.adding
+            and BookInstance.objects.filter(pk=self.instance.pk)
+            .exclude(version=version)
+            .exists()
+        ):
+            raise ValidationError(
+                _("This copy was changed by someone else. Reload it and try again.")
+            )
+        return cleaned_data
+
+    def save(self, commit=True):
+        if self.cleaned_data.get("loaded_version") is not None:
+            self.instance.version = self.cleaned_data["loaded_version"]
+        return super().save(commit)
+
+    class Meta:
+        model = BookInstance
+        fields = "__all__"
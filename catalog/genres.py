@@ -0,0 +1,81 @@
+"""The genre tree: subgenres, subtree queries and rolled-up counts.
+
+Each Genre may have a ``parent``. The GenreClosure table holds every
+(ancestor, descendant) pair of the tree, including each genre with itself,
+so "books in Fiction and all its subgenres" is one join on an indexed
+column instead of a recursive walk. Genres are a small reference table, so
+the closure is simply rebuilt whenever a genre is added, moved or deleted
+(see ``catalog.signals``); renames and books never touch it.
+"""
+
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef
+
+from .models import Book, Genre, GenreClosure
+
+
+def rebuild_closure():
+    """Recompute GenreClosure from the parent links; return its row count."""
+    parents = dict(Genre.objects.values_list("pk", "parent_id"))
+    rows = []
+    for pk in parents:
+        ancestor, depth, seen = pk, 0, set()
+        # ``seen`` stops at a cycle saved without Genre.clean().
+        while ancestor is not None and ancestor not in seen:
+            rows.append(
+                GenreClosure(ancestor_id=ancestor, descendant_id=pk, depth=depth)
+            )
+            seen.add(ancestor)
+            ancestor = parents.get(ancestor)
+            depth += 1
+    with transaction.atomic():
+        GenreClosure.objects.all().delete()
+        GenreClosure.objects.bulk_create(rows)
+    return len(rows)
+
+
+def find_root(name):
+    """Return the id of the top-level genre called ``name`` (any case), or
+    ``None``."""
+    return (
+        Genre.objects.filter(name__iexact=name, parent=None)
+        .values_list("pk", flat=True)
+        .first()
+    )
+
+
+def subtree_ids(genre_id):
+    """Ids of ``genre_id`` and all of its subgenres."""
+    return list(
+        GenreClosure.objects.filter(ancestor_id=genre_id).values_list(
+            "descendant_id", flat=True
+        )
+    )
+
+
+def in_subtree(genre_id):
+    """Condition matching books in ``genre_id`` or any of its subgenres."""
+    return Exists(
+        Book.genre.through.objects.filter(
+            book_id=OuterRef("pk"),
+            genre_id__in=GenreClosure.objects.filter(ancestor_id=genre_id).values(
+                "descendant_id"
+            ),
+        )
+    )
+
+
+def books_in(genre_id):
+    """Books in ``genre_id`` or any of its subgenres, each listed once."""
+    return Book.objects.filter(in_subtree(genre_id))
+
+
+def rollup_counts(book_ids):
+    """``{genre id: number of books}`` for the books in ``book_ids`` (a
+    queryset of pks), where a book counts for its genres and all their
+    ancestors, once per genre."""
+    return dict(
+        GenreClosure.objects.filter(descendant__book__in=book_ids)
+        .values_list("ancestor_id")
+        .annotate(count=Count("descendant__book", distinct=True))
+    )
@@ -0,0 +1,37 @@
+"""Compute the fines of overdue loans and the borrowers' balances.
+
+Usage::
+
+    python manage.py assess_fines [--date 2024-01-31]
+
+Run nightly (e.g. from cron). Each run recomputes the fine of every loan that
+is overdue on ``--date`` (today by default), so a missed night is caught up
+by the next run. See catalog/fines.py for how rates and fines are computed.
+"""
+
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import fines
+
+
+class Command(BaseCommand):
+    help = "Compute fines for overdue loans and refresh borrower balances."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="Assess as of this date (YYYY-MM-DD).")
+
+    def handle(self, *args, **options):
+        today = None
+        if options["date"]:
+            try:
+                today = datetime.date.fromisoformat(options["date"])
+            except ValueError:
+                raise CommandError("--date must be formatted as YYYY-MM-DD.")
+        start = time.perf_counter()
+        count = fines.assess(today)
+        self.stdout.write(
+            f"Assessed {count} overdue loans in {time.perf_counter() - start:.2f}s."
+        )
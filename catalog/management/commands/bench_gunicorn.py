@@ -0,0 +1,171 @@
+"""Compare gunicorn worker models on the catalog routes.
+
+Usage::
+
+    python manage.py bench_gunicorn --modes sync gthread --duration 10
+
+For each worker model a gunicorn server is started with gunicorn.conf.py on a
+free local port, the catalog routes are requested by ``--concurrency`` client
+threads for ``--duration`` seconds, and the throughput and latency
+percentiles are reported. The server runs with DJANGO_DEBUG=False against the
+configured database, so load some books and authors first.
+"""
+
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from catalog.models import Author, Book
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark gunicorn worker models (sync/gthread/uvicorn) on the catalog routes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--modes",
+            nargs="+",
+            default=["sync", "gthread", "uvicorn"],
+            choices=["sync", "gthread", "uvicorn"],
+        )
+        parser.add_argument("--duration", type=float, default=10.0)
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument(
+            "--workers", type=int, help="Override the WEB_CONCURRENCY default."
+        )
+
+    def handle(self, *args, **options):
+        paths = self.get_paths()
+        self.stdout.write(f"Routes: {', '.join(paths)}")
+        self.stdout.write(
+            f"{'mode':<10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}"
+        )
+        for mode in options["modes"]:
+            result = self.run_mode(mode, paths, options)
+            if result is None:
+                continue
+            rate, latencies, errors = result
+            quantiles = (
+                statistics.quantiles(latencies, n=100) if latencies else [0] * 99
+            )
+            self.stdout.write(
+                f"{mode:<10} {rate:>8.1f} {quantiles[49]:>8.1f}"
+                f" {quantiles[94]:>8.1f} {quantiles[98]:>8.1f} {errors:>7}"
+            )
+
+    def get_paths(self):
+        paths = [reverse("index"), reverse("books"), reverse("authors")]
+        book = Book.objects.first()
+        author = Author.objects.first()
+        if book is None or author is None:
+            raise CommandError(
+                "The benchmark needs at least one book and one author in the database."
+            )
+        paths += [
+            reverse("book-detail", args=[book.pk]),
+            reverse("author-detail", args=[author.pk]),
+        ]
+        return paths
+
+    def run_mode(self, mode, paths, options):
+        port = _free_port()
+        env = dict(
+            os.environ,
+            GUNICORN_WORKER_CLASS=mode,
+            GUNICORN_ACCESS_LOG="",
+            DJANGO_DEBUG="False",
+        )
+        if options["workers"]:
+            env["WEB_CONCURRENCY"] = str(options["workers"])
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "gunicorn",
+                "--config",
+                str(settings.BASE_DIR / "gunicorn.conf.py"),
+                "--bind",
+                f"127.0.0.1:{port}",
+            ],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            if not self.wait_until_ready(server, base_url + paths[0]):
+                self.stderr.write(
+                    f"{mode}: server did not start\n{server.stderr.read().decode()}"
+                    if server.poll() is not None
+                    else f"{mode}: server did not start"
+                )
+                return None
+            return self.load(base_url, paths, options)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    def wait_until_ready(self, server, url, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and server.poll() is None:
+            try:
+                urllib.request.urlopen(url, timeout=5).read()
+                return True
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.2)
+        return False
+
+    def load(self, base_url, paths, options):
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+        deadline = time.monotonic() + options["duration"]
+
+        def client(offset):
+            index = offset
+            local = []
+            local_errors = 0
+            while time.monotonic() < deadline:
+                url = base_url + paths[index % len(paths)]
+                index += 1
+                start = time.perf_counter()
+                try:
+                    urllib.request.urlopen(url, timeout=30).read()
+                except (urllib.error.URLError, ConnectionError):
+                    local_errors += 1
+                    continue
+                local.append((time.perf_counter() - start) * 1000)
+            with lock:
+                latencies.extend(local)
+                errors[0] += local_errors
+
+        threads = [
+            threading.Thread(target=client, args=(offset,))
+            for offset in range(options["concurrency"])
+        ]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+        return len(latencies) / elapsed, latencies, errors[0]
@@ -0,0 +1,176 @@
+"""Compare the stock and the tuned SQLite backends under concurrent processes.
+
+Usage::
+
+    python manage.py bench_sqlite --readers 4 --writers 4 --duration 10
+
+For each backend a fresh database file is migrated and filled with sample
+copies, then ``--readers`` processes run the index page's counts and
+``--writers`` processes alternate between renewing a copy (a read followed
+by a write in one transaction) and saving a session, for ``--duration``
+seconds. The throughput of each kind and the number of "database is locked"
+errors are reported. The configured database is never touched.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, transaction
+
+from catalog.models import Book, BookInstance
+
+MODES = {"stock": "False", "tuned": "True"}
+SAMPLE_COPIES = 1000
+
+
+def _is_locked(error):
+    return "locked" in str(error) or "busy" in str(error)
+
+
+def _read():
+    BookInstance.objects.count()
+    BookInstance.objects.filter(status__exact="a").count()
+    Book.objects.count()
+
+
+def _renew(copy_ids):
+    with transaction.atomic():
+        copy = BookInstance.objects.get(pk=random.choice(copy_ids))
+        copy.due_back = datetime.date.today() + datetime.timedelta(weeks=3)
+        copy.save(update_fields=["due_back"])
+
+
+def _write_session():
+    session = SessionStore()
+    session["num_visits"] = random.randint(1, 1000)
+    session.save()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark concurrent reads and writes on the stock and tuned SQLite backends."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--modes", nargs="+", default=list(MODES), choices=list(MODES)
+        )
+        parser.add_argument("--readers", type=int, default=4)
+        parser.add_argument("--writers", type=int, default=4)
+        parser.add_argument("--duration", type=float, default=10.0)
+        # Used by the worker processes that the benchmark starts.
+        parser.add_argument(
+            "--worker", choices=["seed", "read", "write"], help=argparse.SUPPRESS
+        )
+        parser.add_argument("--start-at", type=float, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options["worker"]:
+            return self.run_worker(options)
+
+        self.stdout.write(
+            f"{options['readers']} readers, {options['writers']} writers,"
+            f" {options['duration']:.0f}s per backend"
+        )
+        self.stdout.write(
+            f"{'backend':<8} {'reads/s':>9} {'writes/s':>9} {'locked':>7} {'other':>6}"
+        )
+        for mode in options["modes"]:
+            with tempfile.TemporaryDirectory() as directory:
+                result = self.run_mode(mode, Path(directory) / "bench.sqlite3", options)
+            self.stdout.write(
+                f"{mode:<8} {result['reads'] / options['duration']:>9.1f}"
+                f" {result['writes'] / options['duration']:>9.1f}"
+                f" {result['locked']:>7} {result['errors']:>6}"
+            )
+
+    def run_mode(self, mode, path, options):
+        env = dict(os.environ, SQLITE_TUNING=MODES[mode], SQLITE_PATH=str(path))
+        env.pop("DATABASE_URL", None)
+        manage = [sys.executable, str(settings.BASE_DIR / "manage.py")]
+
+        def run(*arguments, **kwargs):
+            return subprocess.Popen(
+                manage + list(arguments),
+                cwd=settings.BASE_DIR,
+                env=env,
+                stdout=subprocess.PIPE,
+                **kwargs,
+            )
+
+        for arguments in (["migrate", "-v0"], ["bench_sqlite", "--worker", "seed"]):
+            process = run(*arguments)
+            process.communicate()
+            if process.returncode:
+                raise RuntimeError(f"{' '.join(arguments)} failed for {mode}")
+
+        # Workers wait for a common start time so that Django start-up is not
+        # part of the measurement.
+        start_at = time.time() + 5
+        workers = [
+            run(
+                "bench_sqlite",
+                "--worker",
+                role,
+                "--start-at",
+                str(start_at),
+                "--duration",
+                str(options["duration"]),
+            )
+            for role, count in (
+                ("read", options["readers"]),
+                ("write", options["writers"]),
+            )
+            for _ in range(count)
+        ]
+        total = {"reads": 0, "writes": 0, "locked": 0, "errors": 0}
+        for worker in workers:
+            output, _ = worker.communicate()
+            for key, value in json.loads(
+                output.decode().strip().splitlines()[-1]
+            ).items():
+                total[key] += value
+        return total
+
+    def run_worker(self, options):
+        if options["worker"] == "seed":
+            book = Book.objects.create(title="Benchmark", summary="-", isbn="0")
+            BookInstance.objects.bulk_create(
+                BookInstance(
+                    book=book, imprint="Benchmark", status=random.choice("aom")
+                )
+                for _ in range(SAMPLE_COPIES)
+            )
+            return
+
+        copy_ids = list(BookInstance.objects.values_list("pk", flat=True))
+        time.sleep(max(0.0, options["start_at"] - time.time()))
+        deadline = time.time() + options["duration"]
+        result = {"reads": 0, "writes": 0, "locked": 0, "errors": 0}
+        operations = 0
+        while time.time() < deadline:
+            try:
+                if options["worker"] == "read":
+                    _read()
+                    result["reads"] += 1
+                else:
+                    if operations % 2:
+                        _write_session()
+                    else:
+                        _renew(copy_ids)
+                    result["writes"] += 1
+            except OperationalError as error:
+                result["locked" if _is_locked(error) else "errors"] += 1
+            operations += 1
+        self.stdout.write(json.dumps(result))
@@ -0,0 +1,162 @@
+"""Benchmark rendering of every catalog template.
+
+Usage::
+
+    python manage.py bench_templates --iterations 500
+
+Each template is rendered with the context its view would produce, once with
+the plain filesystem/app directories loaders (what DEBUG mode uses) and once
+with the cached loader (the production rendering mode). Sample data is
+created inside a transaction that is rolled back afterwards.
+"""
+
+import datetime
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template import Engine, RequestContext
+from django.template.backends.django import get_installed_libraries
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from catalog import branches
+from catalog.forms import RenewBookForm
+from catalog.models import Author, Book, BookInstance, Genre, Language
+
+LOADERS = [
+    "django.template.loaders.filesystem.Loader",
+    "django.template.loaders.app_directories.Loader",
+]
+
+
+class Command(BaseCommand):
+    help = "Benchmark rendering of every catalog template with and without the cached loader."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=200,
+            help="Number of renders per template and loader (default 200).",
+        )
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        engines = {
+            "uncached": self.make_engine(LOADERS),
+            "cached": self.make_engine(
+                [("django.template.loaders.cached.Loader", LOADERS)]
+            ),
+        }
+
+        self.stdout.write(
+            f"{'template':<50} {'uncached ms':>12} {'cached ms':>12} {'speedup':>8}"
+        )
+        with transaction.atomic():
+            for name, request, context in self.get_cases():
+                timings = {}
+                for mode, engine in engines.items():
+                    # Warm up, so that both modes are measured in steady state.
+                    engine.get_template(name).render(RequestContext(request, context))
+                    start = time.perf_counter()
+                    for _ in range(iterations):
+                        template = engine.get_template(name)
+                        template.render(RequestContext(request, context))
+                    timings[mode] = (time.perf_counter() - start) * 1000 / iterations
+                self.stdout.write(
+                    f"{name:<50} {timings['uncached']:>12.3f} {timings['cached']:>12.3f}"
+                    f" {timings['uncached'] / timings['cached']:>7.1f}x"
+                )
+            transaction.set_rollback(True)
+
+    def make_engine(self, loaders):
+        options = settings.TEMPLATES[0]
+        return Engine(
+            dirs=options["DIRS"],
+            loaders=loaders,
+            context_processors=options["OPTIONS"]["context_processors"],
+            libraries=get_installed_libraries(),
+        )
+
+    def create_sample_data(self):
+        librarian = User.objects.create_superuser(
+            "bench-librarian", "bench@example.com", "bench-password"
+        )
+        author = Author.objects.create(first_name="Bench", last_name="Author")
+        genre = Genre.objects.create(name="Bench Genre")
+        language = Language.objects.create(name="Bench Language")
+        for number in range(15):
+            book = Book.objects.create(
+                title=f"Bench Book {number}",
+                summary="A book created by the template benchmark.",
+                isbn=f"BENCH{number:08d}",
+                author=author,
+                language=language,
+            )
+            book.genre.add(genre)
+            for status in ("a", "o", "m"):
+                BookInstance.objects.create(
+                    book=book,
+                    imprint="Bench Imprint",
+                    status=status,
+                    borrower=librarian if status == "o" else None,
+                    due_back=datetime.date.today() + datetime.timedelta(weeks=1),
+                )
+        return librarian, author, book
+
+    def get_cases(self):
+        """Yield ``(template name, request, context)`` for every catalog template."""
+        librarian, author, book = self.create_sample_data()
+        factory = RequestFactory()
+
+        def make_request(url):
+            request = factory.get(url)
+            request.user = librarian
+            request.session = {}
+            return request
+
+        view_urls = [
+            reverse("books"),
+            reverse("book-detail", args=[book.pk]),
+            reverse("authors"),
+            reverse("author-detail", args=[author.pk]),
+            reverse("my-borrowed"),
+            reverse("all-borrowed"),
+            reverse("author-create"),
+            reverse("author-update", args=[author.pk]),
+            reverse("author-delete", args=[author.pk]),
+            reverse("book-create"),
+            reverse("book-update", args=[book.pk]),
+            reverse("book-delete", args=[book.pk]),
+        ]
+        for url in view_urls:
+            # Class-based views return an unrendered TemplateResponse, which
+            # gives us the exact template and context the view would use.
+            request = make_request(url)
+            match = resolve(url)
+            response = match.func(request, *match.args, **match.kwargs)
+            yield response.template_name[0], request, response.context_data
+
+        yield "index.html", make_request(reverse("index")), {
+            "num_books": Book.objects.count(),
+            "num_instances": BookInstance.objects.count(),
+            "num_instances_available": BookInstance.objects.filter(
+                status__exact="a"
+            ).count(),
+            "num_authors": Author.objects.count(),
+            "num_fiction_genres": 0,
+            "num_fiction_books": 0,
+            "num_books_with_contain": 0,
+            "num_visits": 1,
+            **branches.branch_context(None),
+        }
+
+        copy = BookInstance.objects.filter(status__exact="o").first()
+        url = reverse("renew-book-librarian", args=[copy.pk])
+        yield "catalog/book_renew_librarian.html", make_request(url), {
+            "form": RenewBookForm(initial={"renewal_date": copy.due_back}),
+            "book_instance": copy,
+        }
@@ -0,0 +1,35 @@
+"""Rebuild the "borrowers of this book also borrowed" recommendations.
+
+Usage::
+
+    python manage.py build_recommendations --top-k 10
+
+See catalog/recommendations.py for how the recommendations are computed.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import recommendations
+
+
+class Command(BaseCommand):
+    help = "Rebuild the precomputed book-to-book recommendations from borrower data."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top-k",
+            type=int,
+            default=recommendations.DEFAULT_TOP_K,
+            help="Number of recommendations to keep per book.",
+        )
+
+    def handle(self, *args, **options):
+        if options["top_k"] < 1:
+            raise CommandError("--top-k must be at least 1.")
+        start = time.perf_counter()
+        count = recommendations.build(top_k=options["top_k"])
+        self.stdout.write(
+            f"Stored {count} recommendations in {time.perf_counter() - start:.2f}s."
+        )
@@ -0,0 +1,44 @@
+"""Rebuild the "more like this" genre similarity index.
+
+Usage::
+
+    python manage.py build_similarities
+    python manage.py build_similarities --stale
+
+Genre changes keep the index up to date incrementally, except that changes to
+genres too large to refresh during a request only mark the changed books
+stale; run with ``--stale`` periodically (e.g. every few minutes) to refresh
+those. A full rebuild is only needed after loading data with signals bypassed
+(e.g. bulk imports or raw SQL). See catalog/recommendations.py for how
+similarity is computed.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalog import recommendations
+
+
+class Command(BaseCommand):
+    help = "Rebuild the precomputed genre similarity (more like this) table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--stale",
+            action="store_true",
+            help="Only refresh the books marked stale by large genre changes.",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options["stale"]:
+            count = recommendations.refresh_stale_similarities()
+            self.stdout.write(
+                f"Refreshed {count} stale books in {time.perf_counter() - start:.2f}s."
+            )
+            return
+        count = recommendations.build_similarities()
+        self.stdout.write(
+            f"Stored {count} similar books in {time.perf_counter() - start:.2f}s."
+        )
@@ -0,0 +1,215 @@
+"""Find, and optionally repair, inconsistent catalog data.
+
+Usage::
+
+    python manage.py check_catalog [--fix] [--workers 8] [--chunk-size 50000]
+
+Checks:
+
+- ``orphan_copies``: copies whose book was removed (``book`` is null).
+  Fixed by withdrawing them, so that archive_catalog moves them out.
+- ``books_without_author``: books whose author was deleted. Reported only.
+- ``loans_without_borrower``: copies "On loan" to nobody. Fixed by making
+  them available.
+- ``loans_without_due_date``: copies on loan without a due date. Fixed by
+  setting the usual three week loan period from today.
+- ``duplicate_isbns``: books whose ISBNs are equal once spaces, dashes and
+  case are ignored. Reported only, since merging books needs a librarian.
+
+Each table is split into primary key ranges of about ``--chunk-size`` rows
+(integer ranges, or equal slices of the UUID space for copies) that are
+checked by ``--workers`` processes in parallel. Each range is one indexed
+COUNT, so no rows are loaded into Python except for the ISBN check and the
+keys of copies that ``--fix`` changes, which go to the kiosk change feed.
+"""
+
+import datetime
+import os
+import re
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min, Q, UUIDField
+
+from catalog.caching import invalidate
+from catalog.changefeed import update_copies
+from catalog.models import Book, BookInstance
+
+SAMPLE_SIZE = 5
+LOAN_PERIOD = datetime.timedelta(weeks=3)
+
+
+def _loan_due_date():
+    return datetime.date.today() + LOAN_PERIOD
+
+
+# name -> (model, condition, fix or None). A fix is a function returning the
+# values for update(). Checks run in this order, so that later checks do not
+# report rows that an earlier fix already changed.
+CHECKS = {
+    "orphan_copies": (
+        BookInstance,
+        Q(book__isnull=True),
+        lambda: {"status": "w", "borrower": None, "due_back": None},
+    ),
+    "books_without_author": (Book, Q(author__isnull=True), None),
+    "loans_without_borrower": (
+        BookInstance,
+        Q(status="o", borrower__isnull=True),
+        lambda: {"status": "a", "due_back": None},
+    ),
+    "loans_without_due_date": (
+        BookInstance,
+        Q(status="o", borrower__isnull=False, due_back__isnull=True),
+        lambda: {"due_back": _loan_due_date()},
+    ),
+}
+DUPLICATE_ISBNS = "duplicate_isbns"
+
+
+def normalize_isbn(isbn):
+    return re.sub(r"[^0-9A-Z]", "", isbn.upper())
+
+
+def pk_ranges(model, chunk_size):
+    """Split ``model``'s primary keys into ``(lower, upper)`` ranges of about
+    ``chunk_size`` rows; ``upper`` is exclusive and ``None`` for the last."""
+    if isinstance(model._meta.pk, UUIDField):
+        # Random UUIDs are spread evenly, so equal slices of the UUID space
+        # hold about the same number of rows.
+        count = model.objects.count()
+        slices = max(1, -(-count // chunk_size))
+        step = 2**128 // slices
+        bounds = [uuid.UUID(int=index * step) for index in range(slices)]
+        return list(zip(bounds, bounds[1:] + [None]))
+    bounds = model.objects.aggregate(low=Min("pk"), high=Max("pk"))
+    if bounds["low"] is None:
+        return []
+    starts = list(range(bounds["low"], bounds["high"] + 1, chunk_size))
+    return list(zip(starts, starts[1:] + [None]))
+
+
+def _in_range(model, lower, upper):
+    queryset = model.objects.filter(pk__gte=lower)
+    return queryset if upper is None else queryset.filter(pk__lt=upper)
+
+
+def check_range(name, lower, upper, fix):
+    """Count (and fix) the violations of check ``name`` in one range.
+
+    Returns ``(count, fixed, sample primary keys)``.
+    """
+    model, condition, fixer = CHECKS[name]
+    violations = _in_range(model, lower, upper).filter(condition)
+    count = violations.count()
+    if not count:
+        return 0, 0, []
+    sample = [str(pk) for pk in violations.values_list("pk", flat=True)[:SAMPLE_SIZE]]
+    fixed = 0
+    if fix and fixer:
+        if model is BookInstance:
+            # Bumps the version and feeds kiosks (see catalog.changefeed).
+            fixed = update_copies(violations, **fixer())
+        else:
+            fixed = violations.update(**fixer())
+    return count, fixed, sample
+
+
+def isbn_range(lower, upper):
+    """Return ``(normalised ISBN, pk)`` for the books in one range."""
+    return [
+        (normalize_isbn(isbn), pk)
+        for pk, isbn in _in_range(Book, lower, upper).values_list("pk", "isbn")
+    ]
+
+
+def _worker_setup():
+    django.setup()
+    # Never share a database connection inherited from the parent.
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Check the catalog for inconsistent data in parallel, and optionally fix it."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix", action="store_true", help="Repair what can be repaired."
+        )
+        parser.add_argument("--workers", type=int, default=os.cpu_count())
+        parser.add_argument("--chunk-size", type=int, default=50000)
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        if workers < 1 or options["chunk_size"] < 1:
+            raise CommandError("--workers and --chunk-size must be at least 1.")
+        start = time.perf_counter()
+        ranges = {
+            model: pk_ranges(model, options["chunk_size"])
+            for model in (Book, BookInstance)
+        }
+
+        self.stdout.write(f"{'check':<24} {'found':>9} {'fixed':>9}  examples")
+        if workers == 1:
+            problems = self.run_checks(map, ranges, options["fix"])
+        else:
+            # The workers open their own connections.
+            connections.close_all()
+            with ProcessPoolExecutor(workers, initializer=_worker_setup) as pool:
+                problems = self.run_checks(pool.map, ranges, options["fix"])
+        if self.fixed:
+            # update() sends no signals; refresh the cached catalog data.
+            invalidate("books")
+        self.stdout.write(
+            f"{problems} problems left; checked in {time.perf_counter() - start:.2f}s."
+        )
+
+    def run_checks(self, map_ranges, ranges, fix):
+        """Run every check over its ranges with ``map_ranges`` (``map`` or a
+        process pool's ``map``); return the number of problems left."""
+        problems = 0
+        self.fixed = 0
+        for name, (model, _, fixer) in CHECKS.items():
+            lowers = [lower for lower, _ in ranges[model]]
+            uppers = [upper for _, upper in ranges[model]]
+            count = fixed = 0
+            sample = []
+            for range_count, range_fixed, range_sample in map_ranges(
+                check_range,
+                [name] * len(lowers),
+                lowers,
+                uppers,
+                [fix] * len(lowers),
+            ):
+                count += range_count
+                fixed += range_fixed
+                sample += range_sample
+            problems += count - fixed
+            self.fixed += fixed
+            self.report(name, count, fixed if fixer else "-", sample)
+
+        books_by_isbn = defaultdict(list)
+        for pairs in map_ranges(
+            isbn_range,
+            [lower for lower, _ in ranges[Book]],
+            [upper for _, upper in ranges[Book]],
+        ):
+            for isbn, pk in pairs:
+                books_by_isbn[isbn].append(pk)
+        duplicates = [pks for pks in books_by_isbn.values() if len(pks) > 1]
+        count = sum(len(pks) for pks in duplicates)
+        problems += count
+        self.report(
+            DUPLICATE_ISBNS, count, "-", ["/".join(map(str, pks)) for pks in duplicates]
+        )
+        return problems
+
+    def report(self, name, count, fixed, sample):
+        self.stdout.write(
+            f"{name:<24} {count:>9} {fixed:>9}  {', '.join(sample[:SAMPLE_SIZE])}"
+        )
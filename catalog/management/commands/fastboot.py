@@ -0,0 +1,83 @@
+"""Run the release steps that are needed before starting the web server.
+
+Usage (see Procfile)::
+
+    python manage.py fastboot && gunicorn --config gunicorn.conf.py
+
+gunicorn.conf.py picks the WSGI or ASGI application and the worker settings.
+
+``migrate`` is only run when the migration graph on disk has migrations that
+are not recorded as applied in the database, and ``collectstatic`` only when
+the hash of the static source files differs from the one recorded in
+STATIC_ROOT by the last collection. On a normal restart or scale-out both
+steps are skipped.
+"""
+
+import hashlib
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.finders import get_finders
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+
+STATIC_HASH_FILE = ".static-sources.sha256"
+
+
+def pending_migrations(database=DEFAULT_DB_ALIAS):
+    """Return the migrations on disk that have not been applied yet."""
+    executor = MigrationExecutor(connections[database])
+    targets = executor.loader.graph.leaf_nodes()
+    return [migration for migration, _ in executor.migration_plan(targets)]
+
+
+def static_sources_hash():
+    """Return a hash of the paths and contents of all static source files."""
+    files = {}
+    for finder in get_finders():
+        for path, storage in finder.list(["CVS", ".*", "*~"]):
+            # The first finder to provide a path wins, as in collectstatic.
+            files.setdefault(path, storage)
+    digest = hashlib.sha256()
+    for path in sorted(files):
+        digest.update(path.encode())
+        with files[path].open(path) as source:
+            digest.update(hashlib.sha256(source.read()).digest())
+    return digest.hexdigest()
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply migrations and collect static files, skipping steps with nothing to do."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Run migrate and collectstatic even if nothing changed.",
+        )
+
+    def handle(self, *args, **options):
+        force = options["force"]
+
+        pending = pending_migrations()
+        if pending or force:
+            self.stdout.write(f"{len(pending)} migration(s) to apply.")
+            call_command("migrate", interactive=False, verbosity=options["verbosity"])
+        else:
+            self.stdout.write("Migrations are up to date, skipping migrate.")
+
+        static_root = Path(settings.STATIC_ROOT)
+        hash_file = static_root / STATIC_HASH_FILE
+        sources_hash = static_sources_hash()
+        recorded = hash_file.read_text().strip() if hash_file.exists() else None
+        if recorded != sources_hash or force:
+            call_command(
+                "collectstatic", interactive=False, verbosity=options["verbosity"]
+            )
+            hash_file.write_text(sources_hash)
+        else:
+            self.stdout.write("Static files are up to date, skipping collectstatic.")
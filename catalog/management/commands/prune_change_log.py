@@ -0,0 +1,20 @@
+"""Delete old entries of the kiosk change log.
+
+Usage::
+
+    python manage.py prune_change_log
+
+Entries of CopyStatusChange older than ``CATALOG_STREAM_LOG_RETENTION`` hours
+are deleted. Run it periodically (e.g. hourly). See catalog/changefeed.py.
+"""
+
+from django.core.management.base import BaseCommand
+
+from catalog import changefeed
+
+
+class Command(BaseCommand):
+    help = "Delete kiosk change log entries past the retention period."
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Pruned {changefeed.prune()} change log entries.")
@@ -0,0 +1,27 @@
+"""Recompute the per-author totals shown on the author pages.
+
+Usage::
+
+    python manage.py rebuild_author_stats
+
+Saves, deletions and update_copies() keep AuthorStats up to date
+incrementally; a full rebuild is only needed after loading data with signals
+bypassed (e.g. bulk imports or raw SQL). See catalog/authors.py.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalog import authors
+
+
+class Command(BaseCommand):
+    help = "Recompute the AuthorStats table (titles, copies and loans per author)."
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = authors.rebuild()
+        self.stdout.write(
+            f"Stored stats for {count} authors in {time.perf_counter() - start:.2f}s."
+        )
@@ -0,0 +1,273 @@
+"""In-process metrics with a Prometheus text endpoint.
+
+Collected per URL name (from ``request.resolver_match``):
+
+- request latency histogram
+- number of database queries and time spent in the database
+
+and globally:
+
+- cache hits and misses of the catalog caches (page, facets, refdata, ...)
+- session writes
+
+Each process keeps its metrics in memory and, at most once per
+``FLUSH_INTERVAL`` seconds, writes them to ``<CATALOG_METRICS_DIR>/<pid>.json``.
+The ``/metrics`` view sums the files of all processes, so the numbers are
+correct under multi-process gunicorn. Files of processes that have exited are
+folded into ``archive.json`` so that counters never go backwards.
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FLUSH_INTERVAL = 1.0
+ARCHIVE = "archive.json"
+
+_lock = threading.Lock()
+_last_flush = 0.0
+
+
+def _empty_state():
+    return {
+        # view -> bucket counts (one per bucket plus +Inf), sum, count
+        "latency": {},
+        "queries": {},
+        "db_time": {},
+        # "cache:result" -> count
+        "cache": {},
+        "session_writes": 0,
+    }
+
+
+_state = _empty_state()
+
+
+def reset():
+    """Forget this process's metrics.
+
+    Gunicorn calls it in each worker after the fork (see gunicorn.conf.py), as
+    workers would otherwise inherit, and all report, what the master recorded
+    while preloading the application.
+    """
+    global _last_flush
+    with _lock:
+        _state.clear()
+        _state.update(_empty_state())
+        _last_flush = 0.0
+
+
+def record_request(view, duration, queries, db_time, session_written):
+    """Record one request (called by MetricsMiddleware)."""
+    with _lock:
+        latency = _state["latency"].setdefault(view, [0] * (len(BUCKETS) + 3))
+        latency[bisect_left(BUCKETS, duration)] += 1
+        latency[-2] += duration
+        latency[-1] += 1
+        _state["queries"][view] = _state["queries"].get(view, 0) + queries
+        _state["db_time"][view] = _state["db_time"].get(view, 0.0) + db_time
+        if session_written:
+            _state["session_writes"] += 1
+    _maybe_flush()
+
+
+def record_cache(cache_name, result, count=1):
+    """Count ``count`` lookups with ``result`` ("hit", "miss", "stale") in a cache."""
+    key = f"{cache_name}:{result}"
+    with _lock:
+        _state["cache"][key] = _state["cache"].get(key, 0) + count
+
+
+def _metrics_dir():
+    path = Path(settings.CATALOG_METRICS_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _write_json(path, data):
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, path)
+
+
+def flush():
+    """Write this process's metrics to its file in the metrics directory."""
+    global _last_flush
+    with _lock:
+        data = json.loads(json.dumps(_state))
+        _last_flush = time.monotonic()
+    _write_json(_metrics_dir() / f"{os.getpid()}.json", data)
+
+
+def _maybe_flush():
+    if time.monotonic() - _last_flush >= FLUSH_INTERVAL:
+        flush()
+
+
+def _merge(total, data):
+    for view, values in data["latency"].items():
+        current = total["latency"].setdefault(view, [0] * len(values))
+        for index, value in enumerate(values):
+            current[index] += value
+    for name in ("queries", "db_time", "cache"):
+        for key, value in data[name].items():
+            total[name][key] = total[name].get(key, 0) + value
+    total["session_writes"] += data["session_writes"]
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect():
+    """Return the metrics of all processes, summed."""
+    directory = _metrics_dir()
+    total = _empty_state()
+    with open(directory / ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        archive_path = directory / ARCHIVE
+        archive = (
+            json.loads(archive_path.read_text())
+            if archive_path.exists()
+            else _empty_state()
+        )
+        archived = False
+        for path in directory.glob("*.json"):
+            if not path.stem.isdigit():
+                continue
+            try:
+                data = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            if _is_alive(int(path.stem)):
+                _merge(total, data)
+            else:
+                _merge(archive, data)
+                path.unlink()
+                archived = True
+        if archived:
+            _write_json(archive_path, archive)
+    _merge(total, archive)
+    return total
+
+
+def _labels(**labels):
+    pairs = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def render(data):
+    """Render metrics in the Prometheus text exposition format."""
+    lines = [
+        "# HELP catalog_request_duration_seconds Request latency by URL name.",
+        "# TYPE catalog_request_duration_seconds histogram",
+    ]
+    for view, values in sorted(data["latency"].items()):
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ("+Inf",), values):
+            cumulative += count
+            lines.append(
+                f"catalog_request_duration_seconds_bucket{_labels(view=view, le=bound)} {cumulative}"
+            )
+        lines.append(
+            f"catalog_request_duration_seconds_sum{_labels(view=view)} {values[-2]}"
+        )
+        lines.append(
+            f"catalog_request_duration_seconds_count{_labels(view=view)} {values[-1]}"
+        )
+
+    lines += [
+        "# HELP catalog_db_queries_total Database queries by URL name.",
+        "# TYPE catalog_db_queries_total counter",
+    ]
+    for view, value in sorted(data["queries"].items()):
+        lines.append(f"catalog_db_queries_total{_labels(view=view)} {value}")
+
+    lines += [
+        "# HELP catalog_db_time_seconds_total Time spent in the database by URL name.",
+        "# TYPE catalog_db_time_seconds_total counter",
+    ]
+    for view, value in sorted(data["db_time"].items()):
+        lines.append(f"catalog_db_time_seconds_total{_labels(view=view)} {value}")
+
+    lines += [
+        "# HELP catalog_cache_lookups_total Catalog cache lookups by cache and result.",
+        "# TYPE catalog_cache_lookups_total counter",
+    ]
+    for key, value in sorted(data["cache"].items()):
+        cache_name, result = key.split(":", 1)
+        lines.append(
+            f"catalog_cache_lookups_total{_labels(cache=cache_name, result=result)} {value}"
+        )
+
+    lines += [
+        "# HELP catalog_session_writes_total Requests that saved the session.",
+        "# TYPE catalog_session_writes_total counter",
+        f"catalog_session_writes_total {data['session_writes']}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    """Expose the metrics of all processes for Prometheus.
+
+    The request must send ``CATALOG_METRICS_TOKEN`` as ``Authorization:
+    Bearer <token>``. Without a token the endpoint is only open in DEBUG mode.
+    """
+    token = settings.CATALOG_METRICS_TOKEN
+    if not token and not settings.DEBUG:
+        return HttpResponseForbidden()
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponseForbidden()
+    flush()
+    return HttpResponse(
+        render(collect()), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+class MetricsMiddleware:
+    """Times each request and counts its database queries.
+
+    Put it first in MIDDLEWARE so that the latency covers the whole stack.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        db = {"queries": 0, "time": 0.0}
+
+        def timer(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                db["queries"] += 1
+                db["time"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = getattr(request, "resolver_match", None)
+        view = (match.url_name or match.view_name) if match else "<unresolved>"
+        session = getattr(request, "session", None)
+        session_written = bool(session is not None and session.modified)
+        record_request(view, duration, db["queries"], db["time"], session_written)
+        return response
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.3 on 2026-10-19 15:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("catalog", "0005_author_book_name_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProfileReport",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        help_text="Request id, also returned in the X-Profile-Id header",
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("method", models.CharField(max_length=10)),
+                ("path", models.CharField(max_length=2000)),
+                ("status_code", models.PositiveSmallIntegerField()),
+                ("duration_ms", models.FloatField(verbose_name="duration (ms)")),
+                (
+                    "samples",
+                    models.PositiveIntegerField(
+                        help_text="Number of stack samples taken"
+                    ),
+                ),
+                (
+                    "collapsed_stacks",
+                    models.TextField(
+                        help_text="Sampled stacks in collapsed format (flamegraph.pl, speedscope)"
+                    ),
+                ),
+                ("function_stats", models.TextField(help_text="cProfile statistics")),
+                (
+                    "top_allocations",
+                    models.TextField(help_text="Top allocations from tracemalloc"),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-created"],
+            },
+        ),
+    ]
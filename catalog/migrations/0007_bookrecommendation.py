@@ -0,0 +1,55 @@
+# Generated by Django 4.2.3 on 2026-10-19 15:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0006_profilereport"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookRecommendation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("score", models.FloatField()),
+                ("rank", models.PositiveSmallIntegerField()),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="recommendations",
+                        to="catalog.book",
+                    ),
+                ),
+                (
+                    "recommended",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="catalog.book",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["book", "rank"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="bookrecommendation",
+            constraint=models.UniqueConstraint(
+                fields=("book", "rank"), name="unique_book_recommendation_rank"
+            ),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.3 on 2026-10-19 15:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0007_bookrecommendation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookSimilarity",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("score", models.FloatField()),
+                ("rank", models.PositiveSmallIntegerField()),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="similar",
+                        to="catalog.book",
+                    ),
+                ),
+                (
+                    "similar",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="catalog.book",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "book similarities",
+                "ordering": ["book", "rank"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="booksimilarity",
+            constraint=models.UniqueConstraint(
+                fields=("book", "rank"), name="unique_book_similarity_rank"
+            ),
+        ),
+    ]
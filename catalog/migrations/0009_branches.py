@@ -0,0 +1,92 @@
+# Generated by Django 4.2.3 on 2026-10-19 15:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("catalog", "0008_booksimilarity"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Branch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=200, unique=True)),
+                ("address", models.TextField(blank=True)),
+            ],
+            options={
+                "verbose_name_plural": "branches",
+                "ordering": ["name"],
+            },
+        ),
+        migrations.CreateModel(
+            name="Patron",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="bookinstance",
+            name="branch",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Branch that holds this copy",
+                null=True,
+                on_delete=django.db.models.deletion.RESTRICT,
+                to="catalog.branch",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bookinstance",
+            index=models.Index(
+                fields=["branch", "status", "due_back"], name="copy_branch_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bookinstance",
+            index=models.Index(fields=["branch", "book"], name="copy_branch_book_idx"),
+        ),
+        migrations.AddField(
+            model_name="patron",
+            name="branch",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Home branch, used as the default branch for this user",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="patrons",
+                to="catalog.branch",
+            ),
+        ),
+        migrations.AddField(
+            model_name="patron",
+            name="user",
+            field=models.OneToOneField(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="patron",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
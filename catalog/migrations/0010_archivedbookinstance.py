@@ -0,0 +1,89 @@
+# Generated by Django 4.2.3 on 2026-10-19 15:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("catalog", "0009_branches"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="bookinstance",
+            name="status",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("m", "Maintenance"),
+                    ("o", "On loan"),
+                    ("a", "Available"),
+                    ("r", "Reserved"),
+                    ("w", "Withdrawn"),
+                ],
+                default="m",
+                help_text="Book availability",
+                max_length=1,
+            ),
+        ),
+        migrations.CreateModel(
+            name="ArchivedBookInstance",
+            fields=[
+                ("id", models.UUIDField(primary_key=True, serialize=False)),
+                ("title", models.CharField(max_length=200)),
+                ("imprint", models.CharField(max_length=200)),
+                ("due_back", models.DateField(blank=True, null=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("m", "Maintenance"),
+                            ("o", "On loan"),
+                            ("a", "Available"),
+                            ("r", "Reserved"),
+                            ("w", "Withdrawn"),
+                        ],
+                        max_length=1,
+                    ),
+                ),
+                ("archived", models.DateTimeField(auto_now_add=True)),
+                (
+                    "book",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="catalog.book",
+                    ),
+                ),
+                (
+                    "borrower",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "branch",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="catalog.branch",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-archived"],
+            },
+        ),
+    ]
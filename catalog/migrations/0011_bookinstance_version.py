@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-19 15:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0010_archivedbookinstance"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bookinstance",
+            name="version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
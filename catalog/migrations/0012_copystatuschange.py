@@ -0,0 +1,47 @@
+# Generated by Django 4.2.3 on 2026-10-19 15:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0011_bookinstance_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CopyStatusChange",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("created", models.DateTimeField(auto_now_add=True, db_index=True)),
+                ("copy_id", models.UUIDField()),
+                (
+                    "status",
+                    models.CharField(
+                        blank=True,
+                        help_text="New status; empty when the copy was removed",
+                        max_length=1,
+                    ),
+                ),
+                ("due_back", models.DateField(blank=True, null=True)),
+                (
+                    "book",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="catalog.book",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["id"],
+                "indexes": [
+                    models.Index(fields=["book", "id"], name="copy_change_book_idx")
+                ],
+            },
+        ),
+    ]
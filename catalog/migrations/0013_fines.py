@@ -0,0 +1,153 @@
+# Generated by Django 4.2.3 on 2026-10-19 15:47
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("catalog", "0012_copystatuschange"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FineBalance",
+            fields=[
+                (
+                    "borrower",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="fine_balance",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("balance", models.DecimalField(decimal_places=2, max_digits=10)),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="FineRate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("daily_rate", models.DecimalField(decimal_places=2, max_digits=6)),
+                (
+                    "maximum",
+                    models.DecimalField(
+                        blank=True,
+                        decimal_places=2,
+                        help_text="Cap on the fine for one loan (empty for no cap)",
+                        max_digits=8,
+                        null=True,
+                    ),
+                ),
+                (
+                    "genre",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="catalog.genre",
+                    ),
+                ),
+                (
+                    "language",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="catalog.language",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="Fine",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("copy_id", models.UUIDField()),
+                ("due_back", models.DateField()),
+                ("days_overdue", models.PositiveIntegerField()),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=8)),
+                (
+                    "paid",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=8),
+                ),
+                (
+                    "assessed",
+                    models.DateField(help_text="Date the amount was last computed"),
+                ),
+                (
+                    "book",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="catalog.book",
+                    ),
+                ),
+                (
+                    "borrower",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="fines",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-due_back"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="finerate",
+            constraint=models.CheckConstraint(
+                check=models.Q(
+                    ("genre__isnull", True), ("language__isnull", True), _connector="OR"
+                ),
+                name="fine_rate_genre_or_language",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="finerate",
+            constraint=models.UniqueConstraint(
+                fields=("genre",), name="fine_rate_unique_genre"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="finerate",
+            constraint=models.UniqueConstraint(
+                fields=("language",), name="fine_rate_unique_language"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="fine",
+            constraint=models.UniqueConstraint(
+                fields=("copy_id", "due_back", "borrower"), name="fine_unique_loan"
+            ),
+        ),
+    ]
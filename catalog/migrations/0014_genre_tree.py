@@ -0,0 +1,81 @@
+# Generated by Django 4.2.3 on 2026-10-19 15:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def add_genre_self_links(apps, schema_editor):
+    # Existing genres are all roots: each is only its own ancestor.
+    Genre = apps.get_model("catalog", "Genre")
+    GenreClosure = apps.get_model("catalog", "GenreClosure")
+    GenreClosure.objects.bulk_create(
+        GenreClosure(ancestor_id=pk, descendant_id=pk, depth=0)
+        for pk in Genre.objects.values_list("pk", flat=True)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0013_fines"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="genre",
+            name="parent",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Broader genre this one belongs to (e.g. Fiction for Fantasy)",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="children",
+                to="catalog.genre",
+            ),
+        ),
+        migrations.CreateModel(
+            name="GenreClosure",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("depth", models.PositiveIntegerField()),
+                (
+                    "ancestor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="descendant_links",
+                        to="catalog.genre",
+                    ),
+                ),
+                (
+                    "descendant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ancestor_links",
+                        to="catalog.genre",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["descendant", "ancestor"], name="genre_closure_desc_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="genreclosure",
+            constraint=models.UniqueConstraint(
+                fields=("ancestor", "descendant"), name="genre_closure_unique"
+            ),
+        ),
+        migrations.RunPython(add_genre_self_links, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.3 on 2026-10-19 15:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0014_genre_tree"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AuthorStats",
+            fields=[
+                (
+                    "author",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="catalog.author",
+                    ),
+                ),
+                ("num_titles", models.IntegerField(default=0)),
+                ("num_copies", models.IntegerField(default=0)),
+                (
+                    "num_loans",
+                    models.IntegerField(default=0, help_text="Copies now on loan"),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["author", "title"], name="book_author_title_idx"
+            ),
+        ),
+    ]
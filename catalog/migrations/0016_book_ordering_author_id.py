@@ -0,0 +1,17 @@
+# Generated by Django 4.2.3 on 2026-10-19 16:01
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0015_author_stats"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="book",
+            options={"ordering": ["title", "author_id"]},
+        ),
+    ]
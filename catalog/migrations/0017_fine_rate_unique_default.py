@@ -0,0 +1,33 @@
+# Generated by Django 4.2.3 on 2026-10-19 16:19
+
+from django.db import migrations, models
+import django.db.models.functions.comparison
+
+
+def keep_latest_default_rate(apps, schema_editor):
+    # Before the constraint, several default rates could exist; the newest wins.
+    FineRate = apps.get_model("catalog", "FineRate")
+    defaults = FineRate.objects.filter(genre=None, language=None).order_by("-pk")
+    latest = defaults.values_list("pk", flat=True).first()
+    defaults.exclude(pk=latest).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0016_book_ordering_author_id"),
+    ]
+
+    operations = [
+        migrations.RunPython(keep_latest_default_rate, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="finerate",
+            constraint=models.UniqueConstraint(
+                django.db.models.functions.comparison.Coalesce(
+                    "genre", models.Value(0)
+                ),
+                condition=models.Q(("genre__isnull", True), ("language__isnull", True)),
+                name="fine_rate_unique_default",
+            ),
+        ),
+    ]
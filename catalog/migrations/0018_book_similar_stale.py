@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-19 16:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0017_fine_rate_unique_default"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="similar_stale",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.3 on 2026-10-19 16:37
+
+from django.db import migrations, models
+
+
+def mark_default_rate(apps, schema_editor):
+    FineRate = apps.get_model("catalog", "FineRate")
+    FineRate.objects.filter(genre=None, language=None).update(is_default=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0018_book_similar_stale"),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name="finerate",
+            name="fine_rate_unique_default",
+        ),
+        migrations.AddField(
+            model_name="finerate",
+            name="is_default",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(mark_default_rate, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="finerate",
+            constraint=models.CheckConstraint(
+                check=models.Q(
+                    models.Q(
+                        ("genre__isnull", True),
+                        ("is_default", True),
+                        ("language__isnull", True),
+                    ),
+                    models.Q(("genre__isnull", False), ("is_default", False)),
+                    models.Q(("is_default", False), ("language__isnull", False)),
+                    _connector="OR",
+                ),
+                name="fine_rate_is_default",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="finerate",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("is_default", True)),
+                fields=("is_default",),
+                name="fine_rate_unique_default",
+            ),
+        ),
+    ]
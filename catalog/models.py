@@ -1,5 +1,10 @@
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+
+from . import refdata
 
 # Create your models here.
 
@@ -15,12 +20,61 @@ class Genre(models.Model):
         max_length=200,
         help_text="Enter a book genre (e.g. Science Fiction, French Poetry etc.)",
     )
+    parent = models.ForeignKey(
+        "self",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="children",
+        help_text="Broader genre this one belongs to (e.g. Fiction for Fantasy)",
+    )
+
+    def clean(self):
+        """Reject a parent that would make the genre its own ancestor."""
+        if self.parent_id is not None and self.pk is not None:
+            if GenreClosure.objects.filter(
+                ancestor_id=self.pk, descendant_id=self.parent_id
+            ).exists():
+                raise ValidationError(
+                    {"parent": "A genre cannot be placed under its own subgenre."}
+                )
 
     def __str__(self):
         """String for representing the Model object (in Admin site etc.)"""
         return self.name
 
 
+class GenreClosure(models.Model):
+    """Model representing one ancestor/descendant pair of the genre tree,
+    including each genre paired with itself (depth 0). Maintained by
+    catalog.genres."""
+
+    ancestor = models.ForeignKey(
+        Genre, on_delete=models.CASCADE, related_name="descendant_links"
+    )
+    descendant = models.ForeignKey(
+        Genre, on_delete=models.CASCADE, related_name="ancestor_links"
+    )
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["ancestor", "descendant"], name="genre_closure_unique"
+            ),
+        ]
+        indexes = [
+            # Subtree membership of a book's genre: descendant -> ancestors.
+            models.Index(
+                fields=["descendant", "ancestor"], name="genre_closure_desc_idx"
+            ),
+        ]
+
+    def __str__(self):
+        """String for representing the Model object."""
+        return f"{self.ancestor_id} > {self.descendant_id} ({self.depth})"
+
+
 class Language(models.Model):
     """Model representing a Language (e.g. English, French, Japanese, etc.)"""
 
@@ -44,6 +98,14 @@ class Author(models.Model):
 
     class Meta:
         ordering = ["last_name", "first_name"]
+        indexes = [
+            # Match Meta.ordering so list pages read the index instead of sorting.
+            models.Index(fields=["last_name", "first_name"], name="author_name_idx"),
+            # Case-insensitive variant used by the A-Z browse on AuthorListView.
+            models.Index(
+                Lower("last_name"), Lower("first_name"), name="author_name_lower_idx"
+            ),
+        ]
 
     def get_absolute_url(self):
         """Returns the url to access a particular author instance."""
@@ -73,13 +135,33 @@ class Book(models.Model):
     genre = models.ManyToManyField(Genre, help_text="Select a genre for this book")
     # ManyToManyField used because a genre can contain many books and a Book can cover many genres.
     language = models.ForeignKey(Language, on_delete=models.SET_NULL, null=True)
+    # Set when a genre change touched too many books to refresh the "more like
+    # this" lists during the request; build_similarities --stale catches up.
+    similar_stale = models.BooleanField(default=False, editable=False)
 
     class Meta:
-        ordering = ["title", "author"]
+        ordering = ["title", "author_id"]
+        indexes = [
+            # Match Meta.ordering (on the author_id column, so no join to Author)
+            # so list pages read the index instead of sorting.
+            models.Index(fields=["title", "author"], name="book_title_idx"),
+            # Case-insensitive variant used by the A-Z browse on BookListView.
+            models.Index(Lower("title"), name="book_title_lower_idx"),
+            # An author's bibliography, in title order (AuthorDetailView).
+            models.Index(fields=["author", "title"], name="book_author_title_idx"),
+        ]
+
+    def genre_names(self):
+        """Returns the names of this book's genres, from the reference data cache."""
+        names = refdata.genres()
+        genre_ids = Book.genre.through.objects.filter(book_id=self.pk).values_list(
+            "genre_id", flat=True
+        )
+        return [names[genre_id] for genre_id in genre_ids if genre_id in names]
 
     def display_genre(self):
         """Creates a string for the Genre. This is required to display genre in Admin."""
-        return ", ".join([genre.name for genre in self.genre.all()[:3]])
+        return ", ".join(self.genre_names()[:3])
 
     display_genre.short_description = "Genre"
 
@@ -92,8 +174,41 @@ class Book(models.Model):
         return self.title
 
 
+class Branch(models.Model):
+    """Model representing a library branch, where copies are shelved and
+    patrons are registered."""
+
+    name = models.CharField(max_length=200, unique=True)
+    address = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ["name"]
+        verbose_name_plural = "branches"
+
+    def __str__(self):
+        """String for representing the Model object."""
+        return self.name
+
+
+class ConcurrentUpdateError(Exception):
+    """Raised when saving a BookInstance that someone else changed since it
+    was loaded."""
+
+
 class BookInstance(models.Model):
-    """Model representing a specific copy of a book (i.e. that can be borrowed from the library)."""
+    """Model representing a specific copy of a book (i.e. that can be borrowed from the library).
+
+    Saves use optimistic concurrency control: ``version`` is incremented by
+    every update, and an update only applies if the row still has the
+    version the instance was loaded with (``UPDATE ... WHERE version = n``).
+    Otherwise ConcurrentUpdateError is raised, instead of silently overwriting
+    the other change. Like IntegrityError, it must be caught outside an
+    ``atomic()`` block around the save if the transaction is to continue.
+
+    A save only writes the fields that changed since the instance was loaded
+    (or refreshed). Bulk ``update()`` calls must also set
+    ``version=F("version") + 1``.
+    """
 
     id = models.UUIDField(
         primary_key=True,
@@ -104,6 +219,78 @@ class BookInstance(models.Model):
     imprint = models.CharField(max_length=200)
     due_back = models.DateField(null=True, blank=True)
     borrower = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    branch = models.ForeignKey(
+        Branch,
+        on_delete=models.RESTRICT,
+        null=True,
+        blank=True,
+        help_text="Branch that holds this copy",
+    )
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance._field_values()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using, fields)
+        # The reloaded values are what later saves compare against.
+        values = self._field_values()
+        if fields is not None:
+            attnames = {self._meta.get_field(name).attname for name in fields}
+            values = {name: value for name, value in values.items() if name in attnames}
+        self._loaded_values = {**getattr(self, "_loaded_values", {}), **values}
+
+    def _field_values(self):
+        return {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname in self.__dict__
+        }
+
+    def changed_fields(self):
+        """Returns the names of the fields changed since the copy was loaded."""
+        loaded = getattr(self, "_loaded_values", {})
+        return [
+            name
+            for name, value in self._field_values().items()
+            if name in loaded and loaded[name] != value
+        ]
+
+    def save(self, *args, **kwargs):
+        loaded = getattr(self, "_loaded_values", None)
+        if loaded is not None and not self._state.adding:
+            if kwargs.get("update_fields") is None and not kwargs.get("force_insert"):
+                kwargs["update_fields"] = self.changed_fields()
+        super().save(*args, **kwargs)
+        self._loaded_values = self._field_values()
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        version = self._meta.get_field("version")
+        values = [value for value in values if value[0] is not version]
+        if update_fields is not None and not values:
+            # Nothing changed: nothing to write and nothing to conflict with.
+            return True
+        values.append((version, None, F("version") + 1))
+        updated = super()._do_update(
+            base_qs.filter(version=self.version),
+            using,
+            pk_val,
+            values,
+            update_fields,
+            forced_update,
+        )
+        if not updated:
+            if base_qs.filter(pk=pk_val).exists():
+                raise ConcurrentUpdateError(
+                    f"Copy {pk_val} was changed by someone else; reload and try again."
+                )
+            # The row is gone: let save() insert it, as it would without versions.
+            return False
+        self.version += 1
+        return True
 
     @property
     def is_overdue(self):
@@ -115,6 +302,8 @@ class BookInstance(models.Model):
         ("o", "On loan"),
         ("a", "Available"),
         ("r", "Reserved"),
+        # Retired copies; moved to ArchivedBookInstance by archive_catalog.
+        ("w", "Withdrawn"),
     )
 
     status = models.CharField(
@@ -128,7 +317,297 @@ class BookInstance(models.Model):
     class Meta:
         ordering = ["due_back"]
         permissions = (("can_mark_returned", "Set book as returned"),)
+        # Per-branch queries (counts, loans, a book's copies) read only their
+        # branch's slice of these indexes.
+        indexes = [
+            models.Index(
+                fields=["branch", "status", "due_back"], name="copy_branch_status_idx"
+            ),
+            models.Index(fields=["branch", "book"], name="copy_branch_book_idx"),
+        ]
 
     def __str__(self):
         """String for representing the Model object."""
         return f"{self.id}, ({self.book.title})"
+
+
+class ArchivedBookInstance(models.Model):
+    """Model representing a copy that was withdrawn and moved out of the
+    BookInstance table by the archive_catalog command.
+
+    The title is copied too, so the row stays readable if the book is deleted.
+    """
+
+    id = models.UUIDField(primary_key=True)
+    book = models.ForeignKey(
+        Book, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    title = models.CharField(max_length=200)
+    imprint = models.CharField(max_length=200)
+    due_back = models.DateField(null=True, blank=True)
+    borrower = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    branch = models.ForeignKey(
+        Branch, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    status = models.CharField(max_length=1, choices=BookInstance.LOAN_STATUS)
+    archived = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-archived"]
+
+    def __str__(self):
+        """String for representing the Model object."""
+        return f"{self.id}, ({self.title})"
+
+
+class Patron(models.Model):
+    """Model representing the library details of a user: their home branch."""
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="patron")
+    branch = models.ForeignKey(
+        Branch,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="patrons",
+        help_text="Home branch, used as the default branch for this user",
+    )
+
+    def __str__(self):
+        """String for representing the Model object."""
+        return str(self.user)
+
+
+class ProfileReport(models.Model):
+    """Model representing a profile of one request, taken on demand by staff
+    (see catalog.profiling.ProfilingMiddleware)."""
+
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        help_text="Request id, also returned in the X-Profile-Id header",
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2000)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField("duration (ms)")
+    samples = models.PositiveIntegerField(help_text="Number of stack samples taken")
+    collapsed_stacks = models.TextField(
+        help_text="Sampled stacks in collapsed format (flamegraph.pl, speedscope)"
+    )
+    function_stats = models.TextField(help_text="cProfile statistics")
+    top_allocations = models.TextField(help_text="Top allocations from tracemalloc")
+
+    class Meta:
+        ordering = ["-created"]
+
+    def __str__(self):
+        """String for representing the Model object."""
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+
+class BookRecommendation(models.Model):
+    """Model representing a precomputed "borrowers of this book also borrowed"
+    neighbour of a book (built by the build_recommendations command)."""
+
+    book = models.ForeignKey(
+        Book, on_delete=models.CASCADE, related_name="recommendations"
+    )
+    recommended = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ["book", "rank"]
+        constraints = [
+            # Also the index used to read a book's recommendations in rank order.
+            models.UniqueConstraint(
+                fields=["book", "rank"], name="unique_book_recommendation_rank"
+            ),
+        ]
+
+    def __str__(self):
+        """String for representing the Model object."""
+        return f"{self.book} -> {self.recommended} ({self.score:.2f})"
+
+
+class BookSimilarity(models.Model):
+    """Model representing a precomputed "more like this" neighbour of a book,
+    by Jaccard similarity of their genres."""
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="similar")
+    similar = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ["book", "rank"]
+        verbose_name_plural = "book similarities"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["book", "rank"], name="unique_book_similarity_rank"
+            ),
+        ]
+
+    def __str__(self):
+        """String for representing the Model object."""
+        return f"{self.book} ~ {self.similar} ({self.score:.2f})"
+
+
+class CopyStatusChange(models.Model):
+    """Model representing one change of a copy's status or due date, in the
+    change log streamed to kiosks (see catalog.changefeed)."""
+
+    # Also the event id clients resume from.
+    id = models.BigAutoField(primary_key=True)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Not a foreign key: the entry must outlive the copy (deletion, archive).
+    copy_id = models.UUIDField()
+    book = models.ForeignKey(
+        Book, on_delete=models.CASCADE, null=True, blank=True, related_name="+"
+    )
+    status = models.CharField(
+        max_length=1,
+        blank=True,
+        help_text="New status; empty when the copy was removed",
+    )
+    due_back = models.DateField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["book", "id"], name="copy_change_book_idx"),
+        ]
+
+    def __str__(self):
+        """String for representing the Model object."""
+        return f"{self.copy_id}: {self.status or 'removed'}"
+
+
+class FineRate(models.Model):
+    """Model representing the daily fine for overdue copies of books in a
+    genre or a language, or the default rate (neither set)."""
+
+    genre = models.ForeignKey(
+        Genre, on_delete=models.CASCADE, null=True, blank=True, related_name="+"
+    )
+    language = models.ForeignKey(
+        Language, on_delete=models.CASCADE, null=True, blank=True, related_name="+"
+    )
+    daily_rate = models.DecimalField(max_digits=6, decimal_places=2)
+    maximum = models.DecimalField(
+        max_digits=8,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        help_text="Cap on the fine for one loan (empty for no cap)",
+    )
+    # Set from genre and language by clean() and save(). NULLs are distinct in
+    # the unique constraints on those, so this is what keeps the default rate
+    # single.
+    is_default = models.BooleanField(default=False, editable=False)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(genre__isnull=True) | models.Q(language__isnull=True),
+                name="fine_rate_genre_or_language",
+            ),
+            models.CheckConstraint(
+                check=models.Q(
+                    is_default=True, genre__isnull=True, language__isnull=True
+                )
+                | models.Q(is_default=False, genre__isnull=False)
+                | models.Q(is_default=False, language__isnull=False),
+                name="fine_rate_is_default",
+            ),
+            models.UniqueConstraint(fields=["genre"], name="fine_rate_unique_genre"),
+            models.UniqueConstraint(
+                fields=["language"], name="fine_rate_unique_language"
+            ),
+            models.UniqueConstraint(
+                fields=["is_default"],
+                condition=models.Q(is_default=True),
+                name="fine_rate_unique_default",
+            ),
+        ]
+
+    def clean(self):
+        self.is_default = self.genre_id is None and self.language_id is None
+
+    def validate_constraints(self, exclude=None):
+        # Forms leave out is_default, which is derived from fields they have.
+        exclude = set(exclude or ()) - {"is_default"}
+        super().validate_constraints(exclude)
+
+    def save(self, *args, **kwargs):
+        self.clean()
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        """String for representing the Model object."""
+        return f"{self.genre or self.language or 'Default'}: {self.daily_rate}/day"
+
+
+class Fine(models.Model):
+    """Model representing the fine accrued by one overdue loan (a copy, its
+    borrower and due date). Kept up to date by the assess_fines command."""
+
+    borrower = models.ForeignKey(User, on_delete=models.CASCADE, related_name="fines")
+    # Not a foreign key: the fine outlives the copy (archive, deletion).
+    copy_id = models.UUIDField()
+    book = models.ForeignKey(
+        Book, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    due_back = models.DateField()
+    days_overdue = models.PositiveIntegerField()
+    amount = models.DecimalField(max_digits=8, decimal_places=2)
+    paid = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    assessed = models.DateField(help_text="Date the amount was last computed")
+
+    class Meta:
+        ordering = ["-due_back"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["copy_id", "due_back", "borrower"], name="fine_unique_loan"
+            ),
+        ]
+
+    def __str__(self):
+        """String for representing the Model object."""
+        return f"{self.borrower}: {self.amount} ({self.due_back})"
+
+
+class FineBalance(models.Model):
+    """Model representing the outstanding fines of one borrower (the unpaid
+    total of their Fine rows)."""
+
+    borrower = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="fine_balance"
+    )
+    balance = models.DecimalField(max_digits=10, decimal_places=2)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        """String for representing the Model object."""
+        return f"{self.borrower}: {self.balance}"
+
+
+class AuthorStats(models.Model):
+    """Model representing the totals shown for an author: titles, copies and
+    copies on loan. Kept up to date incrementally by catalog.authors."""
+
+    author = models.OneToOneField(
+        Author, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    num_titles = models.IntegerField(default=0)
+    num_copies = models.IntegerField(default=0)
+    num_loans = models.IntegerField(default=0, help_text="Copies now on loan")
+
+    def __str__(self):
+        """String for representing the Model object."""
+        return f"{self.author_id}: {self.num_titles} titles, {self.num_copies} copies"
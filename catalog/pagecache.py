@@ -0,0 +1,111 @@
+"""Full-page cache for anonymous catalog pages.
+
+Pages are cached by path and query string. Authenticated users always bypass
+the cache, because their sidebar differs. Each entry records the ``books``
+cache version (see ``catalog.caching``) it was rendered under, so any catalog
+change marks every cached page as stale.
+
+Stale or expired entries are not thrown away straight away. The first request
+to notice takes a short-lived lock and re-renders the page, while concurrent
+requests keep being served the stale copy. This stops a popular page that
+expires (or a catalog change) from sending a thundering herd to the database.
+"""
+
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from . import metrics
+from .caching import get_version
+
+# Stale entries are kept this many seconds past their expiry to be served
+# while the page is re-rendered.
+STALE_GRACE = 300
+# Upper bound on how long one re-render may hold the lock.
+LOCK_TIMEOUT = 10
+# How long to wait for another request's render when there is no stale copy.
+WAIT_TIMEOUT = 2.0
+WAIT_INTERVAL = 0.05
+
+
+def _page_key(request):
+    digest = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f"catalog:page:{digest}"
+
+
+def _is_fresh(entry, version):
+    return entry["version"] == version and entry["expires"] > time.time()
+
+
+def _from_entry(entry, state):
+    metrics.record_cache("page", state)
+    response = HttpResponse(entry["content"], content_type=entry["content_type"])
+    response["X-Page-Cache"] = state
+    return response
+
+
+def _render_and_store(view, request, args, kwargs, key, version, timeout):
+    response = view(request, *args, **kwargs)
+    if hasattr(response, "render") and not response.is_rendered:
+        response.render()
+    if response.status_code == 200 and not response.cookies:
+        entry = {
+            "version": version,
+            "expires": time.time() + timeout,
+            "content": response.content,
+            "content_type": response["Content-Type"],
+        }
+        cache.set(key, entry, timeout + STALE_GRACE)
+    metrics.record_cache("page", "miss")
+    response["X-Page-Cache"] = "miss"
+    return response
+
+
+def cache_anonymous_page(view):
+    """Cache the responses of ``view`` for anonymous users.
+
+    The cache lifetime is ``settings.CATALOG_PAGE_CACHE_TIMEOUT`` seconds;
+    ``0`` disables the cache (the default when DEBUG is on).
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        timeout = settings.CATALOG_PAGE_CACHE_TIMEOUT
+        if (
+            not timeout
+            or request.method not in ("GET", "HEAD")
+            or request.user.is_authenticated
+        ):
+            return view(request, *args, **kwargs)
+
+        key = _page_key(request)
+        version = get_version("books")
+        entry = cache.get(key)
+        if entry is not None and _is_fresh(entry, version):
+            return _from_entry(entry, "hit")
+
+        lock_key = f"{key}:lock"
+        if cache.add(lock_key, 1, LOCK_TIMEOUT):
+            try:
+                return _render_and_store(
+                    view, request, args, kwargs, key, version, timeout
+                )
+            finally:
+                cache.delete(lock_key)
+
+        # Someone else is rendering the page already.
+        if entry is not None:
+            return _from_entry(entry, "stale")
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_INTERVAL)
+            entry = cache.get(key)
+            if entry is not None and entry["version"] == version:
+                return _from_entry(entry, "hit")
+        return view(request, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,156 @@
+"""On-demand profiling of single requests.
+
+A staff user can profile one request by sending the ``X-Profile: 1`` header or
+adding ``?_profile=1`` to the URL. The request then runs under:
+
+- a sampling profiler (a thread that records the request thread's stack every
+  ``SAMPLE_INTERVAL`` seconds), whose output is stored in collapsed-stack
+  format for flame graphs,
+- cProfile, for exact per-function call counts and times,
+- tracemalloc, for the top allocation sites.
+
+The result is saved as a ProfileReport (viewable in the admin) and its id is
+returned in the ``X-Profile-Id`` response header. Requests without the header
+or parameter only pay for two dictionary lookups.
+
+tracemalloc is process-wide, so with threaded workers the profiled requests of
+one process share it: the first one starts tracing, the last one stops it, and
+the allocation sites include those of concurrent requests.
+"""
+
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from .models import ProfileReport
+
+SAMPLE_INTERVAL = 0.001
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+_tracing_lock = threading.Lock()
+# Profiled requests using tracemalloc, and whether they started it.
+_tracing_users = 0
+_started_tracing = False
+
+
+def _start_tracing():
+    global _tracing_users, _started_tracing
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            _started_tracing = True
+        _tracing_users += 1
+
+
+def _stop_tracing():
+    """Return a snapshot, and stop tracing if this was the last user."""
+    global _tracing_users, _started_tracing
+    with _tracing_lock:
+        snapshot = tracemalloc.take_snapshot()
+        _tracing_users -= 1
+        if _tracing_users == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+    return snapshot
+
+
+class StackSampler:
+    """Samples the stack of one thread from a background thread."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """Return the samples as ``frame;frame;frame count`` lines."""
+        return "\n".join(
+            f"{stack} {count}" for stack, count in self.stacks.most_common()
+        )
+
+
+def _wants_profile(request):
+    return request.headers.get("X-Profile") == "1" or request.GET.get("_profile") == "1"
+
+
+class ProfilingMiddleware:
+    """Profiles requests from staff users who ask for it.
+
+    Must come after AuthenticationMiddleware in MIDDLEWARE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _wants_profile(request) or not request.user.is_staff:
+            return self.get_response(request)
+        return self.profile(request)
+
+    def profile(self, request):
+        _start_tracing()
+        profiler = cProfile.Profile()
+        sampler = StackSampler(threading.get_ident())
+
+        sampler.start()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+            if hasattr(response, "render") and not response.is_rendered:
+                # Include template rendering in the profile.
+                response.render()
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - start
+            sampler.stop()
+            snapshot = _stop_tracing()
+
+        stats = io.StringIO()
+        pstats.Stats(profiler, stream=stats).sort_stats("cumulative").print_stats(
+            TOP_FUNCTIONS
+        )
+        allocations = "\n".join(
+            str(stat) for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+        )
+        report = ProfileReport.objects.create(
+            user=request.user,
+            method=request.method,
+            path=request.get_full_path()[:2000],
+            status_code=response.status_code,
+            duration_ms=duration * 1000,
+            samples=sum(sampler.stacks.values()),
+            collapsed_stacks=sampler.collapsed(),
+            function_stats=stats.getvalue(),
+            top_allocations=allocations,
+        )
+        response["X-Profile-Id"] = str(report.pk)
+        return response
@@ -0,0 +1,257 @@
+"""Precomputed book-to-book recommendations.
+
+"Borrowers of this book also borrowed"
+--------------------------------------
+
+The recommendations are built from a sparse borrower x book matrix ``M``
+(1 where the borrower has a copy of the book). ``M.T @ M`` counts, for each
+pair of books, the borrowers they have in common. The counts are normalised
+to cosine similarity, so that books everyone borrows do not dominate, and the
+``top_k`` best neighbours of each book are stored in BookRecommendation.
+
+Run ``python manage.py build_recommendations`` periodically (e.g. nightly);
+the detail page then only reads the precomputed rows.
+
+"More like this"
+----------------
+
+Books are also compared by the Jaccard similarity of their genre sets
+(shared genres / genres of either book). With the sparse book x genre
+membership matrix ``B``, ``B @ B.T`` counts the shared genres of every pair
+of books that has any, and the unions follow from the row sums, so memory
+grows with the number of similar pairs rather than books squared. The
+``SIMILAR_TOP_N`` most similar books are stored in BookSimilarity.
+``build_similarities()`` rebuilds the whole table, and the signal handlers
+call ``refresh_similarities()`` once per transaction for the books affected by
+genre changes, which only reads the genres of those books and their
+candidates. A change to a large genre affects most of the catalog, so when
+more than ``SIMILARITY_REFRESH_LIMIT`` genre memberships would be read the
+changed books are only marked ``similar_stale``, and
+``python manage.py build_similarities --stale`` refreshes them later.
+"""
+
+import numpy as np
+from django.db import transaction
+from scipy import sparse
+
+from .models import Book, BookInstance, BookRecommendation, BookSimilarity
+
+DEFAULT_TOP_K = 10
+SIMILAR_TOP_N = 10
+SIMILARITY_CHUNK = 256
+SIMILARITY_REFRESH_LIMIT = 5000
+
+
+def borrow_pairs():
+    """Return the distinct (borrower id, book id) pairs as two arrays."""
+    # order_by() drops the default ordering, which would add due_back to the
+    # DISTINCT columns and repeat a pair for each due date.
+    pairs = np.array(
+        BookInstance.objects.filter(borrower__isnull=False, book__isnull=False)
+        .values_list("borrower_id", "book_id")
+        .order_by()
+        .distinct(),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def cooccurrence(borrowers, books):
+    """Return the book ids and the cosine-normalised book x book matrix.
+
+    Row and column ``i`` of the matrix belong to ``book_ids[i]``; the
+    diagonal is zero.
+    """
+    user_index = np.unique(borrowers, return_inverse=True)[1]
+    book_ids, book_index = np.unique(books, return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(books), dtype=np.float32), (user_index, book_index)),
+        shape=(user_index.max(initial=-1) + 1, len(book_ids)),
+    )
+    counts = (matrix.T @ matrix).tocsr()
+    norms = np.sqrt(counts.diagonal())
+    counts.setdiag(0)
+    counts.eliminate_zeros()
+    scale = sparse.diags(1 / np.where(norms > 0, norms, 1))
+    return book_ids, (scale @ counts @ scale).tocsr()
+
+
+def top_neighbours(book_ids, matrix, top_k=DEFAULT_TOP_K):
+    """Yield (book id, neighbour id, score, rank) for the best ``top_k``
+    neighbours of every book, best first."""
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        if start == end:
+            continue
+        columns = matrix.indices[start:end]
+        scores = matrix.data[start:end]
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+            columns, scores = columns[best], scores[best]
+        # Highest score first; ties broken by book id for stable output.
+        order = np.lexsort((book_ids[columns], -scores))
+        for rank, index in enumerate(order, start=1):
+            yield (
+                int(book_ids[row]),
+                int(book_ids[columns[index]]),
+                float(scores[index]),
+                rank,
+            )
+
+
+def build(top_k=DEFAULT_TOP_K, batch_size=1000):
+    """Rebuild the BookRecommendation table and return the number of rows."""
+    borrowers, books = borrow_pairs()
+    book_ids, matrix = cooccurrence(borrowers, books)
+    rows = [
+        BookRecommendation(
+            book_id=book_id, recommended_id=recommended_id, score=score, rank=rank
+        )
+        for book_id, recommended_id, score, rank in top_neighbours(
+            book_ids, matrix, top_k
+        )
+    ]
+    with transaction.atomic():
+        BookRecommendation.objects.all().delete()
+        BookRecommendation.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def genre_matrix(book_ids=None):
+    """Return the book ids and their genres as a sparse 0/1 CSR matrix.
+
+    Row ``i`` belongs to ``book_ids[i]``; only books with genres are included,
+    and only those in ``book_ids`` (a list or queryset of pks) if given.
+    """
+    memberships = Book.genre.through.objects.all()
+    if book_ids is not None:
+        memberships = memberships.filter(book_id__in=book_ids)
+    pairs = np.array(
+        memberships.values_list("book_id", "genre_id"), dtype=np.int64
+    ).reshape(-1, 2)
+    book_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    columns = np.unique(pairs[:, 1], return_inverse=True)[1]
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.int32), (rows, columns)),
+        shape=(len(book_ids), columns.max(initial=-1) + 1),
+    )
+    return book_ids, matrix
+
+
+def jaccard(query, matrix):
+    """Return the Jaccard similarity of every ``query`` row with every row of
+    ``matrix`` (both sparse 0/1 matrices) as a sparse len(query) x len(matrix)
+    matrix, with entries only for rows that share a column."""
+    intersection = (query @ matrix.T).tocsr()
+    query_sizes = np.asarray(query.sum(axis=1)).ravel()
+    sizes = np.asarray(matrix.sum(axis=1)).ravel()
+    rows = np.repeat(np.arange(query.shape[0]), np.diff(intersection.indptr))
+    union = query_sizes[rows] + sizes[intersection.indices] - intersection.data
+    return sparse.csr_matrix(
+        (intersection.data / union, intersection.indices, intersection.indptr),
+        shape=intersection.shape,
+    )
+
+
+def similar_rows(book_ids, matrix, rows, top_n=SIMILAR_TOP_N):
+    """Return BookSimilarity objects for the books at ``rows`` of ``matrix``."""
+    result = []
+    for start in range(0, len(rows), SIMILARITY_CHUNK):
+        chunk = rows[start : start + SIMILARITY_CHUNK]
+        scores = jaccard(matrix[chunk], matrix)
+        for index, row in enumerate(chunk):
+            columns = scores.indices[scores.indptr[index] : scores.indptr[index + 1]]
+            values = scores.data[scores.indptr[index] : scores.indptr[index + 1]]
+            # A book is not similar to itself.
+            others = columns != row
+            columns, values = columns[others], values[others]
+            if len(values) > top_n:
+                best = np.argpartition(-values, top_n - 1)[:top_n]
+                columns, values = columns[best], values[best]
+            # Highest score first; ties broken by book id for stable output.
+            order = np.lexsort((book_ids[columns], -values))
+            result += [
+                BookSimilarity(
+                    book_id=int(book_ids[row]),
+                    similar_id=int(book_ids[columns[position]]),
+                    score=float(values[position]),
+                    rank=rank,
+                )
+                for rank, position in enumerate(order, start=1)
+            ]
+    return result
+
+
+def build_similarities(top_n=SIMILAR_TOP_N, batch_size=1000):
+    """Rebuild the BookSimilarity table and return the number of rows."""
+    book_ids, matrix = genre_matrix()
+    rows = similar_rows(book_ids, matrix, np.arange(len(book_ids)), top_n)
+    with transaction.atomic():
+        BookSimilarity.objects.all().delete()
+        BookSimilarity.objects.bulk_create(rows, batch_size=batch_size)
+        Book.objects.filter(similar_stale=True).update(similar_stale=False)
+    return len(rows)
+
+
+def refresh_similarities(
+    changed_book_ids, top_n=SIMILAR_TOP_N, limit=SIMILARITY_REFRESH_LIMIT
+):
+    """Recompute the similar books of the books whose genres changed and of
+    every book whose list can include them.
+
+    Those are the changed books, the books sharing a genre with them now, and
+    the books that list them at the moment (they may share no genre any more).
+    Only the genres of those books and of the books sharing a genre with them
+    (their candidates) are read. If that is more than ``limit`` memberships,
+    the changed books are marked stale instead; returns whether the lists were
+    refreshed.
+    """
+    changed_book_ids = set(changed_book_ids)
+    if not changed_book_ids:
+        return True
+    memberships = Book.genre.through.objects.all()
+    changed_genres = memberships.filter(book_id__in=changed_book_ids).values("genre_id")
+    if (
+        limit is not None
+        and memberships.filter(genre_id__in=changed_genres).count() > limit
+    ):
+        return _mark_stale(changed_book_ids)
+    affected = set(changed_book_ids)
+    affected.update(
+        BookSimilarity.objects.filter(similar__in=changed_book_ids).values_list(
+            "book_id", flat=True
+        )
+    )
+    affected.update(
+        memberships.filter(genre_id__in=changed_genres).values_list(
+            "book_id", flat=True
+        )
+    )
+    candidates = memberships.filter(
+        genre_id__in=memberships.filter(book_id__in=affected).values("genre_id")
+    ).values("book_id")
+    if limit is not None and memberships.filter(book_id__in=candidates).count() > limit:
+        return _mark_stale(changed_book_ids)
+    book_ids, matrix = genre_matrix(candidates)
+    rows = similar_rows(
+        book_ids, matrix, np.flatnonzero(np.isin(book_ids, list(affected))), top_n
+    )
+    with transaction.atomic():
+        BookSimilarity.objects.filter(book__in=affected).delete()
+        BookSimilarity.objects.bulk_create(rows)
+    return True
+
+
+def _mark_stale(book_ids):
+    Book.objects.filter(pk__in=book_ids).update(similar_stale=True)
+    return False
+
+
+def refresh_stale_similarities(top_n=SIMILAR_TOP_N):
+    """Refresh the books marked stale, without a limit, and return how many
+    there were."""
+    book_ids = set(Book.objects.filter(similar_stale=True).values_list("pk", flat=True))
+    with transaction.atomic():
+        refresh_similarities(book_ids, top_n, limit=None)
+        Book.objects.filter(pk__in=book_ids).update(similar_stale=False)
+    return len(book_ids)
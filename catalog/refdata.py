@@ -0,0 +1,67 @@
+"""Process-wide cache of the small reference tables (Genre, Language, Branch).
+
+Each table is loaded once per process as a ``{pk: name}`` dict and kept until
+its version stamp in the shared cache changes. The stamps are bumped by the
+save/delete signals in ``catalog.signals``, so a reload costs one cache read
+per access and one query per change.
+
+The stamps only reach other workers through a shared cache (see
+``catalog.checks``); with a process-local one, a worker keeps its tables
+until it restarts.
+"""
+
+import threading
+
+from django.apps import apps
+
+from . import metrics
+from .caching import get_version, invalidate
+
+_tables = {}
+_lock = threading.Lock()
+
+
+def _namespace(model_name):
+    return f"refdata:{model_name}"
+
+
+def get_table(model_name):
+    """Return ``{pk: name}`` for the ``catalog`` model ``model_name``, by name."""
+    version = get_version(_namespace(model_name))
+    cached = _tables.get(model_name)
+    if cached is not None and cached[0] == version:
+        metrics.record_cache("refdata", "hit")
+        return cached[1]
+    metrics.record_cache("refdata", "miss")
+    with _lock:
+        cached = _tables.get(model_name)
+        if cached is None or cached[0] != version:
+            model = apps.get_model("catalog", model_name)
+            rows = model.objects.order_by("name").values_list("pk", "name")
+            cached = _tables[model_name] = (version, dict(rows))
+    return cached[1]
+
+
+def invalidate_table(model_name):
+    """Make every process reload the reference table ``model_name``."""
+    invalidate(_namespace(model_name))
+
+
+def genres():
+    """Return ``{pk: name}`` for every Genre."""
+    return get_table("genre")
+
+
+def languages():
+    """Return ``{pk: name}`` for every Language."""
+    return get_table("language")
+
+
+def branches():
+    """Return ``{pk: name}`` for every Branch."""
+    return get_table("branch")
+
+
+def choices(table):
+    """Return form choices for a reference ``table``."""
+    return list(table.items())
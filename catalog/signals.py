@@ -0,0 +1,291 @@
+"""Signal handlers that keep cached catalog data consistent with the database."""
+
+import threading
+
+from django.contrib.auth.models import Group, Permission, User
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from . import authors, changefeed, fines, genres, suggest
+from .backends import invalidate_all_permissions, invalidate_user_permissions
+from .caching import invalidate
+from .refdata import invalidate_table
+from .models import (
+    Author,
+    Book,
+    BookInstance,
+    BookSimilarity,
+    Branch,
+    Fine,
+    Genre,
+    Language,
+)
+from .recommendations import refresh_similarities
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Language)
+@receiver(m2m_changed, sender=Book.genre.through)
+def invalidate_book_caches(sender, **kwargs):
+    """Invalidate cached facet counts and pages when the catalog changes."""
+    invalidate("books")
+
+
+@receiver(post_save, sender=BookInstance)
+def log_copy_change(sender, instance, created, update_fields, **kwargs):
+    """Add status and due date changes to the kiosk change feed."""
+    if created or update_fields is None or changefeed.TRACKED_FIELDS & update_fields:
+        changefeed.record_save(instance)
+
+
+@receiver(post_delete, sender=BookInstance)
+def log_copy_removal(sender, instance, **kwargs):
+    changefeed.record_delete(instance)
+
+
+def _author_of(book_id):
+    if book_id is None:
+        return None
+    return Book.objects.filter(pk=book_id).values_list("author_id", flat=True).first()
+
+
+@receiver(pre_save, sender=Book)
+def remember_book_author(sender, instance, **kwargs):
+    instance._stats_author_id = (
+        None if instance._state.adding else _author_of(instance.pk)
+    )
+
+
+@receiver(post_save, sender=Book)
+def count_book_for_author(sender, instance, created, **kwargs):
+    """Keep AuthorStats in step when a book is added or changes author."""
+    if created:
+        authors.apply({instance.author_id: (1, 0, 0)})
+        return
+    previous = instance.__dict__.pop("_stats_author_id", None)
+    if previous != instance.author_id:
+        # The book's copies move with it.
+        authors.refresh([previous, instance.author_id])
+
+
+@receiver(post_delete, sender=Book)
+def uncount_book_for_author(sender, instance, **kwargs):
+    # Books with copies cannot be deleted (BookInstance.book is RESTRICT).
+    authors.apply({instance.author_id: (-1, 0, 0)})
+
+
+@receiver(post_save, sender=BookInstance)
+def count_copy_for_author(sender, instance, created, update_fields, **kwargs):
+    """Keep AuthorStats in step with copies and loans."""
+    loaded = getattr(instance, "_loaded_values", None)
+    if not created and (update_fields is None or loaded is None):
+        # Saved without knowing what changed: recount the author.
+        authors.refresh([_author_of(instance.book_id)])
+        return
+    # BookInstance.save() passes attnames ("book_id"); callers may pass "book".
+    if not created and not {"status", "book", "book_id"} & update_fields:
+        return
+    author_id = _author_of(instance.book_id)
+    before = []
+    if not created:
+        # BookInstance.save() still holds the values it loaded.
+        book_id = loaded.get("book_id", instance.book_id)
+        before = [
+            (
+                author_id if book_id == instance.book_id else _author_of(book_id),
+                loaded.get("status", instance.status),
+            )
+        ]
+    authors.apply(authors.copy_deltas(before, [(author_id, instance.status)]))
+
+
+@receiver(pre_delete, sender=BookInstance)
+def remember_copy_author(sender, instance, **kwargs):
+    # Read from the database: the instance may predate a bulk update.
+    instance._stats_copy = (
+        BookInstance.objects.filter(pk=instance.pk)
+        .values_list("book__author_id", "status")
+        .first()
+    )
+
+
+@receiver(post_delete, sender=BookInstance)
+def uncount_copy_for_author(sender, instance, **kwargs):
+    copy = instance.__dict__.pop("_stats_copy", None)
+    if copy is not None:
+        authors.apply(authors.copy_deltas([copy], []))
+
+
+@receiver(post_save, sender=Fine)
+@receiver(post_delete, sender=Fine)
+def refresh_fine_balance(sender, instance, **kwargs):
+    """Keep the borrower's balance in step with payments made in the admin."""
+    fines.refresh_balances([instance.borrower_id])
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_suggestions(sender, **kwargs):
+    """Rebuild the typeahead index when titles or author names may change."""
+    suggest.invalidate()
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Language)
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+def invalidate_reference_data(sender, **kwargs):
+    """Make every process reload the changed reference table."""
+    invalidate_table(sender._meta.model_name)
+
+
+@receiver(pre_save, sender=Genre)
+def remember_genre_parent(sender, instance, **kwargs):
+    instance._closure_parent_id = (
+        None
+        if instance._state.adding
+        else Genre.objects.filter(pk=instance.pk)
+        .values_list("parent_id", flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=Genre)
+def rebuild_genre_closure(sender, instance, created, **kwargs):
+    """Keep the genre tree's closure table in step with parent links.
+
+    Only new genres and genres moved to another parent change the tree;
+    renames leave it alone.
+    """
+    previous = instance.__dict__.pop("_closure_parent_id", None)
+    if created or previous != instance.parent_id:
+        genres.rebuild_closure()
+
+
+@receiver(post_delete, sender=Genre)
+def rebuild_genre_closure_on_delete(sender, **kwargs):
+    # Children of the deleted genre become roots (parent is SET_NULL).
+    genres.rebuild_closure()
+
+
+# Books whose similar lists need refreshing once the transaction commits.
+_pending_similarities = threading.local()
+
+
+def _refresh_similarities_on_commit(book_ids):
+    """Refresh ``book_ids`` after the commit, once for all the genre changes of
+    the transaction (``genre.set()`` alone sends a remove and an add).
+
+    Every change registers a callback; the first to run refreshes all pending
+    books and the others find nothing left. Books left over by a rollback are
+    refreshed with the next commit, which is harmless.
+    """
+    book_ids = set(book_ids)
+    if book_ids:
+        pending = _pending_similarities.__dict__.setdefault("book_ids", set())
+        pending.update(book_ids)
+        transaction.on_commit(_refresh_pending_similarities)
+
+
+def _refresh_pending_similarities():
+    book_ids = _pending_similarities.__dict__.pop("book_ids", None)
+    if book_ids:
+        refresh_similarities(book_ids)
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def refresh_genre_similarities(sender, instance, action, reverse, pk_set, **kwargs):
+    """Recompute "more like this" for books whose genres changed."""
+    if not reverse:
+        if action.startswith("post_"):
+            _refresh_similarities_on_commit([instance.pk])
+    elif action == "pre_clear":
+        # post_clear from the genre side does not say which books lost it.
+        instance._cleared_book_ids = list(
+            instance.book_set.values_list("pk", flat=True)
+        )
+    elif action == "post_clear":
+        _refresh_similarities_on_commit(instance.__dict__.pop("_cleared_book_ids", []))
+    elif action.startswith("post_"):
+        _refresh_similarities_on_commit(pk_set)
+
+
+@receiver(pre_delete, sender=Genre)
+@receiver(pre_delete, sender=Book)
+def collect_similarity_dependents(sender, instance, **kwargs):
+    """Remember the books whose similar lists a deletion changes.
+
+    The deletion cascades without m2m_changed, and removes the rows that
+    point at a deleted book, so they are collected beforehand.
+    """
+    if sender is Genre:
+        instance._similarity_book_ids = list(
+            instance.book_set.values_list("pk", flat=True)
+        )
+    else:
+        instance._similarity_book_ids = list(
+            BookSimilarity.objects.filter(similar=instance).values_list(
+                "book_id", flat=True
+            )
+        )
+
+
+@receiver(post_delete, sender=Genre)
+@receiver(post_delete, sender=Book)
+def refresh_similarity_dependents(sender, instance, **kwargs):
+    _refresh_similarities_on_commit(instance.__dict__.pop("_similarity_book_ids", []))
+
+
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_membership_permissions(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """Drop cached permission sets when user permissions or groups change."""
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        invalidate_user_permissions(instance.pk)
+    elif pk_set is None:
+        # post_clear from the group/permission side: the users are unknown.
+        invalidate_all_permissions()
+    else:
+        for user_id in pk_set:
+            invalidate_user_permissions(user_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_flags(sender, instance, created, update_fields, **kwargs):
+    """is_superuser and is_active change the permission set too."""
+    if created or update_fields == frozenset(["last_login"]):
+        # New users have nothing cached, and logging in changes no flags.
+        return
+    invalidate_user_permissions(instance.pk)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def invalidate_group_permissions(sender, **kwargs):
+    """Group and permission changes can affect any user."""
+    if kwargs.get("action", "post_").startswith("post_"):
+        invalidate_all_permissions()
@@ -0,0 +1,138 @@
+"""In-process prefix index for search-as-you-type suggestions.
+
+Book titles and author names are loaded with ``values_list`` into one sorted
+list of normalised keys (authors under both "last name" and "first last").
+A prefix lookup is a ``bisect`` into that list followed by a short scan, so
+a suggestion never touches the database.
+
+Every process builds its own index, at worker start (see locallibrary/wsgi.py)
+or on first use. Book and author signals call :func:`invalidate`, which drops
+this process's index and bumps the "suggest" version stamp in the shared
+cache. Other processes compare the stamp at most every
+``CATALOG_SUGGEST_CHECK_INTERVAL`` seconds and rebuild when it changed. A
+process-local cache never sees other processes' stamps (and preloaded workers
+inherit a copy of the master's), so with one the index is simply rebuilt at
+every check.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.urls import reverse
+
+from . import metrics
+from .caching import get_version, invalidate as invalidate_namespace, is_shared
+from .models import Author, Book
+
+NAMESPACE = "suggest"
+
+_lock = threading.Lock()
+# (version, next version check, keys, entries); keys[i] belongs to entries[i].
+_index = None
+
+
+def normalize(text):
+    """Return the lookup key for ``text``: case-folded, single-spaced."""
+    return " ".join(text.casefold().split())
+
+
+def build():
+    """Load titles and author names and return (keys, entries), sorted by key.
+
+    Each entry is a ``(type, label, url)`` tuple.
+    """
+    rows = []
+    for pk, title in Book.objects.values_list("pk", "title"):
+        rows.append(
+            (normalize(title), "book", title, reverse("book-detail", args=[pk]))
+        )
+    for pk, first_name, last_name in Author.objects.values_list(
+        "pk", "first_name", "last_name"
+    ):
+        label = f"{last_name}, {first_name}"
+        url = reverse("author-detail", args=[pk])
+        rows.append((normalize(last_name), "author", label, url))
+        rows.append((normalize(f"{first_name} {last_name}"), "author", label, url))
+    rows.sort()
+    return [row[0] for row in rows], [row[1:] for row in rows]
+
+
+def get_index():
+    """Return (keys, entries), rebuilding them if the catalog changed."""
+    global _index
+    index = _index
+    now = time.monotonic()
+    if index is not None and now < index[1]:
+        return index[2], index[3]
+    # A fresh object never matches, so a private cache rebuilds every time.
+    version = get_version(NAMESPACE) if is_shared() else object()
+    next_check = now + settings.CATALOG_SUGGEST_CHECK_INTERVAL
+    if index is not None and index[0] == version:
+        _index = (version, next_check, index[2], index[3])
+        return index[2], index[3]
+    with _lock:
+        index = _index
+        if index is None or index[0] != version:
+            metrics.record_cache("suggest", "miss")
+            keys, entries = build()
+            index = _index = (version, next_check, keys, entries)
+    return index[2], index[3]
+
+
+def suggest(query, limit=10):
+    """Return up to ``limit`` entries whose key starts with ``query``.
+
+    Entries are ordered by key; an author matching under both keys is only
+    returned once.
+    """
+    prefix = normalize(query)
+    if not prefix:
+        return []
+    keys, entries = get_index()
+    results = []
+    seen = set()
+    position = bisect_left(keys, prefix)
+    while (
+        position < len(keys)
+        and len(results) < limit
+        and keys[position].startswith(prefix)
+    ):
+        entry = entries[position]
+        if entry not in seen:
+            seen.add(entry)
+            results.append(entry)
+        position += 1
+    return results
+
+
+def _drop_local_index():
+    global _index
+    _index = None
+
+
+def invalidate():
+    """Rebuild the index in every process after a book or author change."""
+    invalidate_namespace(NAMESPACE)
+    # This process rebuilds on its next lookup, and again after the commit in
+    # case another thread rebuilt from the old rows meanwhile.
+    _drop_local_index()
+    transaction.on_commit(_drop_local_index)
+
+
+def warm():
+    """Build the index ahead of the first request.
+
+    Called when the application is loaded (in the gunicorn master with
+    preload), so the database connection is closed afterwards rather than
+    inherited by forked workers.
+    """
+    try:
+        get_index()
+    except DatabaseError:
+        # Not migrated yet; the workers build the index on first use.
+        pass
+    finally:
+        connections.close_all()
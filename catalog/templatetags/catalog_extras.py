@@ -0,0 +1,35 @@
+from django import template
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def query_replace(context, **kwargs):
+    """Return the current query string with the given parameters replaced.
+
+    Used by pagination and browse links so that filters such as ``letter``
+    survive moving between pages. Passing ``None`` removes a parameter.
+    """
+    query = context["request"].GET.copy()
+    for key, value in kwargs.items():
+        if value is None:
+            query.pop(key, None)
+        else:
+            query[key] = value
+    return query.urlencode()
+
+
+@register.simple_tag(takes_context=True)
+def query_toggle(context, name, value):
+    """Return the current query string with ``name`` toggled to ``value``.
+
+    If ``name`` is already set to ``value`` it is removed instead. The page
+    number is always dropped, because the filtered list has different pages.
+    """
+    query = context["request"].GET.copy()
+    query.pop("page", None)
+    if query.get(name) == str(value):
+        query.pop(name)
+    else:
+        query[name] = value
+    return query.urlencode()
@@ -0,0 +1,338 @@
+import datetime
+import json
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from catalog import suggest
+from catalog.changefeed import update_copies
+from catalog.caching import bump_version
+from catalog.models import (
+    Author,
+    Book,
+    BookInstance,
+    CopyStatusChange,
+    Genre,
+    Language,
+)
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name="John", last_name="Smith")
+        cls.genre = Genre.objects.create(name="Fantasy")
+        cls.language = Language.objects.create(name="English")
+        for number in range(5):
+            book = Book.objects.create(
+                title=f"Book {number}",
+                summary="My book summary",
+                isbn=f"ISBN{number}",
+                author=cls.author,
+                language=cls.language,
+            )
+            book.genre.add(cls.genre)
+        cls.book = Book.objects.get(isbn="ISBN0")
+        cls.copy = BookInstance.objects.create(
+            book=cls.book, imprint="Imprint", status="a"
+        )
+
+    def get_json(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_list_books(self):
+        data = self.get_json(reverse("api-list", args=["books"]))
+        self.assertEqual(len(data["results"]), 5)
+        self.assertIsNone(data["next"])
+        self.assertEqual(data["results"][0]["author"], self.author.pk)
+
+    def test_sparse_fieldset_selects_only_requested_columns(self):
+        with self.assertNumQueries(1) as context:
+            data = self.get_json(reverse("api-list", args=["books"]) + "?fields=isbn")
+        self.assertEqual(set(data["results"][0]), {"id", "isbn"})
+        self.assertNotIn("summary", context.captured_queries[0]["sql"])
+
+    def test_unknown_field_is_an_error(self):
+        response = self.client.get(reverse("api-list", args=["books"]) + "?fields=x")
+        self.assertEqual(response.status_code, 400)
+
+    def test_include_resolves_each_relation_with_one_query(self):
+        with self.assertNumQueries(4):
+            data = self.get_json(
+                reverse("api-list", args=["books"])
+                + "?fields=title&include=author,genre"
+            )
+        first = data["results"][0]
+        self.assertEqual(first["author"]["last_name"], "Smith")
+        self.assertEqual(first["genre"], [{"id": self.genre.pk, "name": "Fantasy"}])
+
+    def test_cursor_pagination(self):
+        url = reverse("api-list", args=["books"]) + "?limit=2"
+        titles = []
+        while url:
+            data = self.get_json(url)
+            titles += [row["title"] for row in data["results"]]
+            url = data["next"]
+        self.assertEqual(titles, [f"Book {number}" for number in range(5)])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("api-list", args=["books"]) + "?cursor=@@")
+        self.assertEqual(response.status_code, 400)
+
+    def test_copies_do_not_expose_borrower(self):
+        data = self.get_json(
+            reverse("api-list", args=["copies"]) + f"?book={self.book.pk}"
+        )
+        self.assertEqual(data["results"][0]["status"], "a")
+        self.assertNotIn("borrower", data["results"][0])
+
+    def test_author_detail_with_books(self):
+        data = self.get_json(
+            reverse("api-detail", args=["authors", self.author.pk]) + "?include=books"
+        )
+        self.assertEqual(len(data["books"]), 5)
+
+    def test_detail_not_found(self):
+        response = self.client.get(reverse("api-detail", args=["books", 999]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse("api-detail", args=["shelves", 1]))
+        self.assertEqual(response.status_code, 404)
+
+
+class AvailabilityApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name="John", last_name="Smith")
+        cls.book = Book.objects.create(
+            title="Book Title", summary="Summary", isbn="111", author=author
+        )
+        Book.objects.create(title="No copies", summary="Summary", isbn="222")
+        BookInstance.objects.create(book=cls.book, imprint="Imprint", status="a")
+        for days in (3, 7):
+            BookInstance.objects.create(
+                book=cls.book,
+                imprint="Imprint",
+                status="o",
+                due_back=datetime.date.today() + datetime.timedelta(days=days),
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_get_many_isbns_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse("api-availability") + "?isbn=111,222,999"
+            )
+        results = response.json()["results"]
+        self.assertEqual(results["111"]["copies"], {"a": 1, "o": 2})
+        self.assertEqual(results["111"]["available"], 1)
+        self.assertEqual(
+            results["111"]["earliest_due_back"],
+            str(datetime.date.today() + datetime.timedelta(days=3)),
+        )
+        self.assertEqual(results["222"]["copies"], {})
+        self.assertIsNone(results["999"])
+
+    def test_post_json_and_cache(self):
+        url = reverse("api-availability")
+        body = json.dumps({"isbns": ["111", "222"]})
+        self.client.post(url, body, content_type="application/json")
+        with self.assertNumQueries(0):
+            response = self.client.post(url, body, content_type="application/json")
+        self.assertEqual(response.json()["results"]["111"]["book"], self.book.pk)
+
+    def test_invalid_requests(self):
+        url = reverse("api-availability")
+        self.assertEqual(self.client.get(url).status_code, 400)
+        response = self.client.post(url, "nope", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class SuggestApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name="Jane", last_name="Austen")
+        cls.book = Book.objects.create(
+            title="Pride and  Prejudice", summary="Summary", isbn="1", author=cls.author
+        )
+        Book.objects.create(title="Persuasion", summary="Summary", isbn="2")
+        Book.objects.create(title="Emma", summary="Summary", isbn="3")
+
+    def setUp(self):
+        cache.clear()
+        # The index is per process; start each test from an empty one.
+        suggest._drop_local_index()
+
+    def get_labels(self, query, **params):
+        response = self.client.get(reverse("api-suggest"), {"q": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [result["label"] for result in response.json()["results"]]
+
+    def test_prefix_matches_without_queries_once_built(self):
+        suggest.get_index()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.get_labels("P"), ["Persuasion", "Pride and  Prejudice"]
+            )
+            self.assertEqual(self.get_labels("pride and p"), ["Pride and  Prejudice"])
+            self.assertEqual(self.get_labels("  p", limit=1), ["Persuasion"])
+            # Authors match on the last name and on "first last", once.
+            self.assertEqual(self.get_labels("austen"), ["Austen, Jane"])
+            self.assertEqual(self.get_labels("jane a"), ["Austen, Jane"])
+            self.assertEqual(self.get_labels(""), [])
+        emma = Book.objects.get(title="Emma")
+        response = self.client.get(reverse("api-suggest"), {"q": "emma"})
+        self.assertEqual(
+            response.json(),
+            {
+                "query": "emma",
+                "results": [
+                    {"type": "book", "label": "Emma", "url": emma.get_absolute_url()}
+                ],
+            },
+        )
+
+    def test_invalid_limit(self):
+        for limit in ("x", "0", "51"):
+            response = self.client.get(
+                reverse("api-suggest"), {"q": "a", "limit": limit}
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_signals_refresh_this_process(self):
+        self.assertEqual(self.get_labels("sense"), [])
+        Book.objects.create(title="Sense and Sensibility", summary="Summary", isbn="4")
+        self.assertEqual(self.get_labels("sense"), ["Sense and Sensibility"])
+        self.book.delete()
+        self.assertEqual(self.get_labels("pride"), [])
+
+    @override_settings(CATALOG_SUGGEST_CHECK_INTERVAL=0)
+    @mock.patch.object(suggest, "is_shared", return_value=True)
+    def test_other_processes_are_noticed_by_version_check(self, is_shared):
+        self.get_labels("e")
+        # Another process changed the catalog: only the shared stamp moves.
+        Book.objects.bulk_create([Book(title="Sanditon", summary="Summary", isbn="5")])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_labels("sand"), [])
+        bump_version(suggest.NAMESPACE)
+        self.assertEqual(self.get_labels("sand"), ["Sanditon"])
+
+    @override_settings(CATALOG_SUGGEST_CHECK_INTERVAL=0)
+    def test_process_local_cache_rebuilds_at_every_check(self):
+        self.get_labels("e")
+        Book.objects.bulk_create([Book(title="Sanditon", summary="Summary", isbn="5")])
+        self.assertEqual(self.get_labels("sand"), ["Sanditon"])
+
+
+@override_settings(CATALOG_STREAM_SETTLE_DELAY=0)
+class CopyChangeFeedTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title="Kiosk", summary="-", isbn="K1")
+        cls.other = Book.objects.create(title="Other", summary="-", isbn="K2")
+        cls.copy = BookInstance.objects.create(
+            book=cls.book, imprint="Imprint", status="a"
+        )
+        cls.other_copy = BookInstance.objects.create(
+            book=cls.other, imprint="Imprint", status="a"
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.start = CopyStatusChange.objects.order_by("-id").first().id
+
+    def events(self, content):
+        return [
+            json.loads(line[len("data: ") :])
+            for line in content.splitlines()
+            if line.startswith("data: ")
+        ]
+
+    def test_saves_are_logged_only_for_tracked_fields(self):
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        copy.imprint = "Second imprint"
+        copy.save()
+        self.assertFalse(CopyStatusChange.objects.filter(id__gt=self.start).exists())
+        copy.status = "o"
+        copy.due_back = datetime.date(2030, 1, 1)
+        copy.save()
+        change = CopyStatusChange.objects.get(id__gt=self.start)
+        self.assertEqual(change.copy_id, copy.pk)
+        self.assertEqual(change.status, "o")
+        self.assertEqual(change.due_back, datetime.date(2030, 1, 1))
+
+    def test_bulk_updates_are_logged(self):
+        updated = update_copies(BookInstance.objects.filter(book=self.book), status="m")
+        self.assertEqual(updated, 1)
+        change = CopyStatusChange.objects.get(id__gt=self.start)
+        self.assertEqual((change.book_id, change.status), (self.book.pk, "m"))
+        self.assertEqual(BookInstance.objects.get(pk=self.copy.pk).version, 1)
+
+    def test_wsgi_poll_returns_changes_after_last_event_id(self):
+        url = reverse("api-copy-stream") + f"?book={self.book.pk}"
+        response = self.client.get(url)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        content = b"".join(response.streaming_content).decode()
+        self.assertIn(f"id: {self.start}\n", content)
+        self.assertEqual(self.events(content), [])
+
+        update_copies(BookInstance.objects.all(), status="o")
+        response = self.client.get(url, HTTP_LAST_EVENT_ID=str(self.start))
+        content = b"".join(response.streaming_content).decode()
+        self.assertEqual(
+            self.events(content),
+            [
+                {
+                    "copy": str(self.copy.pk),
+                    "book": self.book.pk,
+                    "status": "o",
+                    "due_back": None,
+                }
+            ],
+        )
+
+    @override_settings(CATALOG_STREAM_SETTLE_DELAY=60)
+    def test_entries_wait_to_settle_in_id_order(self):
+        url = reverse("api-copy-stream")
+        update_copies(BookInstance.objects.filter(book=self.book), status="o")
+        update_copies(BookInstance.objects.filter(book=self.other), status="o")
+        first, second = CopyStatusChange.objects.filter(id__gt=self.start)
+
+        def poll():
+            response = self.client.get(url, HTTP_LAST_EVENT_ID=str(self.start))
+            content = b"".join(response.streaming_content).decode()
+            return [event["book"] for event in self.events(content)]
+
+        self.assertEqual(poll(), [])
+        # The later entry settled first: it still waits for the earlier one,
+        # which may belong to a transaction that has not committed yet.
+        old = timezone.now() - datetime.timedelta(minutes=5)
+        CopyStatusChange.objects.filter(pk=second.pk).update(created=old)
+        self.assertEqual(poll(), [])
+        CopyStatusChange.objects.filter(pk=first.pk).update(created=old)
+        self.assertEqual(poll(), [self.book.pk, self.other.pk])
+
+    def test_wsgi_poll_asks_for_a_slow_retry(self):
+        response = self.client.get(reverse("api-copy-stream"))
+        content = b"".join(response.streaming_content).decode()
+        retry = int(settings.CATALOG_STREAM_WSGI_RETRY * 1000)
+        self.assertTrue(content.startswith(f"retry: {retry}\n"))
+
+    @override_settings(CATALOG_STREAM_POLL_INTERVAL=0.01, CATALOG_STREAM_LIFETIME=0.1)
+    async def test_asgi_stream(self):
+        url = reverse("api-copy-stream") + f"?book={self.book.pk}&last_id={self.start}"
+        copy = await BookInstance.objects.aget(pk=self.copy.pk)
+        copy.status = "r"
+        await copy.asave()
+        response = await self.async_client.get(url)
+        content = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(
+            [event["status"] for event in self.events(content.decode())], ["r"]
+        )
@@ -0,0 +1,553 @@
+import datetime
+import json
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import Group, User
+from django.contrib.auth.tokens import default_token_generator
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog import fines, recommendations
+from catalog.management.commands import (
+    archive_catalog,
+    bench_gunicorn,
+    bench_sqlite,
+    fastboot,
+)
+from catalog.models import (
+    ArchivedBookInstance,
+    Author,
+    Book,
+    BookInstance,
+    BookRecommendation,
+    Branch,
+    CopyStatusChange,
+    Fine,
+    FineRate,
+    Genre,
+    Language,
+    Patron,
+)
+
+
+class BenchTemplatesCommandTest(TestCase):
+    def test_renders_every_catalog_template(self):
+        out = StringIO()
+        call_command("bench_templates", iterations=1, stdout=out)
+        output = out.getvalue()
+        for name in [
+            "index.html",
+            "catalog/book_list.html",
+            "catalog/book_detail.html",
+            "catalog/book_form.html",
+            "catalog/book_confirm_delete.html",
+            "catalog/book_renew_librarian.html",
+            "catalog/author_list.html",
+            "catalog/author_detail.html",
+            "catalog/author_form.html",
+            "catalog/author_confirm_delete.html",
+            "catalog/bookinstance_list_borrowed_user.html",
+            "catalog/bookinstance_list_borrowed_all.html",
+        ]:
+            self.assertIn(name, output)
+        # The sample data is rolled back.
+        self.assertFalse(Book.objects.exists())
+
+
+class _OkHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class BenchGunicornCommandTest(TestCase):
+    def test_reports_each_mode(self):
+        author = Author.objects.create(first_name="Big", last_name="Bob")
+        Book.objects.create(title="Book", summary="Summary", isbn="1", author=author)
+        # A local server stands in for gunicorn.
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _OkHandler)
+        self.addCleanup(server.server_close)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        process = mock.Mock(**{"poll.return_value": None})
+        out = StringIO()
+        with mock.patch.object(
+            bench_gunicorn, "_free_port", return_value=server.server_port
+        ), mock.patch.object(
+            bench_gunicorn.subprocess, "Popen", return_value=process
+        ) as popen:
+            call_command(
+                "bench_gunicorn",
+                *("--modes", "sync", "gthread", "--duration", "0.2"),
+                *("--concurrency", "2", "--workers", "1"),
+                stdout=out,
+            )
+        environments = [call.kwargs["env"] for call in popen.call_args_list]
+        self.assertEqual(
+            [env["GUNICORN_WORKER_CLASS"] for env in environments], ["sync", "gthread"]
+        )
+        self.assertEqual(environments[0]["WEB_CONCURRENCY"], "1")
+        self.assertEqual(process.terminate.call_count, 2)
+        lines = out.getvalue().splitlines()
+        self.assertIn("/catalog/books/", lines[0])
+        self.assertEqual(lines[1].split()[:2], ["mode", "req/s"])
+        self.assertEqual(len(lines), 4)
+        for line, mode in zip(lines[2:], ["sync", "gthread"]):
+            fields = line.split()
+            self.assertEqual(fields[0], mode)
+            self.assertGreater(float(fields[1]), 0)
+            self.assertEqual(fields[-1], "0")
+
+    def test_needs_sample_data(self):
+        with self.assertRaises(CommandError):
+            call_command("bench_gunicorn", duration=0.1, stdout=StringIO())
+
+
+class BenchSqliteCommandTest(TestCase):
+    def run_worker(self, role):
+        out = StringIO()
+        call_command(
+            "bench_sqlite",
+            *("--worker", role, "--start-at", str(time.time())),
+            *("--duration", "0.1"),
+            stdout=out,
+        )
+        return json.loads(out.getvalue())
+
+    def test_workers_against_the_test_database(self):
+        with mock.patch.object(bench_sqlite, "SAMPLE_COPIES", 5):
+            call_command("bench_sqlite", "--worker", "seed")
+        self.assertEqual(BookInstance.objects.count(), 5)
+        reads = self.run_worker("read")
+        self.assertGreater(reads["reads"], 0)
+        writes = self.run_worker("write")
+        self.assertGreater(writes["writes"], 0)
+        self.assertEqual((writes["locked"], writes["errors"]), (0, 0))
+
+    def test_reports_each_backend(self):
+        result = {"reads": 50, "writes": 20, "locked": 1, "errors": 0}
+        out = StringIO()
+        with mock.patch.object(
+            bench_sqlite.Command, "run_mode", return_value=result
+        ) as run_mode:
+            call_command(
+                "bench_sqlite",
+                *("--readers", "1", "--writers", "1", "--duration", "10"),
+                stdout=out,
+            )
+        self.assertEqual(
+            [call.args[0] for call in run_mode.call_args_list], ["stock", "tuned"]
+        )
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], "1 readers, 1 writers, 10s per backend")
+        self.assertEqual(lines[2].split(), ["stock", "5.0", "2.0", "1", "0"])
+        self.assertEqual(lines[3].split()[0], "tuned")
+
+
+class FastbootCommandTest(TestCase):
+    def setUp(self):
+        static_root = tempfile.TemporaryDirectory()
+        self.addCleanup(static_root.cleanup)
+        self.static_root = Path(static_root.name)
+
+    def run_fastboot(self, *args):
+        out = StringIO()
+        with override_settings(STATIC_ROOT=self.static_root), mock.patch(
+            "catalog.management.commands.fastboot.call_command"
+        ) as call:
+            call_command("fastboot", *args, stdout=out)
+        return [c.args[0] for c in call.call_args_list], out.getvalue()
+
+    def test_skips_steps_with_nothing_to_do(self):
+        commands, _ = self.run_fastboot()
+        self.assertEqual(commands, ["collectstatic"])
+        commands, output = self.run_fastboot()
+        self.assertEqual(commands, [])
+        self.assertIn("skipping migrate", output)
+        self.assertIn("skipping collectstatic", output)
+
+    def test_changed_static_sources_are_collected(self):
+        self.run_fastboot()
+        (self.static_root / fastboot.STATIC_HASH_FILE).write_text("old")
+        commands, _ = self.run_fastboot()
+        self.assertEqual(commands, ["collectstatic"])
+
+    def test_pending_migrations_are_applied(self):
+        with mock.patch.object(
+            fastboot, "pending_migrations", return_value=["catalog.0099_new"]
+        ):
+            commands, _ = self.run_fastboot()
+        self.assertEqual(commands, ["migrate", "collectstatic"])
+
+    def test_force(self):
+        self.run_fastboot()
+        commands, _ = self.run_fastboot("--force")
+        self.assertEqual(commands, ["migrate", "collectstatic"])
+
+
+class BuildRecommendationsCommandTest(TestCase):
+    def setUp(self):
+        author = Author.objects.create(first_name="John", last_name="Smith")
+        self.books = [
+            Book.objects.create(
+                title=f"Book {n}", summary="Summary", isbn=f"ISBN{n}", author=author
+            )
+            for n in range(4)
+        ]
+        # Books 0 and 1 share two borrowers, books 0 and 2 one; book 3 is
+        # never borrowed together with another book.
+        loans = {"alice": [0, 1, 2], "bob": [0, 1], "carol": [3]}
+        for username, books in loans.items():
+            user = User.objects.create_user(username=username, password="pw")
+            for index in books:
+                BookInstance.objects.create(
+                    book=self.books[index], imprint="Imprint", status="o", borrower=user
+                )
+
+    def test_builds_ranked_neighbours(self):
+        out = StringIO()
+        call_command("build_recommendations", top_k=1, stdout=out)
+        self.assertIn("Stored 3 recommendations", out.getvalue())
+        self.assertEqual(
+            list(
+                BookRecommendation.objects.values_list(
+                    "book__title", "recommended__title", "rank"
+                )
+            ),
+            [
+                ("Book 0", "Book 1", 1),
+                ("Book 1", "Book 0", 1),
+                ("Book 2", "Book 0", 1),
+            ],
+        )
+        # Two shared borrowers out of two each: cosine similarity 1.
+        self.assertAlmostEqual(
+            BookRecommendation.objects.get(book=self.books[0]).score, 1.0, places=5
+        )
+
+    def test_copies_of_one_book_count_once_per_borrower(self):
+        alice = User.objects.get(username="alice")
+        for days in (1, 2):
+            BookInstance.objects.create(
+                book=self.books[3],
+                imprint="Imprint",
+                status="o",
+                borrower=alice,
+                due_back=datetime.date.today() + datetime.timedelta(days=days),
+            )
+        borrowers, books = recommendations.borrow_pairs()
+        pairs = list(zip(borrowers.tolist(), books.tolist()))
+        self.assertEqual(len(pairs), len(set(pairs)))
+        self.assertEqual(pairs.count((alice.pk, self.books[3].pk)), 1)
+
+    def test_rebuild_replaces_rows_and_renders_on_detail_page(self):
+        call_command("build_recommendations", stdout=StringIO())
+        call_command("build_recommendations", stdout=StringIO())
+        self.assertEqual(
+            list(
+                BookRecommendation.objects.filter(book=self.books[0]).values_list(
+                    "recommended__title", flat=True
+                )
+            ),
+            ["Book 1", "Book 2"],
+        )
+        url = reverse("book-detail", args=[self.books[0].pk])
+        response = self.client.get(url)
+        self.assertContains(response, "Borrowers of this book also borrowed")
+        self.assertContains(response, self.books[2].get_absolute_url())
+        response = self.client.get(reverse("book-detail", args=[self.books[3].pk]))
+        self.assertNotContains(response, "Borrowers of this book also borrowed")
+
+
+class ArchiveCatalogCommandTest(TestCase):
+    def setUp(self):
+        self.branch = Branch.objects.create(name="North")
+        self.book = Book.objects.create(title="Book", summary="Summary", isbn="1")
+        for number in range(5):
+            BookInstance.objects.create(
+                book=self.book,
+                imprint=f"Withdrawn {number}",
+                status="w",
+                branch=self.branch,
+            )
+        self.kept = BookInstance.objects.create(
+            book=self.book, imprint="In maintenance", status="m"
+        )
+
+    def test_dry_run_changes_nothing(self):
+        out = StringIO()
+        call_command("archive_catalog", dry_run=True, stdout=out)
+        self.assertIn("5 withdrawn copies would be archived", out.getvalue())
+        self.assertEqual(BookInstance.objects.count(), 6)
+        self.assertFalse(ArchivedBookInstance.objects.exists())
+
+    def test_moves_withdrawn_copies_in_batches(self):
+        withdrawn = set(
+            BookInstance.objects.filter(status="w").values_list("pk", flat=True)
+        )
+        out = StringIO()
+        call_command("archive_catalog", batch_size=2, stdout=out)
+        self.assertIn("Archived 5 copies in", out.getvalue())
+        self.assertEqual(list(BookInstance.objects.all()), [self.kept])
+        self.assertEqual(
+            set(ArchivedBookInstance.objects.values_list("pk", flat=True)), withdrawn
+        )
+        archived = ArchivedBookInstance.objects.first()
+        self.assertEqual(archived.title, "Book")
+        self.assertEqual(archived.branch, self.branch)
+        # Nothing left to do on the next run.
+        out = StringIO()
+        call_command("archive_catalog", stdout=out)
+        self.assertIn("Archived 0 copies in", out.getvalue())
+
+    def test_batch_cost_does_not_grow_with_its_size(self):
+        with CaptureQueriesContext(connection) as one_copy:
+            archive_catalog.archive_batch(1)
+        with CaptureQueriesContext(connection) as four_copies:
+            archive_catalog.archive_batch(4)
+        self.assertEqual(len(four_copies), len(one_copy))
+        # The kiosk feed still hears about every removed copy.
+        self.assertEqual(
+            CopyStatusChange.objects.filter(status="").count(),
+            5,
+        )
+
+
+@override_settings(CATALOG_STREAM_LOG_RETENTION=24)
+class PruneChangeLogCommandTest(TestCase):
+    def test_deletes_entries_past_retention(self):
+        book = Book.objects.create(title="Book", summary="Summary", isbn="1")
+        BookInstance.objects.create(book=book, imprint="Old")
+        old = CopyStatusChange.objects.get()
+        old.created -= datetime.timedelta(hours=25)
+        old.save()
+        BookInstance.objects.create(book=book, imprint="New")
+        out = StringIO()
+        call_command("prune_change_log", stdout=out)
+        self.assertIn("Pruned 1 change log entries.", out.getvalue())
+        self.assertFalse(CopyStatusChange.objects.filter(pk=old.pk).exists())
+        self.assertEqual(CopyStatusChange.objects.count(), 1)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class ImportPatronsCommandTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.group = Group.objects.create(name="Library Members")
+        self.branch = Branch.objects.create(name="North")
+        User.objects.create_user(username="existing", password="pw")
+        self.csv_path = self.directory / "patrons.csv"
+        self.csv_path.write_text(
+            "username,email,first_name,last_name,password,branch\n"
+            "alice,alice@example.com,Alice,Smith,secret-1,North\n"
+            "bob,bob@example.com,Bob,Jones,,\n"
+            "existing,,,,,\n"
+            "carol,,Carol,,secret-3,Nowhere\n"
+        )
+
+    def test_imports_users_groups_and_patrons(self):
+        tokens_path = self.directory / "tokens.csv"
+        out, err = StringIO(), StringIO()
+        call_command(
+            "import_patrons",
+            str(self.csv_path),
+            group=["Library Members"],
+            batch_size=2,
+            workers=2,
+            tokens_file=str(tokens_path),
+            stdout=out,
+            stderr=err,
+        )
+        self.assertIn("Imported 3 users", out.getvalue())
+        self.assertIn("skipped 1", out.getvalue())
+        self.assertIn("Nowhere", err.getvalue())
+
+        alice = User.objects.get(username="alice")
+        self.assertTrue(alice.check_password("secret-1"))
+        self.assertEqual((alice.email, alice.last_name), ("alice@example.com", "Smith"))
+        self.assertEqual(alice.patron.branch, self.branch)
+        self.assertEqual(
+            set(self.group.user_set.values_list("username", flat=True)),
+            {"alice", "bob", "carol"},
+        )
+
+        bob = User.objects.get(username="bob")
+        self.assertFalse(bob.has_usable_password())
+        self.assertFalse(Patron.objects.filter(user=bob).exists())
+        lines = tokens_path.read_text().splitlines()
+        self.assertEqual(len(lines), 2)
+        username, email, reset_url = lines[1].split(",")
+        self.assertEqual((username, email), ("bob", "bob@example.com"))
+        token = reset_url.rstrip("/").split("/")[-1]
+        self.assertTrue(default_token_generator.check_token(bob, token))
+
+    def test_unknown_group(self):
+        with self.assertRaises(CommandError):
+            call_command("import_patrons", str(self.csv_path), group=["Nope"])
+
+
+class CheckCatalogCommandTest(TestCase):
+    def setUp(self):
+        author = Author.objects.create(first_name="John", last_name="Smith")
+        user = User.objects.create_user(username="borrower", password="pw")
+        self.books = [
+            Book.objects.create(title="A", summary="-", isbn="978-0-12", author=author),
+            Book.objects.create(title="B", summary="-", isbn="978012", author=author),
+            Book.objects.create(title="C", summary="-", isbn="999", author=None),
+        ]
+        BookInstance.objects.create(book=self.books[0], imprint="ok", status="a")
+        self.orphan = BookInstance.objects.create(
+            book=None, imprint="orphan", status="a"
+        )
+        self.no_borrower = BookInstance.objects.create(
+            book=self.books[0], imprint="no borrower", status="o"
+        )
+        self.no_due_date = BookInstance.objects.create(
+            book=self.books[1], imprint="no due date", status="o", borrower=user
+        )
+
+    def run_check(self, **options):
+        out = StringIO()
+        call_command("check_catalog", workers=1, chunk_size=2, stdout=out, **options)
+        return {
+            line.split()[0]: line.split()[1:3]
+            for line in out.getvalue().splitlines()[1:-1]
+        }, out.getvalue()
+
+    def test_reports_violations(self):
+        results, output = self.run_check()
+        self.assertEqual(
+            results,
+            {
+                "orphan_copies": ["1", "0"],
+                "books_without_author": ["1", "-"],
+                "loans_without_borrower": ["1", "0"],
+                "loans_without_due_date": ["1", "0"],
+                "duplicate_isbns": ["2", "-"],
+            },
+        )
+        self.assertIn(f"{self.books[0].pk}/{self.books[1].pk}", output)
+        self.assertIn("6 problems left", output)
+        self.assertEqual(BookInstance.objects.get(pk=self.orphan.pk).status, "a")
+
+    def test_fix(self):
+        results, output = self.run_check(fix=True)
+        self.assertEqual(results["orphan_copies"], ["1", "1"])
+        self.assertIn("3 problems left", output)
+        self.orphan.refresh_from_db()
+        self.no_borrower.refresh_from_db()
+        self.no_due_date.refresh_from_db()
+        self.assertEqual((self.orphan.status, self.orphan.version), ("w", 1))
+        self.assertEqual(self.no_borrower.status, "a")
+        self.assertIsNotNone(self.no_due_date.due_back)
+        results, output = self.run_check()
+        self.assertEqual(results["loans_without_due_date"], ["0", "0"])
+
+
+class AssessFinesCommandTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="late", password="x")
+        cls.english = Language.objects.create(name="English")
+        cls.rare = Genre.objects.create(name="Rare books")
+        cls.book = Book.objects.create(
+            title="Novel", summary="-", isbn="N1", language=cls.english
+        )
+        cls.rare_book = Book.objects.create(
+            title="Folio", summary="-", isbn="F1", language=cls.english
+        )
+        cls.rare_book.genre.add(cls.rare)
+        cls.today = datetime.date(2030, 1, 31)
+        for book in (cls.book, cls.rare_book):
+            BookInstance.objects.create(
+                book=book,
+                imprint="Imprint",
+                status="o",
+                borrower=cls.user,
+                due_back=cls.today - datetime.timedelta(days=10),
+            )
+        # Not overdue yet.
+        BookInstance.objects.create(
+            book=cls.book,
+            imprint="Imprint",
+            status="o",
+            borrower=cls.user,
+            due_back=cls.today,
+        )
+        FineRate.objects.create(daily_rate="0.10")
+        FineRate.objects.create(language=cls.english, daily_rate="0.25")
+        FineRate.objects.create(genre=cls.rare, daily_rate="1.00", maximum="5.00")
+
+    def assess(self, today):
+        call_command("assess_fines", date=today.isoformat(), stdout=StringIO())
+
+    def test_fines_use_the_most_specific_rate(self):
+        self.assess(self.today)
+        amounts = dict(Fine.objects.values_list("book_id", "amount"))
+        self.assertEqual(
+            amounts, {self.book.pk: Decimal("2.50"), self.rare_book.pk: Decimal("5.00")}
+        )
+        self.assertEqual(fines.balance_for(self.user), Decimal("7.50"))
+
+    def test_subgenres_inherit_the_nearest_rate(self):
+        maps = Genre.objects.create(name="Maps", parent=self.rare)
+        charts = Genre.objects.create(name="Sea charts", parent=maps)
+        self.book.genre.add(charts)
+        self.assess(self.today)
+        self.assertEqual(Fine.objects.get(book=self.book).amount, Decimal("5.00"))
+        # A rate on a nearer ancestor takes precedence.
+        FineRate.objects.create(genre=maps, daily_rate="0.20")
+        self.assess(self.today)
+        self.assertEqual(Fine.objects.get(book=self.book).amount, Decimal("2.00"))
+
+    def test_only_one_default_rate(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            FineRate.objects.create(daily_rate="0.50")
+        # Reported as a validation error in forms (the admin).
+        with self.assertRaises(ValidationError):
+            FineRate(daily_rate="0.50").full_clean(exclude=["is_default"])
+        maps = Genre.objects.create(name="Maps")
+        FineRate(genre=maps, daily_rate="0.50").full_clean(exclude=["is_default"])
+
+    def test_uncapped_rate_wins_a_tie(self):
+        maps = Genre.objects.create(name="Maps")
+        FineRate.objects.create(genre=maps, daily_rate="1.00")
+        self.rare_book.genre.add(maps)
+        self.assess(self.today)
+        self.assertEqual(Fine.objects.get(book=self.rare_book).amount, Decimal("10.00"))
+
+    def test_reassessment_updates_the_same_loans(self):
+        self.assess(self.today)
+        self.assess(self.today + datetime.timedelta(days=2))
+        self.assertEqual(Fine.objects.count(), 3)
+        self.assertEqual(fines.balance_for(self.user), Decimal("8.50"))
+
+    def test_payment_reduces_the_balance(self):
+        self.assess(self.today)
+        fine = Fine.objects.get(book=self.rare_book)
+        fine.paid = fine.amount
+        fine.save()
+        self.assertEqual(fines.balance_for(self.user), Decimal("2.50"))
+
+    def test_balance_is_shown_on_my_borrowed(self):
+        self.assess(self.today)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("my-borrowed"))
+        self.assertContains(response, "Outstanding fines:</strong> 7.50")
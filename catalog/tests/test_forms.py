@@ -1,9 +1,10 @@
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase
 
 # Create your tests here.
 
 import datetime
-from catalog.forms import RenewBookForm
+from catalog.forms import BookForm, RenewBookForm
+from catalog.models import Author, Genre, Language
 
 
 class RenewBookFormTest(SimpleTestCase):
@@ -50,3 +51,35 @@ class RenewBookFormTest(SimpleTestCase):
             form.fields["renewal_date"].help_text,
             "Enter a date between now and 4 weeks (default 3).",
         )
+
+
+class BookFormTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.genre = Genre.objects.create(name="Fantasy")
+        cls.language = Language.objects.create(name="English")
+        cls.author = Author.objects.create(first_name="John", last_name="Smith")
+
+    def test_reference_choices_come_from_cache(self):
+        BookForm().as_p()
+        with self.assertNumQueries(1):
+            # Only the author choices are read from the database.
+            html = BookForm().as_p()
+        self.assertIn("Fantasy", html)
+        self.assertIn("English", html)
+
+    def test_form_saves_genre_and_language(self):
+        form = BookForm(
+            data={
+                "title": "Book Title",
+                "author": self.author.pk,
+                "summary": "My book summary",
+                "isbn": "ABCDEFG",
+                "genre": [self.genre.pk],
+                "language": self.language.pk,
+            }
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        book = form.save()
+        self.assertEqual(book.display_genre(), "Fantasy")
+        self.assertEqual(book.language, self.language)
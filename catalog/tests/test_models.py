@@ -1,8 +1,33 @@
-from django.test import TestCase
+import datetime
+
+from unittest import mock
+
+import numpy as np
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from scipy import sparse
 
 # Create your tests here.
 
-from catalog.models import Author, Genre, Language, Book, BookInstance
+from catalog import authors, genres, recommendations, refdata
+from catalog.changefeed import update_copies
+from catalog.checks import check_shared_cache
+from catalog.management.commands.archive_catalog import archive_batch
+from catalog.models import (
+    Author,
+    AuthorStats,
+    Genre,
+    GenreClosure,
+    Language,
+    Book,
+    BookInstance,
+    BookSimilarity,
+    ConcurrentUpdateError,
+)
 
 
 class AuthorModelTest(TestCase):
@@ -82,6 +107,142 @@ class GenreModelTest(TestCase):
         self.assertEqual(str(genre), expected_object_name)
 
 
+class GenreTreeTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fiction = Genre.objects.create(name="Fiction")
+        cls.fantasy = Genre.objects.create(name="Fantasy", parent=cls.fiction)
+        cls.epic = Genre.objects.create(name="Epic fantasy", parent=cls.fantasy)
+        cls.history = Genre.objects.create(name="History")
+        cls.both = Book.objects.create(title="Both", summary="-", isbn="B")
+        cls.both.genre.set([cls.fiction, cls.epic])
+        cls.novel = Book.objects.create(title="Novel", summary="-", isbn="N")
+        cls.novel.genre.set([cls.fantasy])
+        cls.essay = Book.objects.create(title="Essay", summary="-", isbn="E")
+        cls.essay.genre.set([cls.history])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_closure_holds_every_ancestor(self):
+        self.assertEqual(
+            sorted(
+                GenreClosure.objects.filter(descendant=self.epic).values_list(
+                    "ancestor__name", "depth"
+                )
+            ),
+            [("Epic fantasy", 0), ("Fantasy", 1), ("Fiction", 2)],
+        )
+
+    def test_books_in_subtree_are_listed_once(self):
+        self.assertQuerySetEqual(
+            genres.books_in(self.fiction).order_by("title"),
+            [self.both, self.novel],
+        )
+
+    def test_moving_a_genre_moves_its_subtree(self):
+        self.fantasy.parent = self.history
+        self.fantasy.save()
+        self.assertEqual(
+            sorted(genres.subtree_ids(self.history)),
+            sorted([self.history.pk, self.fantasy.pk, self.epic.pk]),
+        )
+        self.assertEqual(genres.subtree_ids(self.fiction), [self.fiction.pk])
+
+    def test_deleting_a_genre_makes_its_children_roots(self):
+        self.fantasy.delete()
+        self.assertEqual(genres.subtree_ids(self.epic), [self.epic.pk])
+        self.assertEqual(genres.subtree_ids(self.fiction), [self.fiction.pk])
+
+    def test_rollup_counts_each_book_once_per_ancestor(self):
+        counts = genres.rollup_counts(Book.objects.values("pk"))
+        self.assertEqual(counts[self.fiction.pk], 2)
+        self.assertEqual(counts[self.fantasy.pk], 2)
+        self.assertEqual(counts[self.epic.pk], 1)
+        self.assertEqual(counts[self.history.pk], 1)
+
+    def test_renaming_a_genre_keeps_the_closure(self):
+        self.fantasy.name = "Fantasy fiction"
+        with CaptureQueriesContext(connection) as queries:
+            self.fantasy.save()
+        self.assertFalse([q for q in queries if "catalog_genreclosure" in q["sql"]])
+
+    def test_find_root_ignores_subgenres(self):
+        Genre.objects.create(name="fiction", parent=self.history)
+        self.assertEqual(genres.find_root("FICTION"), self.fiction.pk)
+        self.assertIsNone(genres.find_root("Fantasy"))
+
+    def test_genre_cannot_be_placed_under_its_subgenre(self):
+        self.fiction.parent = self.epic
+        with self.assertRaises(ValidationError):
+            self.fiction.full_clean()
+
+
+class AuthorStatsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name="Ann", last_name="Author")
+        cls.other = Author.objects.create(first_name="Bob", last_name="Other")
+        cls.book = Book.objects.create(
+            title="Book", summary="-", isbn="A1", author=cls.author
+        )
+
+    def stats(self, author):
+        stats = AuthorStats.objects.get(author=author)
+        return stats.num_titles, stats.num_copies, stats.num_loans
+
+    def test_copies_and_loans_are_counted_incrementally(self):
+        copy = BookInstance.objects.create(book=self.book, imprint="I", status="a")
+        BookInstance.objects.create(book=self.book, imprint="I", status="o")
+        self.assertEqual(self.stats(self.author), (1, 2, 1))
+
+        copy = BookInstance.objects.get(pk=copy.pk)
+        copy.status = "o"
+        copy.save()
+        self.assertEqual(self.stats(self.author), (1, 2, 2))
+        update_copies(BookInstance.objects.filter(book=self.book), status="a")
+        self.assertEqual(self.stats(self.author), (1, 2, 0))
+        copy.delete()
+        self.assertEqual(self.stats(self.author), (1, 1, 0))
+
+    def test_book_moves_with_its_copies(self):
+        BookInstance.objects.create(book=self.book, imprint="I", status="o")
+        self.book.author = self.other
+        self.book.save()
+        self.assertEqual(self.stats(self.author), (0, 0, 0))
+        self.assertEqual(self.stats(self.other), (1, 1, 1))
+
+    def test_copy_moves_between_books(self):
+        other_book = Book.objects.create(
+            title="Other", summary="-", isbn="B1", author=self.other
+        )
+        copy = BookInstance.objects.create(book=self.book, imprint="I", status="o")
+        copy = BookInstance.objects.get(pk=copy.pk)
+        copy.book = other_book
+        copy.save()
+        self.assertEqual(self.stats(self.author), (1, 0, 0))
+        self.assertEqual(self.stats(self.other), (1, 1, 1))
+
+    def test_archiving_recounts_the_authors(self):
+        BookInstance.objects.create(book=self.book, imprint="I", status="a")
+        BookInstance.objects.create(book=self.book, imprint="I", status="w")
+        self.assertEqual(self.stats(self.author), (1, 2, 0))
+        archive_batch(10)
+        self.assertEqual(self.stats(self.author), (1, 1, 0))
+
+    def test_incremental_stats_match_a_rebuild(self):
+        second = Book.objects.create(
+            title="Second", summary="-", isbn="A2", author=self.author
+        )
+        for status in "aoom":
+            BookInstance.objects.create(book=second, imprint="I", status=status)
+        before = self.stats(self.author)
+        AuthorStats.objects.all().delete()
+        authors.rebuild()
+        self.assertEqual(self.stats(self.author), before)
+        self.assertEqual(self.stats(self.other), (0, 0, 0))
+
+
 class LanguageModelTest(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -131,6 +292,10 @@ class BookModelTest(TestCase):
         test_book.genre.set(genre_objects_for_book)
         test_book.save()
 
+    def test_default_ordering_does_not_join_author(self):
+        # The ordering must match book_title_idx to be answered by it.
+        self.assertNotIn("JOIN", str(Book.objects.all().query))
+
     def test_title_label(self):
         book = Book.objects.get(id=1)
         field_label = book._meta.get_field("title").verbose_name
@@ -269,3 +434,206 @@ class BookInstanceModelTest(TestCase):
         bookinstance = BookInstance.objects.get(imprint="test_imprint")
         help_text = bookinstance._meta.get_field("status").default
         self.assertEqual(help_text, "d")
+
+
+class ReferenceDataCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Genre.objects.create(name="Fantasy")
+        Language.objects.create(name="English")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_tables_are_loaded_once(self):
+        with self.assertNumQueries(2):
+            refdata.genres()
+            refdata.languages()
+        with self.assertNumQueries(0):
+            self.assertEqual(list(refdata.genres().values()), ["Fantasy"])
+            self.assertEqual(list(refdata.languages().values()), ["English"])
+
+    def test_save_and_delete_reload_table(self):
+        refdata.genres()
+        genre = Genre.objects.create(name="Poetry")
+        self.assertEqual(list(refdata.genres().values()), ["Fantasy", "Poetry"])
+        genre.delete()
+        self.assertEqual(list(refdata.genres().values()), ["Fantasy"])
+        # Other tables are not reloaded.
+        refdata.languages()
+        Genre.objects.create(name="Drama")
+        with self.assertNumQueries(0):
+            refdata.languages()
+
+    def test_deploy_check_requires_a_shared_cache(self):
+        self.assertEqual(
+            [error.id for error in check_shared_cache(None)], ["catalog.E001"]
+        )
+        shared = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.redis.RedisCache",
+                "LOCATION": "redis://localhost:6379",
+            }
+        }
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class BookSimilarityTest(TestCase):
+    def setUp(self):
+        author = Author.objects.create(first_name="Big", last_name="Bob")
+        self.fantasy, self.poetry, self.drama = [
+            Genre.objects.create(name=name) for name in ["Fantasy", "Poetry", "Drama"]
+        ]
+        self.books = [
+            Book.objects.create(
+                title=f"Book {n}", summary="Summary", isbn=f"ISBN{n}", author=author
+            )
+            for n in range(4)
+        ]
+
+    def similar(self, book):
+        return [
+            (similarity.similar.title, round(similarity.score, 2))
+            for similarity in book.similar.select_related("similar")
+        ]
+
+    def test_jaccard_matches_set_definition(self):
+        matrix = sparse.csr_matrix(np.array([[1, 1, 0], [1, 0, 1], [0, 0, 0]]))
+        self.assertEqual(
+            recommendations.jaccard(matrix[:1], matrix).toarray().tolist(),
+            [[1.0, 1 / 3, 0.0]],
+        )
+
+    def test_genre_set_refreshes_once_per_transaction(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.books[0].genre.set([self.fantasy])
+        with mock.patch(
+            "catalog.signals.refresh_similarities"
+        ) as refresh, self.captureOnCommitCallbacks(execute=True):
+            self.books[0].genre.set([self.poetry])
+            self.books[1].genre.add(self.poetry)
+        refresh.assert_called_once_with({self.books[0].pk, self.books[1].pk})
+
+    def test_genre_changes_refresh_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.books[0].genre.set([self.fantasy, self.poetry])
+            self.books[1].genre.set([self.fantasy])
+            self.books[2].genre.set([self.drama])
+        self.assertEqual(self.similar(self.books[0]), [("Book 1", 0.5)])
+        self.assertEqual(self.similar(self.books[1]), [("Book 0", 0.5)])
+        self.assertEqual(self.similar(self.books[2]), [])
+
+        # Adding a book from the genre side.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.poetry.book_set.add(self.books[3])
+        self.assertEqual(
+            self.similar(self.books[0]), [("Book 1", 0.5), ("Book 3", 0.5)]
+        )
+
+        # Book 1 moves to another genre: Book 0 no longer lists it.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.books[1].genre.set([self.drama])
+        self.assertEqual(self.similar(self.books[0]), [("Book 3", 0.5)])
+        self.assertEqual(self.similar(self.books[2]), [("Book 1", 1.0)])
+
+        # Deleting a genre or a book.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.poetry.delete()
+        self.assertEqual(self.similar(self.books[0]), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.books[1].delete()
+        self.assertEqual(self.similar(self.books[2]), [])
+
+        # A full rebuild agrees with the incremental updates.
+        rows = set(BookSimilarity.objects.values_list("book", "similar", "rank"))
+        recommendations.build_similarities()
+        self.assertEqual(
+            set(BookSimilarity.objects.values_list("book", "similar", "rank")), rows
+        )
+
+    def test_large_genre_change_is_deferred(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fantasy.book_set.add(*self.books[:3])
+        rows = set(BookSimilarity.objects.values_list("book", "similar", "rank"))
+        self.assertEqual(len(rows), 6)
+        with mock.patch("catalog.signals.refresh_similarities"):
+            self.books[3].genre.add(self.fantasy)
+        # Over the limit: only a count and the stale mark, however large the
+        # genre, and the current lists are left alone.
+        with self.assertNumQueries(2):
+            self.assertFalse(
+                recommendations.refresh_similarities([self.books[3].pk], limit=3)
+            )
+        self.assertEqual(list(Book.objects.filter(similar_stale=True)), [self.books[3]])
+        self.assertEqual(
+            set(BookSimilarity.objects.values_list("book", "similar", "rank")), rows
+        )
+
+        self.assertEqual(recommendations.refresh_stale_similarities(), 1)
+        self.assertFalse(Book.objects.filter(similar_stale=True).exists())
+        rows = set(BookSimilarity.objects.values_list("book", "similar", "rank"))
+        self.assertEqual(len(rows), 12)
+        recommendations.build_similarities()
+        self.assertEqual(
+            set(BookSimilarity.objects.values_list("book", "similar", "rank")), rows
+        )
+
+
+class BookInstanceConcurrencyTest(TestCase):
+    def setUp(self):
+        book = Book.objects.create(title="Book", summary="Summary", isbn="1")
+        self.copy = BookInstance.objects.create(book=book, imprint="Imprint")
+
+    def test_concurrent_saves_conflict(self):
+        first = BookInstance.objects.get(pk=self.copy.pk)
+        second = BookInstance.objects.get(pk=self.copy.pk)
+        first.status = "a"
+        first.save()
+        self.assertEqual(first.version, 1)
+        second.imprint = "Other imprint"
+        with self.assertRaises(ConcurrentUpdateError), transaction.atomic():
+            second.save()
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.status, self.copy.imprint), ("a", "Imprint"))
+        # After reloading, the change applies.
+        second.refresh_from_db()
+        second.imprint = "Other imprint"
+        second.save()
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.status, self.copy.version), ("a", 2))
+
+    def test_only_changed_fields_are_written(self):
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        copy.due_back = datetime.date.today()
+        with CaptureQueriesContext(connection) as queries:
+            copy.save()
+        (update,) = [q["sql"] for q in queries if q["sql"].startswith("UPDATE")]
+        self.assertIn('"due_back"', update)
+        self.assertIn('"version"', update)
+        self.assertNotIn('"imprint"', update)
+        # Saving without changes writes nothing.
+        with self.assertNumQueries(0):
+            copy.save()
+
+    def test_refresh_resets_the_loaded_values(self):
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        BookInstance.objects.filter(pk=self.copy.pk).update(
+            status="a", version=F("version") + 1
+        )
+        copy.refresh_from_db()
+        # The reloaded status is not a change of this instance.
+        self.assertEqual(copy.changed_fields(), [])
+        with self.assertNumQueries(0):
+            copy.save()
+        copy.refresh_from_db(fields=["imprint"])
+        self.assertEqual(copy.changed_fields(), [])
+
+    def test_bulk_update_bumps_version(self):
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        BookInstance.objects.filter(pk=self.copy.pk).update(
+            status="a", version=F("version") + 1
+        )
+        copy.imprint = "Other imprint"
+        with self.assertRaises(ConcurrentUpdateError), transaction.atomic():
+            copy.save()
@@ -1,14 +1,37 @@
-from django.test import TestCase
+from django.test import RequestFactory, TestCase, override_settings
 
 # Create your tests here.
 
 import datetime
+import json
+import os
+import tempfile
+import tracemalloc
+from pathlib import Path
+from unittest import mock
+from django.conf import settings
 from django.utils import timezone
 from django.urls import reverse
-
-from catalog.models import BookInstance, Book, Genre, Language, Author
+from django.core.cache import cache
+from django.db.models import F
+from django.forms import ModelForm
+
+from catalog import backends, metrics, pagecache, profiling
+from catalog.checks import check_metrics_token
+from catalog.forms import BookInstanceAdminForm
+from catalog.models import (
+    BookInstance,
+    Book,
+    Branch,
+    Genre,
+    Language,
+    Author,
+    Patron,
+    ProfileReport,
+)
 from django.contrib.auth.models import User  # Required to assign User as a borrower.
 from django.contrib.auth.models import (
+    Group,
     Permission,
 )  # Required to grant the permission needed to set a book as returned.
 
@@ -52,6 +75,175 @@ class AuthorListViewTest(TestCase):
         self.assertTrue(response.context["is_paginated"] is True)
         self.assertEqual(len(response.context["author_list"]), 3)
 
+    def test_browse_by_letter(self):
+        Author.objects.create(first_name="Ann", last_name="adams")
+        Author.objects.create(first_name="Bea", last_name="Baker")
+        response = self.client.get(reverse("authors") + "?letter=a")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["current_letter"], "A")
+        self.assertEqual(
+            [author.last_name for author in response.context["author_list"]],
+            ["adams"],
+        )
+
+    def test_invalid_letter_lists_all_authors(self):
+        response = self.client.get(reverse("authors") + "?letter=ab")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["current_letter"], "")
+        self.assertEqual(response.context["paginator"].count, 13)
+
+    def test_pagination_links_keep_letter(self):
+        response = self.client.get(reverse("authors") + "?letter=S")
+        self.assertContains(response, "?letter=S&amp;page=2")
+
+
+class AuthorDetailViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name="Prolific", last_name="Writer")
+        for number in range(25):
+            book = Book.objects.create(
+                title=f"Title {number:02}",
+                summary="-",
+                isbn=f"P{number}",
+                author=cls.author,
+            )
+            for status in "ao":
+                BookInstance.objects.create(book=book, imprint="Imprint", status=status)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_bibliography_is_paginated_with_annotated_counts(self):
+        url = reverse("author-detail", args=[self.author.pk])
+        response = self.client.get(url)
+        books = response.context["book_list"]
+        self.assertTrue(response.context["is_paginated"])
+        self.assertEqual(len(books), 20)
+        self.assertEqual((books[0].num_copies, books[0].num_available), (2, 1))
+        response = self.client.get(url + "?page=2")
+        self.assertEqual(
+            [book.title for book in response.context["book_list"]],
+            [f"Title {number}" for number in range(20, 25)],
+        )
+
+    def test_page_queries_do_not_depend_on_book_count(self):
+        url = reverse("author-detail", args=[self.author.pk])
+        self.client.get(url)
+        # Session-less anonymous request: author, stats, count and the page.
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        stats = response.context["stats"]
+        self.assertEqual(
+            (stats.num_titles, stats.num_copies, stats.num_loans), (25, 50, 25)
+        )
+
+
+class BookListViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        test_author = Author.objects.create(first_name="John", last_name="Smith")
+        cls.fantasy = Genre.objects.create(name="Fantasy")
+        cls.english = Language.objects.create(name="English")
+        for index, title in enumerate(["Apple", "apricot", "Banana", "cherry"]):
+            book = Book.objects.create(
+                title=title,
+                summary="My book summary",
+                isbn=f"ISBN{index}",
+                author=test_author,
+                language=cls.english if index % 2 else None,
+            )
+            if index < 2:
+                book.genre.add(cls.fantasy)
+        BookInstance.objects.create(
+            book=Book.objects.get(title="Banana"), imprint="Imprint", status="a"
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_view_url_accessible_by_name(self):
+        response = self.client.get(reverse("books"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "catalog/book_list.html")
+
+    def test_browse_by_letter_is_case_insensitive(self):
+        response = self.client.get(reverse("books") + "?letter=A")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [book.title for book in response.context["book_list"]],
+            ["Apple", "apricot"],
+        )
+
+    def test_filter_by_genre(self):
+        response = self.client.get(reverse("books") + f"?genre={self.fantasy.pk}")
+        self.assertEqual(
+            [book.title for book in response.context["book_list"]],
+            ["Apple", "apricot"],
+        )
+
+    def test_filter_by_availability_and_language(self):
+        response = self.client.get(reverse("books") + "?available=1")
+        self.assertEqual(
+            [book.title for book in response.context["book_list"]], ["Banana"]
+        )
+        response = self.client.get(
+            reverse("books") + f"?available=1&language={self.english.pk}"
+        )
+        self.assertEqual(len(response.context["book_list"]), 0)
+
+    def test_facet_counts(self):
+        response = self.client.get(reverse("books"))
+        facets = response.context["facets"]
+        self.assertEqual(facets["available"], 1)
+        self.assertEqual(
+            [(value["name"], value["count"]) for value in facets["genre"]],
+            [("Fantasy", 2)],
+        )
+        self.assertEqual(
+            [(value["name"], value["count"]) for value in facets["language"]],
+            [("English", 2)],
+        )
+
+    def test_facet_counts_follow_the_browse_letter(self):
+        response = self.client.get(reverse("books") + "?letter=A")
+        facets = response.context["facets"]
+        self.assertEqual(facets["available"], 0)
+        self.assertEqual(
+            [(value["name"], value["count"]) for value in facets["language"]],
+            [("English", 1)],
+        )
+
+    def test_parent_genre_includes_subgenres(self):
+        fiction = Genre.objects.create(name="Fiction")
+        self.fantasy.parent = fiction
+        self.fantasy.save()
+        Book.objects.get(title="cherry").genre.add(fiction)
+        response = self.client.get(reverse("books") + f"?genre={fiction.pk}")
+        self.assertEqual(
+            [book.title for book in response.context["book_list"]],
+            ["Apple", "apricot", "cherry"],
+        )
+        self.assertEqual(
+            [
+                (value["name"], value["count"])
+                for value in response.context["facets"]["genre"]
+            ],
+            [("Fiction", 3), ("Fantasy", 2)],
+        )
+
+    def test_facet_counts_are_cached_and_invalidated(self):
+        self.client.get(reverse("books"))
+        with self.assertNumQueries(2):
+            # Only the page count and the page itself; facets come from cache.
+            self.client.get(reverse("books"))
+
+        BookInstance.objects.create(
+            book=Book.objects.get(title="cherry"), imprint="Imprint", status="a"
+        )
+        response = self.client.get(reverse("books"))
+        self.assertEqual(response.context["facets"]["available"], 2)
+
 
 class LoanedBookInstancesByUserListViewTest(TestCase):
     def setUp(self):
@@ -346,6 +538,40 @@ class RenewBookInstancesViewTest(TestCase):
         )
         self.assertRedirects(response, reverse("all-borrowed"))
 
+    def test_concurrent_change_is_reported_not_overwritten(self):
+        login = self.client.login(username="testuser2", password="2HJ1vRV0Z&3iD")
+        url = reverse("renew-book-librarian", kwargs={"pk": self.test_bookinstance1.pk})
+        response = self.client.get(url)
+        version = response.context["form"].initial["version"]
+
+        # Another librarian returns the copy meanwhile.
+        other = BookInstance.objects.get(pk=self.test_bookinstance1.pk)
+        other.status = "a"
+        other.save()
+
+        renewal_date = datetime.date.today() + datetime.timedelta(weeks=2)
+        response = self.client.post(
+            url, {"renewal_date": renewal_date, "version": version}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("changed by someone else", str(response.context["form"].errors))
+        self.test_bookinstance1.refresh_from_db()
+        self.assertEqual(self.test_bookinstance1.status, "a")
+        self.assertNotEqual(self.test_bookinstance1.due_back, renewal_date)
+
+        # Submitting the refreshed form applies the renewal.
+        response = self.client.post(
+            url,
+            {
+                "renewal_date": renewal_date,
+                "version": response.context["form"].data["version"],
+            },
+        )
+        self.assertRedirects(response, reverse("all-borrowed"))
+        self.test_bookinstance1.refresh_from_db()
+        self.assertEqual(self.test_bookinstance1.due_back, renewal_date)
+        self.assertEqual(self.test_bookinstance1.status, "a")
+
     def test_HTTP404_for_invalid_book_if_logged_in(self):
         import uuid
 
@@ -418,3 +644,412 @@ class AuthorCreateViewTest(TestCase):
         # Manually check redirect because we don't know what author was created.
         self.assertEqual(response.status_code, 302)
         self.assertTrue(response.url.startswith("/catalog/author/"))
+
+
+@override_settings(CATALOG_PAGE_CACHE_TIMEOUT=60)
+class AnonymousPageCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name="John", last_name="Smith")
+        User.objects.create_user(username="testuser1", password="1X<ISRUkw+tuK")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_pages_are_cached(self):
+        url = reverse("author-detail", args=[self.author.pk])
+        response = self.client.get(url)
+        self.assertEqual(response["X-Page-Cache"], "miss")
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response["X-Page-Cache"], "hit")
+        self.assertContains(response, "Smith")
+
+    def test_query_string_is_part_of_key(self):
+        self.client.get(reverse("authors"))
+        response = self.client.get(reverse("authors") + "?letter=S")
+        self.assertEqual(response["X-Page-Cache"], "miss")
+
+    def test_authenticated_users_bypass_cache(self):
+        self.client.get(reverse("authors"))
+        self.client.login(username="testuser1", password="1X<ISRUkw+tuK")
+        response = self.client.get(reverse("authors"))
+        self.assertNotIn("X-Page-Cache", response)
+        self.assertContains(response, "testuser1")
+
+    def test_catalog_change_refreshes_page(self):
+        self.client.get(reverse("authors"))
+        Author.objects.create(first_name="Jane", last_name="Austen")
+        response = self.client.get(reverse("authors"))
+        self.assertEqual(response["X-Page-Cache"], "miss")
+        self.assertContains(response, "Austen")
+
+    def test_stale_page_served_while_another_request_renders(self):
+        url = reverse("authors")
+        self.client.get(url)
+        Author.objects.create(first_name="Jane", last_name="Austen")
+        # Simulate a concurrent request holding the re-render lock.
+        lock_key = pagecache._page_key(RequestFactory().get(url)) + ":lock"
+        cache.add(lock_key, 1)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response["X-Page-Cache"], "stale")
+        self.assertNotContains(response, "Austen")
+
+
+class PermissionCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="testuser1", password="1X<ISRUkw+tuK"
+        )
+        self.permission = Permission.objects.get(name="Set book as returned")
+        self.group = Group.objects.create(name="Librarians")
+
+    def has_perm(self):
+        # A fresh user object, as in a new request.
+        user = User.objects.get(pk=self.user.pk)
+        return user.has_perm("catalog.can_mark_returned")
+
+    def test_permissions_cached_across_requests(self):
+        self.user.user_permissions.add(self.permission)
+        self.assertTrue(self.has_perm())
+        with self.assertNumQueries(1):
+            # Only the user itself is loaded.
+            self.assertTrue(self.has_perm())
+
+    def test_user_permission_change_invalidates(self):
+        self.assertFalse(self.has_perm())
+        self.user.user_permissions.add(self.permission)
+        self.assertTrue(self.has_perm())
+        self.permission.user_set.remove(self.user)
+        self.assertFalse(self.has_perm())
+
+    def test_group_membership_and_group_permissions_invalidate(self):
+        self.group.permissions.add(self.permission)
+        self.assertFalse(self.has_perm())
+        self.user.groups.add(self.group)
+        self.assertTrue(self.has_perm())
+        self.group.permissions.clear()
+        self.assertFalse(self.has_perm())
+
+    def test_permission_required_view(self):
+        self.user.user_permissions.add(self.permission)
+        self.client.login(username="testuser1", password="1X<ISRUkw+tuK")
+        self.assertEqual(self.client.get(reverse("all-borrowed")).status_code, 200)
+        self.user.user_permissions.clear()
+        self.assertEqual(self.client.get(reverse("all-borrowed")).status_code, 403)
+
+    def test_cached_check_is_one_cache_read_and_no_queries(self):
+        self.user.user_permissions.add(self.permission)
+        self.assertTrue(self.has_perm())
+        user = User.objects.get(pk=self.user.pk)
+        # No database queries, and a single get_many (one round trip to
+        # Redis in production).
+        with self.assertNumQueries(0), mock.patch.object(
+            cache, "get_many", wraps=cache.get_many
+        ) as get_many:
+            self.assertTrue(user.has_perm("catalog.can_mark_returned"))
+        self.assertEqual(get_many.call_count, 1)
+
+    def test_process_local_cache_keeps_permissions_briefly(self):
+        with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            self.has_perm()
+        self.assertEqual(cache_set.call_args.args[2], backends.LOCAL_TIMEOUT)
+        cache.clear()
+        with mock.patch.object(
+            backends, "is_shared", return_value=True
+        ), mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            User.objects.get(pk=self.user.pk).get_all_permissions()
+        self.assertEqual(
+            cache_set.call_args.args[2], settings.CATALOG_PERMISSION_CACHE_TIMEOUT
+        )
+
+    def test_staff_sidebar_follows_permission_changes(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.client.login(username="testuser1", password="1X<ISRUkw+tuK")
+        self.assertNotContains(self.client.get(reverse("index")), "Create author")
+        self.user.user_permissions.add(self.permission)
+        self.assertContains(self.client.get(reverse("index")), "Create author")
+
+
+class MetricsViewTest(TestCase):
+    def setUp(self):
+        metrics_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(metrics_dir.cleanup)
+        self.metrics_dir = Path(metrics_dir.name)
+        override = override_settings(
+            CATALOG_METRICS_DIR=metrics_dir.name, CATALOG_METRICS_TOKEN="secret"
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client.defaults["HTTP_AUTHORIZATION"] = "Bearer secret"
+        self.addCleanup(metrics.reset)
+        metrics.reset()
+
+    def test_requests_are_recorded_per_url_name(self):
+        self.client.get(reverse("authors"))
+        self.client.get(reverse("index"))
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn(
+            'catalog_request_duration_seconds_count{view="authors"} 1', content
+        )
+        self.assertIn(
+            'catalog_request_duration_seconds_bucket{view="index",le="+Inf"} 1', content
+        )
+        self.assertIn('catalog_db_queries_total{view="authors"}', content)
+        # The index page counts visits in the session.
+        self.assertIn("catalog_session_writes_total 1", content)
+
+    def test_other_processes_are_summed(self):
+        other = metrics._empty_state()
+        other["queries"]["books"] = 5
+        other["cache"]["page:hit"] = 2
+        (self.metrics_dir / f"{os.getppid()}.json").write_text(json.dumps(other))
+        dead = metrics._empty_state()
+        dead["queries"]["books"] = 7
+        (self.metrics_dir / "999999999.json").write_text(json.dumps(dead))
+
+        content = self.client.get("/metrics").content.decode()
+        self.assertIn('catalog_db_queries_total{view="books"} 12', content)
+        self.assertIn(
+            'catalog_cache_lookups_total{cache="page",result="hit"} 2', content
+        )
+        # The exited process was folded into the archive.
+        self.assertFalse((self.metrics_dir / "999999999.json").exists())
+        content = self.client.get("/metrics").content.decode()
+        self.assertIn('catalog_db_queries_total{view="books"} 12', content)
+
+    def test_token(self):
+        del self.client.defaults["HTTP_AUTHORIZATION"]
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(response.status_code, 403)
+        # Without a token, only in DEBUG mode.
+        with override_settings(CATALOG_METRICS_TOKEN=""):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+            with override_settings(DEBUG=True):
+                self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+    def test_deploy_check_requires_a_token(self):
+        self.assertEqual(check_metrics_token(None), [])
+        with override_settings(CATALOG_METRICS_TOKEN=""):
+            self.assertEqual(
+                [error.id for error in check_metrics_token(None)], ["catalog.E002"]
+            )
+
+    def test_reset_forgets_what_the_master_recorded(self):
+        # suggest.warm() in the preloading master.
+        metrics.record_cache("suggest", "miss")
+        metrics.reset()
+        content = self.client.get("/metrics").content.decode()
+        self.assertNotIn('cache="suggest"', content)
+
+
+class ProfilingMiddlewareTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user(
+            username="staff", password="1X<ISRUkw+tuK", is_staff=True
+        )
+        User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="2HJ1vRV0Z&3iD"
+        )
+        User.objects.create_user(username="patron", password="2HJ1vRV0Z&3iD")
+
+    def test_staff_can_profile_a_request(self):
+        self.client.login(username="staff", password="1X<ISRUkw+tuK")
+        response = self.client.get(reverse("authors"), HTTP_X_PROFILE="1")
+        self.assertEqual(response.status_code, 200)
+        report = ProfileReport.objects.get(pk=response["X-Profile-Id"])
+        self.assertEqual(report.path, "/catalog/authors/")
+        self.assertEqual(report.status_code, 200)
+        self.assertIn("cumulative", report.function_stats)
+
+        response = self.client.get(reverse("authors") + "?_profile=1")
+        self.assertIn("X-Profile-Id", response)
+
+    def test_overlapping_requests_share_tracemalloc(self):
+        self.assertFalse(tracemalloc.is_tracing())
+        profiling._start_tracing()
+        profiling._start_tracing()
+        profiling._stop_tracing()
+        # The other request is still running.
+        self.assertTrue(tracemalloc.is_tracing())
+        profiling._stop_tracing()
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_requests_are_not_profiled_by_default(self):
+        self.client.login(username="staff", password="1X<ISRUkw+tuK")
+        response = self.client.get(reverse("authors"))
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertFalse(ProfileReport.objects.exists())
+
+    def test_non_staff_cannot_profile(self):
+        response = self.client.get(reverse("authors"), HTTP_X_PROFILE="1")
+        self.assertNotIn("X-Profile-Id", response)
+        self.client.login(username="patron", password="2HJ1vRV0Z&3iD")
+        response = self.client.get(reverse("authors"), HTTP_X_PROFILE="1")
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertFalse(ProfileReport.objects.exists())
+
+    def test_report_viewable_in_admin(self):
+        self.client.login(username="admin", password="2HJ1vRV0Z&3iD")
+        response = self.client.get(reverse("authors"), HTTP_X_PROFILE="1")
+        pk = response["X-Profile-Id"]
+        response = self.client.get(
+            reverse("admin:catalog_profilereport_change", args=[pk])
+        )
+        self.assertContains(response, "/catalog/authors/")
+        response = self.client.get(
+            reverse("admin:catalog_profilereport_collapsed", args=[pk])
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/plain")
+
+
+class BookInstanceAdminTest(TestCase):
+    def setUp(self):
+        User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="2HJ1vRV0Z&3iD"
+        )
+        book = Book.objects.create(title="Book", summary="Summary", isbn="1")
+        self.copy = BookInstance.objects.create(book=book, imprint="Imprint")
+        self.url = reverse("admin:catalog_bookinstance_change", args=[self.copy.pk])
+        self.client.login(username="admin", password="2HJ1vRV0Z&3iD")
+
+    def test_change_after_the_form_check_is_reported(self):
+        data = {
+            "id": self.copy.pk,
+            "book": self.copy.book_id,
+            "imprint": "Other imprint",
+            "status": "a",
+            "loaded_version": self.copy.version,
+        }
+        BookInstance.objects.filter(pk=self.copy.pk).update(
+            status="o", version=F("version") + 1
+        )
+        clean = BookInstanceAdminForm.clean
+        checked = []
+
+        def check_before_the_change(form):
+            # The first check ran before the other save, so it passes.
+            checked.append(form)
+            if len(checked) > 1:
+                return clean(form)
+            return ModelForm.clean(form)
+
+        with mock.patch.object(
+            BookInstanceAdminForm,
+            "clean",
+            autospec=True,
+            side_effect=check_before_the_change,
+        ):
+            response = self.client.post(self.url, data)
+        # The save was refused, and the form validated again.
+        self.assertEqual(len(checked), 2)
+        # The form is shown again with the error and the user's changes.
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "changed by someone else")
+        self.assertContains(response, "Other imprint")
+        self.assertNotContains(response, "was changed successfully")
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.imprint, self.copy.status), ("Imprint", "o"))
+
+    def test_stale_form_is_refused(self):
+        data = {
+            "id": self.copy.pk,
+            "book": self.copy.book_id,
+            "imprint": "Other imprint",
+            "status": "a",
+            "loaded_version": self.copy.version,
+        }
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        BookInstance.objects.filter(pk=self.copy.pk).update(
+            status="o", version=F("version") + 1
+        )
+        response = self.client.post(self.url, data)
+        self.assertContains(response, "changed by someone else")
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.imprint, self.copy.status), ("Imprint", "o"))
+
+
+class BranchScopeTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.north = Branch.objects.create(name="North")
+        cls.south = Branch.objects.create(name="South")
+        author = Author.objects.create(first_name="John", last_name="Smith")
+        cls.book = Book.objects.create(
+            title="Book Title", summary="Summary", isbn="ABCDEFG", author=author
+        )
+        cls.librarian = User.objects.create_user(username="librarian", password="pw")
+        cls.librarian.user_permissions.add(
+            Permission.objects.get(codename="can_mark_returned")
+        )
+        Patron.objects.create(user=cls.librarian, branch=cls.south)
+        due = datetime.date.today() + datetime.timedelta(days=3)
+        for branch, status, imprint in [
+            (cls.north, "a", "North available"),
+            (cls.north, "o", "North on loan"),
+            (cls.south, "o", "South on loan"),
+            (None, "a", "Unassigned"),
+        ]:
+            BookInstance.objects.create(
+                book=cls.book,
+                branch=branch,
+                status=status,
+                imprint=imprint,
+                due_back=due,
+                borrower=cls.librarian if status == "o" else None,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_index_counts_selected_branch(self):
+        response = self.client.get(reverse("index"))
+        self.assertEqual(response.context["num_instances"], 4)
+        self.assertIsNone(response.context["current_branch"])
+        response = self.client.get(reverse("index"), {"branch": self.north.pk})
+        self.assertEqual(response.context["num_instances"], 2)
+        self.assertEqual(response.context["num_instances_available"], 1)
+        self.assertContains(response, "South")
+        # An unknown branch means all branches.
+        response = self.client.get(reverse("index"), {"branch": "999"})
+        self.assertEqual(response.context["num_instances"], 4)
+
+    def test_book_copies_are_scoped(self):
+        url = reverse("book-detail", args=[self.book.pk])
+        response = self.client.get(url, {"branch": self.north.pk})
+        self.assertEqual(
+            sorted(copy.imprint for copy in response.context["copies"]),
+            ["North available", "North on loan"],
+        )
+        # Anonymous users are not scoped by session.
+        response = self.client.get(url)
+        self.assertEqual(len(response.context["copies"]), 4)
+
+    def test_all_borrowed_defaults_to_home_branch_then_session(self):
+        self.client.login(username="librarian", password="pw")
+        url = reverse("all-borrowed")
+        response = self.client.get(url)
+        self.assertEqual(response.context["current_branch"], self.south.pk)
+        self.assertEqual(
+            [copy.imprint for copy in response.context["bookinstance_list"]],
+            ["South on loan"],
+        )
+        # The choice is remembered for the following requests.
+        self.client.get(url, {"branch": self.north.pk})
+        response = self.client.get(url)
+        self.assertEqual(
+            [copy.imprint for copy in response.context["bookinstance_list"]],
+            ["North on loan"],
+        )
+        self.client.get(url, {"branch": ""})
+        response = self.client.get(url)
+        self.assertIsNone(response.context["current_branch"])
+        self.assertEqual(len(response.context["bookinstance_list"]), 2)
@@ -1,14 +1,25 @@
 from django.urls import path
 
-from . import views
+from . import api, changefeed, views
+from .pagecache import cache_anonymous_page
 
 
 urlpatterns = [
     path("", views.index, name="index"),
-    path("books/", views.BookListView.as_view(), name="books"),
-    path("book/<int:pk>/", views.BookDetailView.as_view(), name="book-detail"),
-    path("authors/", views.AuthorListView.as_view(), name="authors"),
-    path("author/<int:pk>/", views.AuthorDetailView.as_view(), name="author-detail"),
+    path("books/", cache_anonymous_page(views.BookListView.as_view()), name="books"),
+    path(
+        "book/<int:pk>/",
+        cache_anonymous_page(views.BookDetailView.as_view()),
+        name="book-detail",
+    ),
+    path(
+        "authors/", cache_anonymous_page(views.AuthorListView.as_view()), name="authors"
+    ),
+    path(
+        "author/<int:pk>/",
+        cache_anonymous_page(views.AuthorDetailView.as_view()),
+        name="author-detail",
+    ),
     path("mybooks/", views.LoanedBooksByUserListView.as_view(), name="my-borrowed"),
     path(
         "borrowed/", views.LoanedBooksAllListView.as_view(), name="all-borrowed"
@@ -22,4 +33,9 @@ urlpatterns = [
     path("book/create/", views.BookCreate.as_view(), name="book-create"),
     path("book/<int:pk>/update/", views.BookUpdate.as_view(), name="book-update"),
     path("book/<int:pk>/delete/", views.BookDelete.as_view(), name="book-delete"),
+    path("api/availability/", api.availability, name="api-availability"),
+    path("api/suggest/", api.suggestions, name="api-suggest"),
+    path("api/copies/stream/", changefeed.copy_changes, name="api-copy-stream"),
+    path("api/<str:resource>/", api.resource_list, name="api-list"),
+    path("api/<str:resource>/<str:pk>/", api.resource_detail, name="api-detail"),
 ]
@@ -5,35 +5,122 @@ from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.contrib.auth.decorators import login_required, permission_required
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
-from .models import Book, Author, BookInstance, Genre
-from .forms import RenewBookForm
+from django.db import transaction
+from django.core.paginator import Paginator
+from django.db.models import Count, Q
+from .models import Book, Author, BookInstance, ConcurrentUpdateError
+from .forms import BookForm, RenewBookForm
+from . import authors, branches, facets, fines, genres
 import datetime
+import string
 
 
-class BookListView(generic.ListView):
+class AlphabeticalBrowseMixin:
+    """Adds an A-Z "jump to letter" mode to a list view.
+
+    ``?letter=B`` restricts the list to rows whose ``browse_field`` starts with
+    that letter (case-insensitive). The filter is written as a range on
+    ``Lower(browse_field)`` so it is answered by the matching functional index
+    rather than by counting through OFFSET pages.
+    """
+
+    browse_field = None
+    letters = string.ascii_uppercase
+
+    def get_letter(self):
+        letter = self.request.GET.get("letter", "").upper()
+        return letter if len(letter) == 1 and letter in self.letters else ""
+
+    def get_queryset(self):
+        return facets.filter_letter(
+            super().get_queryset(), self.browse_field, self.get_letter()
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["letters"] = self.letters
+        context["current_letter"] = self.get_letter()
+        return context
+
+
+class BookListView(AlphabeticalBrowseMixin, generic.ListView):
     """Generic class-based view for a list of books."""
 
     model = Book
     paginate_by = 10
+    browse_field = "title"
 
+    def get_queryset(self):
+        self.selected_facets = facets.get_selected_facets(self.request.GET)
+        queryset = super().get_queryset().select_related("author")
+        return facets.filter_books(queryset, self.selected_facets)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["facets"] = facets.get_facet_counts(
+            self.selected_facets, self.get_letter()
+        )
+        context["selected_facets"] = self.selected_facets
+        return context
 
-class BookDetailView(generic.DetailView):
+
+class BookDetailView(branches.BranchScopedMixin, generic.DetailView):
     """Generic class-based detail view for a book."""
 
     model = Book
 
-
-class AuthorListView(generic.ListView):
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["copies"] = branches.scope(
+            self.object.bookinstance_set.select_related("branch"), self.branch
+        )
+        # Precomputed by the build_recommendations command. Ordered by rank
+        # alone, as the default ordering by book would join Book again.
+        context["recommendations"] = self.object.recommendations.select_related(
+            "recommended"
+        ).order_by("rank")
+        # Kept up to date by the genre signal handlers.
+        context["similar_books"] = self.object.similar.select_related(
+            "similar"
+        ).order_by("rank")
+        return context
+
+
+class AuthorListView(AlphabeticalBrowseMixin, generic.ListView):
     """Generic class-based view for a list of authors."""
 
     model = Author
     paginate_by = 10
+    browse_field = "last_name"
 
 
 class AuthorDetailView(generic.DetailView):
-    """Generic class-based detail view for an author."""
+    """Generic class-based detail view for an author, with a paginated
+    bibliography and the author's totals."""
 
     model = Author
+    books_per_page = 20
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Copy counts for the whole page come from one grouped query.
+        books = self.object.book_set.annotate(
+            num_copies=Count("bookinstance"),
+            num_available=Count(
+                "bookinstance", filter=Q(bookinstance__status__exact="a")
+            ),
+        ).order_by("title", "pk")
+        paginator = Paginator(books, self.books_per_page)
+        page = paginator.get_page(self.request.GET.get("page"))
+        context.update(
+            {
+                "book_list": page.object_list,
+                "page_obj": page,
+                "is_paginated": page.has_other_pages(),
+                "stats": authors.get_stats(self.object),
+            }
+        )
+        return context
 
 
 def index(request):
@@ -41,12 +128,18 @@ def index(request):
     # Generate counts of some of the main objects
 
     num_books = Book.objects.count()  # The 'all()' is implied by default.
-    num_instances = BookInstance.objects.count()
+    # Copies are counted in the selected branch only.
+    branch = branches.get_current_branch(request)
+    copies = branches.scope(BookInstance.objects.all(), branch)
+    num_instances = copies.count()
     # Available copies of books
-    num_instances_available = BookInstance.objects.filter(status__exact="a").count()
+    num_instances_available = copies.filter(status__exact="a").count()
     num_authors = Author.objects.count()
+    # Fiction and all of its subgenres, through the genre tree.
+    fiction = genres.find_root("Fiction")
+    num_fiction_genres = len(genres.subtree_ids(fiction)) if fiction else 0
+    num_fiction_books = genres.books_in(fiction).count() if fiction else 0
     # Homework
-    num_genres_with_contain = Genre.objects.filter(name__icontains="fiction").count()
     num_books_with_contain = Book.objects.filter(title__icontains="the").count()
 
     # Number of visits to this view, as counted in the session variable.
@@ -62,9 +155,11 @@ def index(request):
             "num_instances": num_instances,
             "num_instances_available": num_instances_available,
             "num_authors": num_authors,
-            "num_genres_with_contain": num_genres_with_contain,
+            "num_fiction_genres": num_fiction_genres,
+            "num_fiction_books": num_fiction_books,
             "num_books_with_contain": num_books_with_contain,
             "num_visits": num_visits,
+            **branches.branch_context(branch),
         },
     )
 
@@ -83,8 +178,15 @@ class LoanedBooksByUserListView(LoginRequiredMixin, generic.ListView):
             .order_by("due_back")
         )
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["fine_balance"] = fines.balance_for(self.request.user)
+        return context
 
-class LoanedBooksAllListView(PermissionRequiredMixin, generic.ListView):
+
+class LoanedBooksAllListView(
+    PermissionRequiredMixin, branches.BranchScopedMixin, generic.ListView
+):
     """Generic class-based view listing all books on loan. Only visible to users with can_mark_returned permission."""
 
     model = BookInstance
@@ -93,7 +195,9 @@ class LoanedBooksAllListView(PermissionRequiredMixin, generic.ListView):
     paginate_by = 10
 
     def get_queryset(self):
-        return BookInstance.objects.filter(status__exact="o").order_by("due_back")
+        return branches.scope(
+            BookInstance.objects.filter(status__exact="o"), self.branch
+        ).order_by("due_back")
 
 
 @login_required
@@ -110,17 +214,36 @@ def renew_book_librarian(request, pk):
         # Check if the form is valid:
         if form.is_valid():
             # process the data in form.cleaned_data as required (here we just write it to the model due_back field)
+            if form.cleaned_data["version"] is not None:
+                book_instance.version = form.cleaned_data["version"]
             book_instance.due_back = form.cleaned_data["renewal_date"]
-            book_instance.save()
-
-            # redirect to a new URL:
-            return HttpResponseRedirect(reverse("all-borrowed"))
+            try:
+                with transaction.atomic():
+                    book_instance.save()
+            except ConcurrentUpdateError:
+                # Show the current copy, and accept a resubmission over it.
+                book_instance.refresh_from_db()
+                data = request.POST.copy()
+                data["version"] = book_instance.version
+                form = RenewBookForm(data)
+                form.is_valid()
+                form.add_error(
+                    None,
+                    "This copy was changed by someone else while you were"
+                    " renewing it. Check the due date and submit again.",
+                )
+            else:
+                # redirect to a new URL:
+                return HttpResponseRedirect(reverse("all-borrowed"))
 
     # If this is a GET (or any other method) create the default form.
     else:
         proposed_renewal_date = datetime.date.today() + datetime.timedelta(weeks=3)
         form = RenewBookForm(
-            initial={"due_back": proposed_renewal_date}
+            initial={
+                "due_back": proposed_renewal_date,
+                "version": book_instance.version,
+            }
         )  # swap renewal_date to due_back if you use ModelForm
 
     context = {
@@ -153,13 +276,13 @@ class AuthorDelete(PermissionRequiredMixin, DeleteView):
 # Classes created for the forms challenge
 class BookCreate(PermissionRequiredMixin, CreateView):
     model = Book
-    fields = ["title", "author", "summary", "isbn", "genre", "language"]
+    form_class = BookForm
     permission_required = "catalog.can_mark_returned"
 
 
 class BookUpdate(PermissionRequiredMixin, UpdateView):
     model = Book
-    fields = ["title", "author", "summary", "isbn", "genre", "language"]
+    form_class = BookForm
     permission_required = "catalog.can_mark_returned"
 
 
@@ -0,0 +1,117 @@
+"""Gunicorn configuration for locallibrary.
+
+Gunicorn reads this file automatically when started from the project root
+(see Procfile). Everything can be tuned from the environment:
+
+- GUNICORN_WORKER_CLASS: ``sync``, ``gthread`` (default) or ``uvicorn``.
+  ``uvicorn`` serves the ASGI application and needs ``pip install uvicorn``.
+- WEB_CONCURRENCY: number of worker processes. Defaults from the CPU count:
+  ``2 * CPUs + 1`` for sync workers, ``CPUs + 1`` for the others.
+- GUNICORN_THREADS: threads per gthread worker (default 4).
+- GUNICORN_TIMEOUT: seconds before a silent worker is restarted (default 30).
+- GUNICORN_MAX_REQUESTS / GUNICORN_MAX_REQUESTS_JITTER: recycle each worker
+  after roughly this many requests to bound memory growth (default 1000/100).
+- GUNICORN_PRELOAD: load the application in the master before forking
+  (default on), so workers start warm and share memory copy-on-write.
+- GUNICORN_ACCESS_LOG: access log file, ``-`` (default) for stdout or empty
+  to disable it.
+- GUNICORN_STATS_INTERVAL: log per-worker request stats every N requests
+  (default 1000; 0 only logs them when the worker exits).
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+
+WORKER_CLASSES = {
+    "sync": "sync",
+    "gthread": "gthread",
+    "uvicorn": "uvicorn.workers.UvicornWorker",
+}
+
+worker_mode = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+if worker_mode not in WORKER_CLASSES:
+    raise RuntimeError(
+        f"GUNICORN_WORKER_CLASS must be one of {', '.join(WORKER_CLASSES)}"
+    )
+worker_class = WORKER_CLASSES[worker_mode]
+if worker_mode == "uvicorn":
+    wsgi_app = "locallibrary.asgi:application"
+else:
+    wsgi_app = "locallibrary.wsgi:application"
+
+cpu_count = multiprocessing.cpu_count()
+default_workers = 2 * cpu_count + 1 if worker_mode == "sync" else cpu_count + 1
+workers = int(os.environ.get("WEB_CONCURRENCY", default_workers))
+threads = int(os.environ.get("GUNICORN_THREADS", 4 if worker_mode == "gthread" else 1))
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = timeout
+keepalive = 5
+
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "True") != "False"
+
+# Access log destination; "-" is stdout and an empty value disables it.
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-") or None
+
+stats_interval = int(os.environ.get("GUNICORN_STATS_INTERVAL", 1000))
+
+# Per-worker request statistics. Each worker process gets its own copy after
+# the fork. (The uvicorn worker does not call the request hooks.)
+_stats = {"requests": 0, "errors": 0, "total_time": 0.0, "max_time": 0.0}
+
+
+def when_ready(server):
+    server.log.info(
+        "Starting %d %s worker(s) with %d thread(s), preload=%s",
+        workers,
+        worker_mode,
+        threads,
+        preload_app,
+    )
+
+
+def post_fork(server, worker):
+    _stats.update(requests=0, errors=0, total_time=0.0, max_time=0.0)
+    # With preload_app, the master recorded metrics while warming up; each
+    # worker would otherwise report them again.
+    metrics = sys.modules.get("catalog.metrics")
+    if metrics is not None:
+        metrics.reset()
+
+
+def pre_request(worker, req):
+    req.start_time = time.monotonic()
+
+
+def post_request(worker, req, environ, resp):
+    elapsed = time.monotonic() - getattr(req, "start_time", time.monotonic())
+    _stats["requests"] += 1
+    _stats["total_time"] += elapsed
+    _stats["max_time"] = max(_stats["max_time"], elapsed)
+    if resp.status_code and resp.status_code >= 500:
+        _stats["errors"] += 1
+    if stats_interval and _stats["requests"] % stats_interval == 0:
+        _log_stats(worker)
+
+
+def worker_exit(server, worker):
+    _log_stats(worker)
+
+
+def _log_stats(worker):
+    requests = _stats["requests"]
+    mean = _stats["total_time"] / requests * 1000 if requests else 0.0
+    worker.log.info(
+        "worker %s: %d requests, %d errors, mean %.1f ms, max %.1f ms",
+        worker.pid,
+        requests,
+        _stats["errors"],
+        mean,
+        _stats["max_time"] * 1000,
+    )
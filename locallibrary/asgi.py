@@ -10,7 +10,15 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 import os
 
 from django.core.asgi import get_asgi_application
+from django.urls import get_resolver
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "locallibrary.settings")
 
 application = get_asgi_application()
+
+# Warm up as in wsgi.py: gunicorn's uvicorn workers are preloaded too.
+get_resolver().url_patterns
+
+from catalog import suggest  # noqa: E402
+
+suggest.warm()
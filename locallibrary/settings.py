@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 import os
+import tempfile
 import dj_database_url
 from pathlib import Path
 
@@ -31,10 +32,15 @@ SECRET_KEY = os.environ.get(
 
 # SECURITY WARNING: don't run with debug turned on in production!
 # DEBUG = True
-DEBUG = os.environ.get("DJANGO_DEBUG", "") != False
+# Set DJANGO_DEBUG=False in production. (The value is a string, so it must be
+# compared with "False" rather than the boolean False.)
+DEBUG = os.environ.get("DJANGO_DEBUG", "") != "False"
 
 # Set hosts to allow any app on Railway and the local testing URL
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = os.environ.get(
+    "DJANGO_ALLOWED_HOSTS", ".railway.app,localhost,127.0.0.1"
+).split(",")
+CSRF_TRUSTED_ORIGINS = ["https://*.railway.app"]
 
 
 # Application definition
@@ -50,6 +56,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "catalog.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -58,6 +65,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "catalog.profiling.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "locallibrary.urls"
@@ -78,20 +86,63 @@ TEMPLATES = [
     },
 ]
 
+if not DEBUG:
+    # Production rendering mode: compile each template once per process and
+    # reuse it, instead of re-reading and re-parsing it on every request.
+    TEMPLATES[0]["APP_DIRS"] = False
+    TEMPLATES[0]["OPTIONS"]["loaders"] = [
+        (
+            "django.template.loaders.cached.Loader",
+            [
+                "django.template.loaders.filesystem.Loader",
+                "django.template.loaders.app_directories.Loader",
+            ],
+        ),
+    ]
+
 WSGI_APPLICATION = "locallibrary.wsgi.application"
 
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Without $DATABASE_URL, SQLite is used with the settings in
+# locallibrary/sqlite_backend (WAL, busy timeout, immediate transactions) so
+# that several gunicorn workers can share it. SQLITE_TUNING=False selects the
+# stock backend and SQLITE_PATH another database file.
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "ENGINE": (
+            "locallibrary.sqlite_backend"
+            if os.environ.get("SQLITE_TUNING", "True") != "False"
+            else "django.db.backends.sqlite3"
+        ),
+        "NAME": os.environ.get("SQLITE_PATH", BASE_DIR / "db.sqlite3"),
     }
 }
 
 
+# Authentication backends
+# Permission sets are cached in the shared cache (see catalog/backends.py).
+AUTHENTICATION_BACKENDS = ["catalog.backends.CachedPermissionBackend"]
+
+# Metrics (see catalog/metrics.py). Each process writes its metrics to a file
+# in this directory; /metrics sums them. Prometheus must send the token as
+# "Authorization: Bearer <token>"; without one, /metrics only answers in DEBUG
+# mode (and check --deploy fails).
+CATALOG_METRICS_DIR = os.environ.get(
+    "CATALOG_METRICS_DIR",
+    os.path.join(tempfile.gettempdir(), "locallibrary-metrics"),
+)
+CATALOG_METRICS_TOKEN = os.environ.get("CATALOG_METRICS_TOKEN", "")
+
+# Seconds that a user's permission set is cached for (at most 5 when the
+# cache is process-local, as other workers cannot invalidate it).
+CATALOG_PERMISSION_CACHE_TIMEOUT = int(
+    os.environ.get("CATALOG_PERMISSION_CACHE_TIMEOUT", 3600)
+)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -135,6 +186,56 @@ db_from_env = dj_database_url.config(conn_max_age=500)
 DATABASES["default"].update(db_from_env)
 
 
+# Caching
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Cached data and invalidation stamps must be shared by all gunicorn workers,
+# so production needs $REDIS_URL: ``check --deploy`` fails with the
+# process-local default, which only suits the single-process development
+# server.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+if os.environ.get("REDIS_URL"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["REDIS_URL"],
+    }
+
+# Seconds that facet counts on the book list are cached for.
+CATALOG_FACET_CACHE_TIMEOUT = int(os.environ.get("CATALOG_FACET_CACHE_TIMEOUT", 300))
+
+# Seconds that anonymous book/author pages are cached for (0 disables the
+# full-page cache, which is the default while DEBUG is on).
+CATALOG_PAGE_CACHE_TIMEOUT = int(
+    os.environ.get("CATALOG_PAGE_CACHE_TIMEOUT", 0 if DEBUG else 60)
+)
+
+# Seconds that per-ISBN availability answers from the batch API are cached for.
+CATALOG_AVAILABILITY_CACHE_TIMEOUT = int(
+    os.environ.get("CATALOG_AVAILABILITY_CACHE_TIMEOUT", 30)
+)
+
+# Seconds between checks of whether another process changed the books or
+# authors behind the typeahead index.
+CATALOG_SUGGEST_CHECK_INTERVAL = float(
+    os.environ.get("CATALOG_SUGGEST_CHECK_INTERVAL", 5)
+)
+
+# Kiosk change feed (catalog.changefeed): seconds between polls of the change
+# log, seconds before a stream is closed for the client to reconnect, and
+# hours of change log that prune_change_log keeps. Entries are held back for
+# the settle delay (longer than any transaction writing the log), and WSGI
+# workers, which cannot hold streams open, tell kiosks to reconnect after the
+# WSGI retry delay; run the ASGI app for live updates.
+CATALOG_STREAM_POLL_INTERVAL = float(os.environ.get("CATALOG_STREAM_POLL_INTERVAL", 1))
+CATALOG_STREAM_LIFETIME = float(os.environ.get("CATALOG_STREAM_LIFETIME", 300))
+CATALOG_STREAM_LOG_RETENTION = int(os.environ.get("CATALOG_STREAM_LOG_RETENTION", 24))
+CATALOG_STREAM_SETTLE_DELAY = float(os.environ.get("CATALOG_STREAM_SETTLE_DELAY", 5))
+CATALOG_STREAM_WSGI_RETRY = float(os.environ.get("CATALOG_STREAM_WSGI_RETRY", 15))
+
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/4.0/howto/static-files/
 # The absolute path to the directory where collectstatic will collect static files for deployment.
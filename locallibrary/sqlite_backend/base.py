@@ -0,0 +1,47 @@
+"""SQLite backend tuned for several processes sharing one database file.
+
+Used for the default ``db.sqlite3`` database (see ``DATABASES`` in settings).
+On every new connection it sets:
+
+- ``journal_mode=WAL``: readers no longer block the writer or each other.
+- ``synchronous=NORMAL``: with WAL, commits only sync at checkpoints. A power
+  loss can drop the last transactions but never corrupts the database.
+- ``mmap_size``: reads are served from a memory map instead of read() calls.
+- a busy timeout (``OPTIONS["timeout"]``, 20 seconds by default): a writer
+  waits for the write lock instead of failing with "database is locked".
+
+Transactions opened by ``atomic()`` start with ``BEGIN IMMEDIATE``, taking
+the write lock up front. A deferred transaction that reads and then writes
+fails immediately with "database is locked" when another process wrote in
+between, because the busy timeout cannot help a read lock upgrade.
+
+``OPTIONS["pragmas"]`` overrides or extends the pragmas below.
+"""
+
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+DEFAULT_TIMEOUT = 20
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # Not a sqlite3.connect() argument.
+        self.pragmas = {**PRAGMAS, **params.pop("pragmas", {})}
+        params.setdefault("timeout", DEFAULT_TIMEOUT)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute("BEGIN IMMEDIATE")
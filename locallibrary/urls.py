@@ -20,9 +20,12 @@ from django.views.generic import RedirectView
 from django.conf import settings
 from django.conf.urls.static import static
 
+from catalog.metrics import metrics_view
+
 urlpatterns = [
     path("", RedirectView.as_view(url="/catalog/", permanent=True)),
     path("catalog/", include("catalog.urls")),
     path("accounts/", include("django.contrib.auth.urls")),
     path("admin/", admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
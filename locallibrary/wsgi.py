@@ -10,7 +10,19 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/wsgi/
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "locallibrary.settings")
 
 application = get_wsgi_application()
+
+# Import the URLconf, and with it every view and form module, at load time
+# rather than on the first request. With gunicorn --preload this happens once
+# in the master process and forked workers start warm. (Templates and their tag
+# libraries are still loaded by each worker on first use.)
+get_resolver().url_patterns
+
+# Build the typeahead index too, so preloaded workers share it.
+from catalog import suggest  # noqa: E402
+
+suggest.warm()